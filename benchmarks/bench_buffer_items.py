@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compara la agregación por intervalos original de BufferItems (lista con todos los items del intervalo y media
+al cerrarlo) con los acumuladores por campo. Simula un WIMDA muestreado a rate Hz, agregado en intervalos de
+interval segundos, y mide el tiempo por muestra y el pico de memoria.
+
+    python benchmarks/bench_buffer_items.py --rate 10 --interval 300 --intervals 4
+"""
+
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from buoy.base.data.item import BufferItems
+from buoy.base.data.nmea0183 import WIMDA
+
+
+class LegacyBufferItems(BufferItems):
+    """ Implementación original: guarda todos los items y omite los valores que evalúan a falso """
+
+    def __init__(self, **kwargs):
+        super(LegacyBufferItems, self).__init__(**kwargs)
+        self.items = []
+        self.cls = None
+        self.fields = None
+
+    def append(self, other):
+        item = None
+        if self.inside_interval(other.date):
+            if len(self.items) == 0:
+                if self.fields is None:
+                    self.cls = type(other)
+                    self.fields = self.extract_fieldname_parameters(other)
+                self.set_limits(other.date)
+            self.items.append(other)
+        else:
+            item = self.process_buffer()
+            self.items.clear()
+            super(LegacyBufferItems, self).clear()
+            self.append(other)
+        return item
+
+    def process_buffer(self):
+        item_attr = {"date": self.limits()[1]}
+        for key in self.fields:
+            attr = [getattr(o, key) for o in self.items if getattr(o, key)]
+            item_attr[key] = sum(attr) / len(attr) if len(attr) > 0 else None
+        return self.cls(**item_attr)
+
+
+def get_items(rate, interval, intervals):
+    """ Genera las muestras según se piden, como las leería el dispositivo. Sin ceros, que el original omite """
+    start = datetime(2019, 1, 1, 0, 0, 0, 1000, tzinfo=timezone.utc)
+    step = timedelta(seconds=1 / rate)
+    num = int(rate * interval * intervals) + 1
+    for idx in range(0, num):
+        yield WIMDA(date=start + idx * step, press_inch="30.%i" % (idx % 10,), press_mbar="1019.3",
+                    air_temp="12.%i" % (idx % 7,), water_temp="15.1", rel_humidity="80", dew_point="8.5",
+                    wind_dir_true=str(idx % 360 + 1), wind_dir_magnetic=str(idx % 360 + 1), wind_knots="12.4",
+                    wind_meters="6.4")
+
+
+def bench_time(buffer, items):
+    start = time.perf_counter()
+    output = [item for item in map(buffer.append, items) if item is not None]
+    return time.perf_counter() - start, output
+
+
+def bench_memory(buffer, items):
+    """ Pico de memoria con las muestras generadas según llegan: sólo quedan vivas las que guarde el buffer """
+    tracemalloc.start()
+    for item in items:
+        buffer.append(item)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def values(items):
+    """ Valores de los campos que ambas implementaciones agregan con la media """
+    return [[getattr(item, field.name) for field in item._fields
+             if field.name != "uuid" and field.aggregation == "mean"] for item in items]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=10)
+    parser.add_argument("--interval", type=int, default=300)
+    parser.add_argument("--intervals", type=int, default=4)
+    args = parser.parse_args()
+
+    items = list(get_items(args.rate, args.interval, args.intervals))
+    print("%d samples, %d per interval" % (len(items), args.rate * args.interval))
+    print("%12s %16s %16s" % ("", "us/sample", "peak (KiB)"))
+    results = []
+    for name, cls in [("original", LegacyBufferItems), ("streaming", BufferItems)]:
+        elapsed, output = bench_time(cls(interval=args.interval), items)
+        peak = bench_memory(cls(interval=args.interval), get_items(args.rate, args.interval, args.intervals))
+        results.append(output)
+        print("%12s %16.2f %16.1f" % (name, elapsed / len(items) * 1e6, peak / 1024))
+
+    assert values(results[0]) == values(results[1])
+
+
+if __name__ == '__main__':
+    main()
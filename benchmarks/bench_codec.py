@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tamaño medio del mensaje y tiempo de codificación de elementos WIMDA con cada formato de mensaje
+registrado (json, msgpack, cbor y struct). Los formatos cuyo paquete no está instalado se omiten. Con
+--batch mayor que 1 los items se codifican en lotes, como en el modo por lotes de MqttThread.
+
+    python benchmarks/bench_codec.py --num 50000 --batch 50
+"""
+
+import argparse
+import time
+
+from buoy.base.data.codec import CODECS
+from buoy.base.data.nmea0183 import WIMDA
+
+
+def get_items(num):
+    return [WIMDA(press_inch="30.%i" % (idx % 10,), press_mbar="1019.3", air_temp="12.34567", water_temp="15.1",
+                  rel_humidity="80", dew_point="8.5", wind_dir_true="270", wind_dir_magnetic="268",
+                  wind_knots="12.4", wind_meters="6.4") for idx in range(0, num)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=1)
+    args = parser.parse_args()
+
+    items = get_items(args.num)
+    print("%10s %14s %12s %12s" % ("format", "bytes/item", "vs json", "us/item"))
+    json_size = None
+    for name, codec in CODECS.items():
+        if not codec.is_available():
+            print("%10s %14s" % (name, "not installed"))
+            continue
+        start = time.perf_counter()
+        if args.batch > 1:
+            payloads = [codec.encode_many(items[idx:idx + args.batch]) for idx in range(0, args.num, args.batch)]
+        else:
+            payloads = [codec.encode(item) for item in items]
+        elapsed = time.perf_counter() - start
+        size = sum(len(payload) for payload in payloads) / args.num
+        json_size = json_size or size
+        print("%10s %14.1f %11.0f%% %12.2f" % (name, size, size / json_size * 100, elapsed / args.num * 1e6))
+
+
+if __name__ == '__main__':
+    main()
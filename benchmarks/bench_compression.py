@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tamaño medio por item de un flujo de elementos WIMDA con cada formato de mensaje, sin comprimir y
+comprimido con zlib y zstd (diccionario con los nombres de los campos), publicando item a item o en
+lotes. El flujo se lee de un fichero con un JSON por línea (--input) o se genera con valores que varían
+poco a poco, como los de una estación meteorológica.
+
+    python benchmarks/bench_compression.py --num 10000 --batches 1 10 50
+    python benchmarks/bench_compression.py --input wimda.jsonl
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+from buoy.base.data.codec import CODECS, COMPRESSORS, compress
+from buoy.base.data.nmea0183 import WIMDA
+
+
+def read_items(path):
+    with open(path, 'r') as fh:
+        return [WIMDA(**json.loads(line)) for line in fh if line.strip()]
+
+
+def generate_items(num):
+    random.seed(0)
+    date = datetime(2019, 4, 5, tzinfo=timezone.utc)
+    values = {"press_mbar": 1019.3, "air_temp": 18.2, "water_temp": 19.1, "rel_humidity": 80.0, "dew_point": 14.6,
+              "wind_dir_true": 270.0, "wind_knots": 12.4}
+    items = []
+    for _ in range(0, num):
+        for key in values:
+            values[key] += random.gauss(0, 0.2)
+        values["wind_dir_true"] %= 360
+        items.append(WIMDA(date=date, press_inch=Decimal(values["press_mbar"] * 0.02953).quantize(Decimal("0.01")),
+                           press_mbar=Decimal(values["press_mbar"]).quantize(Decimal("0.1")),
+                           air_temp=Decimal(values["air_temp"]).quantize(Decimal("0.1")),
+                           water_temp=Decimal(values["water_temp"]).quantize(Decimal("0.1")),
+                           rel_humidity=Decimal(values["rel_humidity"]).quantize(Decimal("0.1")),
+                           dew_point=Decimal(values["dew_point"]).quantize(Decimal("0.1")),
+                           wind_dir_true=Decimal(values["wind_dir_true"]).quantize(Decimal("0.1")),
+                           wind_dir_magnetic=Decimal((values["wind_dir_true"] + 4) % 360).quantize(Decimal("0.1")),
+                           wind_knots=Decimal(values["wind_knots"]).quantize(Decimal("0.1")),
+                           wind_meters=Decimal(values["wind_knots"] * 0.5144).quantize(Decimal("0.1"))))
+        date += timedelta(seconds=1)
+
+    return items
+
+
+def payloads(codec, items, batch):
+    if batch > 1:
+        return [codec.encode_many(items[idx:idx + batch]) for idx in range(0, len(items), batch)]
+    return [codec.encode(item) for item in items]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=10000)
+    parser.add_argument("--input", default=None)
+    parser.add_argument("--batches", type=int, nargs="+", default=[1, 10, 50])
+    args = parser.parse_args()
+
+    items = read_items(args.input) if args.input else generate_items(args.num)
+    compressors = [compressor for compressor in COMPRESSORS.values() if compressor.is_available()]
+
+    print("%8s %10s %10s" % ("batch", "format", "raw") + "".join(["%10s" % (c.name,) for c in compressors]))
+    for batch in args.batches:
+        for name, codec in CODECS.items():
+            if not codec.is_available():
+                continue
+            raw = payloads(codec, items, batch)
+            sizes = [sum(len(payload) for payload in raw)]
+            for compressor in compressors:
+                sizes.append(sum(len(compress(payload, WIMDA, compressor)) for payload in raw))
+            print("%8i %10s" % (batch, name) + "".join(["%10.1f" % (size / len(items),) for size in sizes]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tiempo de la consulta de registros pendientes de enviar en una tabla con un millón de registros según crece
+el número de pendientes. Compara la consulta original (sin índice, siempre desde el registro más antiguo)
+con DeviceDB.get_items_to_send (índice parcial y paginación por (date, uuid)).
+
+    python benchmarks/bench_db_backlog.py --rows 1000000 --backlogs 1000 10000 100000 1000000
+"""
+
+import argparse
+import time
+
+import psycopg2
+import testing.postgresql
+
+from buoy.base.database import DeviceDB
+from buoy.tests.item import Item
+
+SETUP_SQL = "tests/support/data/setup.sql"
+
+FILL_SQL = """INSERT INTO device (date, value, sent, num_attempts)
+              SELECT now() - (%(rows)s - i + 1000) * interval '1 second', random() * 30,
+                     i <= %(rows)s - %(backlog)s, CASE WHEN i %% 1000 = 0 THEN 3 ELSE 0 END
+              FROM generate_series(1, %(rows)s) AS i"""
+
+OLD_SELECT_SQL = """SELECT * FROM device WHERE sent IS false AND num_attempts < 3
+                    AND date < now() - 900 * interval '1 second' ORDER BY date LIMIT 100"""
+
+
+def fill_table(db_conf, rows, backlog):
+    connection = psycopg2.connect(**db_conf)
+    with connection.cursor() as cur:
+        with open(SETUP_SQL, 'r') as fh:
+            cur.execute(fh.read())
+        cur.execute(FILL_SQL, {"rows": rows, "backlog": backlog})
+    connection.commit()
+    connection.autocommit = True
+    with connection.cursor() as cur:
+        cur.execute("VACUUM ANALYZE device")
+    connection.close()
+
+
+def bench_old(db_conf, repeat):
+    connection = psycopg2.connect(**db_conf)
+    start = time.perf_counter()
+    with connection.cursor() as cur:
+        for _ in range(0, repeat):
+            cur.execute(OLD_SELECT_SQL)
+            cur.fetchall()
+    elapsed = time.perf_counter() - start
+    connection.close()
+
+    return elapsed / repeat * 1000
+
+
+def bench_new(db_conf, repeat):
+    dev_db = DeviceDB(db_config=db_conf, db_tablename="device", cls_item=Item)
+    with dev_db.get_cursor() as cur:
+        cur.execute("ANALYZE device")
+    start = time.perf_counter()
+    for _ in range(0, repeat):
+        dev_db.get_items_to_send()
+    elapsed = time.perf_counter() - start
+    dev_db.close()
+
+    return elapsed / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--backlogs", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with testing.postgresql.Postgresql() as postgresql:
+        db_conf = postgresql.dsn()
+        print("%10s %16s %16s" % ("backlog", "original (ms)", "keyset (ms)"))
+        for backlog in args.backlogs:
+            fill_table(db_conf, args.rows, backlog)
+            old = bench_old(db_conf, args.repeat)
+            new = bench_new(db_conf, args.repeat)
+            print("%10i %16.2f %16.2f" % (backlog, old, new))
+
+
+if __name__ == '__main__':
+    main()
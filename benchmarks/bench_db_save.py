@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compara la inserción registro a registro (DeviceDB.save) con la inserción por lotes (DeviceDB.save_many)
+y la carga masiva con COPY (DeviceDB.bulk_load) sobre una base de datos PostgreSQL temporal.
+
+    python benchmarks/bench_db_save.py --sizes 1000 10000 100000 --batch 500
+"""
+
+import argparse
+import time
+
+import psycopg2
+import testing.postgresql
+
+from buoy.base.database import DeviceDB
+from buoy.tests.item import get_items
+
+SETUP_SQL = "tests/support/data/setup.sql"
+
+
+def reset_table(db_conf):
+    connection = psycopg2.connect(**db_conf)
+    with connection.cursor() as cur:
+        with open(SETUP_SQL, 'r') as fh:
+            cur.execute(fh.read())
+    connection.commit()
+    connection.close()
+
+
+def bench_save(dev_db, items):
+    start = time.perf_counter()
+    for item in items:
+        dev_db.save(item)
+    return time.perf_counter() - start
+
+
+def bench_save_many(dev_db, items, batch):
+    start = time.perf_counter()
+    for idx in range(0, len(items), batch):
+        dev_db.save_many(items[idx:idx + batch])
+    return time.perf_counter() - start
+
+
+def bench_bulk_load(dev_db, items):
+    start = time.perf_counter()
+    dev_db.bulk_load(items)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+
+    with testing.postgresql.Postgresql() as postgresql:
+        db_conf = postgresql.dsn()
+        print("%10s %12s %14s %14s" % ("rows", "save (s)", "save_many (s)", "bulk_load (s)"))
+        for size in args.sizes:
+            reset_table(db_conf)
+            dev_db = DeviceDB(db_config=db_conf, db_tablename="device", cls_item=None)
+            t_save = bench_save(dev_db, get_items(size))
+            dev_db.close()
+
+            reset_table(db_conf)
+            dev_db = DeviceDB(db_config=db_conf, db_tablename="device", cls_item=None)
+            t_save_many = bench_save_many(dev_db, get_items(size), args.batch)
+            dev_db.close()
+
+            reset_table(db_conf)
+            dev_db = DeviceDB(db_config=db_conf, db_tablename="device", cls_item=None)
+            t_bulk_load = bench_bulk_load(dev_db, get_items(size))
+            dev_db.close()
+
+            print("%10i %12.3f %14.3f %14.3f" % (size, t_save, t_save_many, t_bulk_load))
+
+
+if __name__ == '__main__':
+    main()
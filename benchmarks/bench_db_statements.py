@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+"""
+Latencia media por sentencia de DeviceDB con y sin sentencias preparadas en el servidor
+sobre una base de datos PostgreSQL temporal.
+
+    python benchmarks/bench_db_statements.py --repeat 2000
+"""
+
+import argparse
+import time
+
+import psycopg2
+import testing.postgresql
+
+from buoy.base.database import DeviceDB
+from buoy.tests.item import Item, get_items
+
+SETUP_SQL = "tests/support/data/setup.sql"
+DATA_SQL = "tests/support/data/data_example.sql"
+
+
+def reset_table(db_conf):
+    connection = psycopg2.connect(**db_conf)
+    with connection.cursor() as cur:
+        for sql_file in [SETUP_SQL, DATA_SQL]:
+            with open(sql_file, 'r') as fh:
+                cur.execute(fh.read())
+    connection.commit()
+    connection.close()
+
+
+def timeit(func, args_list):
+    start = time.perf_counter()
+    for args in args_list:
+        func(*args)
+    return (time.perf_counter() - start) / len(args_list) * 1e6
+
+
+def bench(db_conf, prepare, repeat):
+    reset_table(db_conf)
+    dev_db = DeviceDB(db_config=db_conf, db_tablename="device", cls_item=Item, prepare=prepare)
+    items = get_items(repeat)
+    uuids = [[item.uuid] for item in items]
+
+    results = {
+        "save": timeit(dev_db.save, [(item,) for item in items]),
+        "get": timeit(dev_db.get, [(uuid,) for uuid in uuids]),
+        "update_status": timeit(dev_db.update_status, [(uuid,) for uuid in uuids]),
+        "get_items_to_send": timeit(dev_db.get_items_to_send, [()] * repeat)
+    }
+    dev_db.close()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with testing.postgresql.Postgresql() as postgresql:
+        db_conf = postgresql.dsn()
+        before = bench(db_conf, False, args.repeat)
+        after = bench(db_conf, True, args.repeat)
+
+    print("%20s %14s %14s" % ("statement", "mogrify (us)", "prepared (us)"))
+    for name in before:
+        print("%20s %14.1f %14.1f" % (name, before[name], after[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compara la serialización de elementos WIMDA con json.dumps y DataEncoder frente al serializador precompilado
+por clase que usa BaseItem.to_json. Ambas salidas tienen que ser idénticas.
+
+    python benchmarks/bench_item_json.py --num 100000
+"""
+
+import argparse
+import json
+import time
+
+from buoy.base.data.item import DataEncoder
+from buoy.base.data.nmea0183 import WIMDA
+
+
+def get_items(num):
+    return [WIMDA(press_inch="30.%i" % (idx % 10,), press_mbar="1019.3", air_temp="12.34567", water_temp="15.1",
+                  rel_humidity="80", dew_point="8.5", wind_dir_true="270", wind_dir_magnetic="268",
+                  wind_knots="12.4", wind_meters="6.4") for idx in range(0, num)]
+
+
+def encoder_dumps(item):
+    return json.dumps(item, cls=DataEncoder, sort_keys=True, separators=(',', ':'))
+
+
+def bench(function, items, repeat):
+    """ Retorna el mejor tiempo de repeat ejecuciones y la salida """
+    best = None
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        output = [function(item) for item in items]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    items = get_items(args.num)
+    t_encoder, out_encoder = bench(encoder_dumps, items, args.repeat)
+    t_compiled, out_compiled = bench(WIMDA.to_json, items, args.repeat)
+
+    assert out_encoder == out_compiled, "Serializers output differ"
+    print("%14s %12s %12s" % ("serializer", "total (s)", "us/item"))
+    print("%14s %12.3f %12.2f" % ("DataEncoder", t_encoder, t_encoder / args.num * 1e6))
+    print("%14s %12.3f %12.2f" % ("compiled", t_compiled, t_compiled / args.num * 1e6))
+
+
+if __name__ == '__main__':
+    main()
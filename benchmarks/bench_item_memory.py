@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+"""
+Memoria ocupada por N elementos WIMDA declarados con Field (slots) frente a la misma clase declarada con
+propiedades sobre una copia del BaseItem original, que guarda los valores en el __dict__ de cada instancia. Con --empty los campos valen None y
+solo se mide el contenedor de cada elemento.
+
+    python benchmarks/bench_item_memory.py --num 100000
+"""
+
+import argparse
+import logging
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from uuid import uuid4
+
+from dateutil import parser as date_parser
+
+from buoy.base.data.nmea0183 import WIMDA
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ['press_inch', 'press_mbar', 'air_temp', 'water_temp', 'rel_humidity', 'abs_humidity', 'dew_point',
+          'wind_dir_true', 'wind_dir_magnetic', 'wind_knots', 'wind_meters']
+
+
+class LegacyBaseItem(object):
+    """ Copia de BaseItem antes de declarar los campos con Field: sin metaclase ni slots, cada valor se
+    guarda en el __dict__ de la instancia a través de una propiedad """
+
+    def __init__(self, **kwargs):
+        self.uuid = kwargs.pop('uuid', uuid4())
+        self.date = kwargs.pop('date', datetime.now(tz=timezone.utc))
+
+    @property
+    def uuid(self):
+        return self._uuid
+
+    @uuid.setter
+    def uuid(self, value):
+        self._uuid = value
+
+    @property
+    def date(self):
+        return self._date
+
+    @date.setter
+    def date(self, value):
+        if type(value) is int:
+            value = datetime.fromtimestamp(value / 1000.0)
+        elif type(value) is str:
+            value = date_parser.parse(value)
+
+        self._date = value
+
+    @staticmethod
+    def _convert_string_to_decimal(value):
+        val = None
+        if value is not None:
+            try:
+                val = Decimal(value)
+            except InvalidOperation:
+                logger.error("Convert string to decimal", value)
+
+        return val
+
+
+def legacy_property(name):
+    attr = '_' + name
+
+    def getter(self):
+        return getattr(self, attr)
+
+    def setter(self, value):
+        setattr(self, attr, self._convert_string_to_decimal(value))
+
+    return property(getter, setter)
+
+
+def legacy_init(self, **kwargs):
+    for name in FIELDS:
+        setattr(self, name, kwargs.pop(name, None))
+    LegacyBaseItem.__init__(self, **kwargs)
+
+
+LegacyWIMDA = type('LegacyWIMDA', (LegacyBaseItem,), dict(
+    [('__init__', legacy_init)] + [(field_name, legacy_property(field_name)) for field_name in FIELDS]))
+
+
+def measure(cls, num, empty=False):
+    values = {name: None if empty else "%i.%i" % (idx, idx) for idx, name in enumerate(FIELDS)}
+    tracemalloc.start()
+    start = time.perf_counter()
+    items = [cls(**values) for _ in range(0, num)]
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del items
+
+    return current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=100000)
+    parser.add_argument("--empty", action="store_true")
+    args = parser.parse_args()
+
+    print("%12s %14s %14s %12s" % ("class", "memory (MiB)", "bytes/item", "build (s)"))
+    for cls in [LegacyWIMDA, WIMDA]:
+        memory, elapsed = measure(cls, args.num, args.empty)
+        print("%12s %14.1f %14.0f %12.3f" % (cls.__name__, memory / 2 ** 20, memory / args.num, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mensajes por segundo y latencia desde que un item entra en la cola de envío hasta que se publica, con
+MqttThread ejecutándose en su hilo y un cliente MQTT falso que confirma cada mensaje tras --ack-delay
+milisegundos, como haría un broker con QoS 1. La latencia se mide con la cola vacía, desde que se encola
+un item hasta que se confirma (mediana de 50).
+
+    python benchmarks/bench_mqtt_throughput.py --num 20000 --max-inflight 100
+"""
+
+import argparse
+import time
+from queue import Queue
+from threading import Timer
+
+from buoy.base.device.threads.mqtt import MqttThread
+from buoy.tests.item import get_items
+
+
+class FakeClient(object):
+    def __init__(self, thread, ack_delay):
+        self.thread = thread
+        self.ack_delay = ack_delay
+
+    def publish(self, topic, payload=None, qos=0, retain=False, mid=None):
+        if self.ack_delay:
+            Timer(self.ack_delay, self.thread.on_publish, args=(self, None, mid)).start()
+        else:
+            self.thread.on_publish(self, None, mid)
+
+    def disconnect(self):
+        pass
+
+
+class BenchMqttThread(MqttThread):
+    def before_activity(self):
+        pass
+
+    def is_connected_to_mqtt(self):
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num", type=int, default=20000)
+    parser.add_argument("--max-inflight", type=int, default=100)
+    parser.add_argument("--ack-delay", type=float, default=0, help="milliseconds")
+    parser.add_argument("--batch", type=int, default=1)
+    args = parser.parse_args()
+
+    queue_send_data, queue_data_sent = Queue(), Queue()
+    thread = BenchMqttThread(queue_send_data=queue_send_data, queue_data_sent=queue_data_sent,
+                             queue_notice=Queue(), max_inflight=args.max_inflight, batch_size=args.batch,
+                             max_latency=10)
+    thread.client = FakeClient(thread, args.ack_delay / 1000)
+    thread.start()
+
+    items = get_items(args.num)
+    start = time.perf_counter()
+    for item in items:
+        queue_send_data.put(item)
+    for _ in items:
+        queue_data_sent.get()
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    for item in get_items(50):
+        time.sleep(0.01)
+        sent = time.perf_counter()
+        queue_send_data.put(item)
+        queue_data_sent.get()
+        latencies.append(time.perf_counter() - sent)
+    thread.active = False
+    thread.join()
+
+    print("%10s %14s %14s %18s" % ("items", "msg/s", "elapsed (s)", "idle latency (ms)"))
+    print("%10i %14.0f %14.3f %18.2f" % (args.num, args.num / elapsed, elapsed,
+                                         sorted(latencies)[len(latencies) // 2] * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Compara la separación en líneas original de DeviceReader (cadena acumulada con +=, rsplit y split) con
+LineFramer, alimentando ambos con lecturas del tamaño dado de un flujo de sentencias NMEA. Con lecturas
+pequeñas y líneas largas la cadena original se vuelve a examinar entera en cada lectura.
+
+    python benchmarks/bench_reader_framing.py --lines 100000 --chunks 16 64 1024
+    python benchmarks/bench_reader_framing.py --lines 500 --chunks 16 64 --line-size 4000
+"""
+
+import argparse
+import time
+
+from buoy.base.device.threads.reader import LineFramer
+
+SENTENCE = "$WIMDA,30.2269,I,1.0236,B,17.7,C,,,43.3,,5.0,C,131.5,T,132.8,M,0.8,N,0.4,M*2B\r\n"
+
+
+def get_chunks(num_lines, size, line_size):
+    sentence = SENTENCE if not line_size else SENTENCE.strip().ljust(line_size - 2, "0") + "\r\n"
+    data = (sentence * num_lines).encode()
+    return [data[idx:idx + size] for idx in range(0, len(data), size)]
+
+
+def split_original(chunks, splitter="\n"):
+    lines = []
+    buffer = ''
+    for chunk in chunks:
+        buffer += chunk.decode()
+        if splitter not in buffer:
+            continue
+        parts = buffer.rsplit(splitter, 1)
+        buffer = parts[1].strip()
+        lines.extend([l.strip() for l in parts[0].split(splitter) if len(l.strip())])
+    return lines
+
+
+def split_framer(chunks, splitter="\n"):
+    lines = []
+    framer = LineFramer(splitter=splitter.encode())
+    for chunk in chunks:
+        if framer.feed(chunk):
+            lines.extend(framer.lines())
+    return lines
+
+
+def bench(function, chunks, repeat):
+    best = None
+    for _ in range(0, repeat):
+        start = time.perf_counter()
+        output = function(chunks)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, output
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=100000)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[16, 64, 1024])
+    parser.add_argument("--line-size", type=int, default=0, help="Longitud de las líneas, por defecto la de WIMDA")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print("%10s %16s %16s %14s" % ("read (B)", "original (ms)", "framer (ms)", "ns/byte"))
+    for size in args.chunks:
+        chunks = get_chunks(args.lines, size, args.line_size)
+        t_original, original = bench(split_original, chunks, args.repeat)
+        t_framer, framer = bench(split_framer, chunks, args.repeat)
+        assert original == framer
+        total = sum(len(chunk) for chunk in chunks)
+        print("%10i %16.1f %16.1f %14.1f" % (size, t_original * 1000, t_framer * 1000, t_framer / total * 1e9))
+
+
+if __name__ == '__main__':
+    main()
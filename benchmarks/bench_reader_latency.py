@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""
+Mide la latencia entre que el dispositivo escribe una línea y el lector la procesa, y el consumo de CPU con
+el puerto inactivo, leyendo con read_mode 'poll' (in_waiting y espera de timeout_wait) o 'select' (bloqueado
+en el descriptor). El dispositivo es un pseudoterminal en el que se escribe una sentencia cada interval
+segundos.
+
+    python benchmarks/bench_reader_latency.py --lines 50 --interval 0.05 --idle 5
+"""
+
+import argparse
+import os
+import statistics
+import time
+from queue import Queue
+
+from serial import Serial
+
+from buoy.base.device.threads.reader import DeviceReader
+
+SENTENCE = b"$WIMDA,30.2269,I,1.0236,B,17.7,C,,,43.3,,5.0,C,131.5,T,132.8,M,0.8,N,0.4,M*2B\r\n"
+
+
+class TimingReader(DeviceReader):
+    def __init__(self, **kwargs):
+        super(TimingReader, self).__init__(**kwargs)
+        self.received = []
+        self.activities = 0
+
+    def activity(self):
+        self.activities += 1
+        super(TimingReader, self).activity()
+
+    def parser(self, data):
+        self.received.append(time.monotonic())
+
+
+def run(read_mode, timeout_wait, read_timeout, lines, interval, idle):
+    master, slave = os.openpty()
+    serial = Serial(port=os.ttyname(slave), timeout=0)
+    reader = TimingReader(device=serial, queue_notice=Queue(), read_mode=read_mode, timeout_wait=timeout_wait,
+                          read_timeout=read_timeout)
+    reader.active = True
+    reader.start()
+
+    time.sleep(0.2)
+    cpu = time.process_time()
+    activities = reader.activities
+    time.sleep(idle)
+    idle_cpu = (time.process_time() - cpu) / idle * 100
+    idle_wakeups = (reader.activities - activities) / idle
+
+    sent = []
+    for _ in range(0, lines):
+        sent.append(time.monotonic())
+        os.write(master, SENTENCE)
+        time.sleep(interval)
+    time.sleep(timeout_wait * 2)
+
+    reader.stop()
+    reader.join()
+    serial.close()
+    os.close(master)
+    os.close(slave)
+
+    latencies = [(received - start) * 1000 for start, received in zip(sent, reader.received)]
+    return statistics.mean(latencies), max(latencies), idle_cpu, idle_wakeups
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lines", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.05)
+    parser.add_argument("--idle", type=float, default=5)
+    parser.add_argument("--timeout-wait", type=float, default=0.2)
+    parser.add_argument("--read-timeout", type=float, default=1)
+    args = parser.parse_args()
+
+    print("%8s %16s %16s %14s %14s" % ("mode", "mean lat (ms)", "max lat (ms)", "idle CPU (%)", "wakeups/s"))
+    for read_mode in ["poll", "select"]:
+        mean, worst, idle_cpu, wakeups = run(read_mode, args.timeout_wait, args.read_timeout, args.lines, args.interval, args.idle)
+        print("%8s %16.2f %16.2f %14.3f %14.1f" % (read_mode, mean, worst, idle_cpu, wakeups))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import statistics
+from decimal import Decimal
+
+logger = logging.getLogger(__name__)
+
+
+def to_angle(radians) -> Decimal:
+    """ Convierte a grados entre 0 y 360, redondeado a 6 decimales """
+    return Decimal(str(round(math.degrees(radians), 6) % 360))
+
+
+class Accumulator(object):
+    """
+    Agrega en una sola pasada los valores de un campo durante un intervalo. Sólo guarda el estado necesario
+    para el resultado, no los valores (salvo la mediana). Los valores None se ignoran
+    """
+
+    __slots__ = ()
+
+    def add(self, value):
+        raise NotImplementedError
+
+    def result(self):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+
+class Mean(Accumulator):
+    """ Media aritmética. Con Decimal la suma es exacta """
+
+    __slots__ = ('count', 'total')
+
+    def __init__(self):
+        self.count = 0
+        self.total = None
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        self.total = value if self.total is None else self.total + value
+
+    def result(self):
+        return self.total / self.count if self.count else None
+
+    def clear(self):
+        self.count = 0
+        self.total = None
+
+
+class Min(Accumulator):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = None
+
+    def add(self, value):
+        if value is not None and (self.value is None or value < self.value):
+            self.value = value
+
+    def result(self):
+        return self.value
+
+    def clear(self):
+        self.value = None
+
+
+class Max(Min):
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None and (self.value is None or value > self.value):
+            self.value = value
+
+
+class Last(Min):
+    """ Último valor recibido """
+
+    __slots__ = ()
+
+    def add(self, value):
+        if value is not None:
+            self.value = value
+
+
+class Count(Accumulator):
+    """ Número de valores recibidos """
+
+    __slots__ = ('count',)
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, value):
+        if value is not None:
+            self.count += 1
+
+    def result(self):
+        return self.count
+
+    def clear(self):
+        self.count = 0
+
+
+class Std(Accumulator):
+    """ Desviación típica muestral, con el algoritmo de Welford. None con menos de dos valores """
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, value):
+        if value is None:
+            return
+        self.count += 1
+        if self.count == 1:
+            self.mean = value
+            self.m2 = value - value
+            return
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def result(self):
+        if self.count < 2:
+            return None
+        variance = self.m2 / (self.count - 1)
+        return variance.sqrt() if isinstance(variance, Decimal) else math.sqrt(variance)
+
+    def clear(self):
+        self.count = 0
+        self.mean = None
+        self.m2 = None
+
+
+class Median(Accumulator):
+    """ Mediana. Es la única agregación que necesita guardar todos los valores del intervalo """
+
+    __slots__ = ('values',)
+
+    def __init__(self):
+        self.values = []
+
+    def add(self, value):
+        if value is not None:
+            self.values.append(value)
+
+    def result(self):
+        return statistics.median(self.values) if len(self.values) else None
+
+    def clear(self):
+        self.values.clear()
+
+
+class CircularMean(Accumulator):
+    """ Media de ángulos en grados, entre 0 y 360. La media de 350 y 10 es 0, no 180. Si los ángulos se
+    anulan entre sí, por ejemplo 90 y 270, no hay dirección media y el resultado es None """
+
+    __slots__ = ('count', 'sin', 'cos')
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, value):
+        if value is None:
+            return
+        angle = math.radians(value)
+        self.count += 1
+        self.sin += math.sin(angle)
+        self.cos += math.cos(angle)
+
+    def result(self):
+        if not self.count or math.hypot(self.sin, self.cos) < 1e-9 * self.count:
+            return None
+        return to_angle(math.atan2(self.sin, self.cos))
+
+    def clear(self):
+        self.count = 0
+        self.sin = 0.0
+        self.cos = 0.0
+
+
+class VectorMean(Accumulator):
+    """ Media vectorial del viento a partir de la velocidad y la dirección en grados de cada muestra. Cada
+    muestra se descompone en sus componentes este y norte, que se promedian por separado. El resultado es
+    la tupla (velocidad, dirección) """
+
+    __slots__ = ('count', 'east', 'north')
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, speed, direction=None):
+        if speed is None or direction is None:
+            return
+        angle = math.radians(direction)
+        self.count += 1
+        self.east += float(speed) * math.sin(angle)
+        self.north += float(speed) * math.cos(angle)
+
+    def speed(self):
+        """ Módulo de la velocidad media vectorial """
+        if not self.count:
+            return None
+        return Decimal(str(round(math.hypot(self.east, self.north) / self.count, 6)))
+
+    def direction(self):
+        """ Dirección de la velocidad media vectorial, en grados entre 0 y 360 """
+        if not self.count or math.hypot(self.east, self.north) < 1e-9 * self.count:
+            return None
+        return to_angle(math.atan2(self.east, self.north))
+
+    def result(self):
+        return self.speed(), self.direction()
+
+    def clear(self):
+        self.count = 0
+        self.east = 0.0
+        self.north = 0.0
+
+
+class VectorSpeed(VectorMean):
+    """ Módulo de la velocidad media vectorial """
+
+    __slots__ = ()
+
+    def result(self):
+        return self.speed()
+
+
+class VectorDirection(VectorMean):
+    """ Dirección de la velocidad media vectorial, en grados entre 0 y 360 """
+
+    __slots__ = ()
+
+    def result(self):
+        return self.direction()
+
+
+AGGREGATIONS = {
+    'mean': Mean,
+    'min': Min,
+    'max': Max,
+    'std': Std,
+    'median': Median,
+    'last': Last,
+    'count': Count,
+    'circular_mean': CircularMean,
+    'vector_speed': VectorSpeed,
+    'vector_dir': VectorDirection
+}
+
+
+def register(name, cls):
+    AGGREGATIONS[name] = cls
+
+
+def get_aggregation(name) -> Accumulator:
+    """ Retorna un acumulador nuevo de la agregación con el nombre dado """
+    cls = AGGREGATIONS.get(name)
+    if cls is None:
+        raise ValueError("Unknown aggregation %s" % (name,))
+
+    return cls()
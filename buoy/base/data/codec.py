@@ -0,0 +1,435 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import struct
+import threading
+import zlib
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import List, Union
+from uuid import UUID
+
+from buoy.base.data.item import BaseItem, JsonSerializer
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODECS = {}
+COMPRESSORS = {}
+
+FORMAT_MASK = 0x0f
+COMPRESSION_MASK = 0x30
+BATCH_FLAG = 0x40
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Codec(object):
+    """ Codifica los items para publicarlos. Salvo JSON, que se envía tal cual, el primer byte del mensaje
+    identifica el formato (4 bits bajos) para que el receptor sepa como decodificarlo """
+
+    name = None
+    marker = None
+
+    def encode(self, item: BaseItem) -> bytes:
+        raise NotImplementedError()
+
+    def encode_many(self, items: List[BaseItem]) -> bytes:
+        """ Codifica un lote de items en un único mensaje con un array """
+        raise NotImplementedError()
+
+    def decode(self, payload: bytes, cls=None) -> Union[dict, List[dict]]:
+        """ Retorna un diccionario, o una lista si es un lote, con los mismos valores que el JSON del item """
+        raise NotImplementedError()
+
+    def is_available(self):
+        return True
+
+
+class JsonCodec(Codec):
+    name = 'json'
+
+    def encode(self, item: BaseItem) -> bytes:
+        return item.to_json().encode('utf-8')
+
+    def encode_many(self, items: List[BaseItem]) -> bytes:
+        return ('[' + ','.join([item.to_json() for item in items]) + ']').encode('utf-8')
+
+    def decode(self, payload: bytes, cls=None) -> dict:
+        return json.loads(payload.decode('utf-8'))
+
+
+class NativeCodec(Codec):
+    """ Codec de los formatos binarios con tipos propios para fechas y uuid, que se envían sin convertir
+    a texto. Al decodificar se convierten de nuevo a los valores del JSON, con las fechas en UTC """
+
+    NATIVE = {datetime: None, UUID: None}
+
+    def __init__(self):
+        self.serializers = {}
+
+    def to_primitive(self, item: BaseItem) -> dict:
+        cls = type(item)
+        serializer = self.serializers.get(cls)
+        if serializer is None:
+            serializer = JsonSerializer(cls, converters=self.NATIVE)
+            self.serializers[cls] = serializer
+
+        return serializer.to_primitive(item)
+
+    @staticmethod
+    def to_json_values(values: Union[dict, List[dict]]) -> Union[dict, List[dict]]:
+        if isinstance(values, list):
+            return [NativeCodec.to_json_values(value) for value in values]
+
+        for key, value in values.items():
+            if isinstance(value, datetime):
+                values[key] = value.astimezone(timezone.utc).isoformat(timespec='milliseconds')
+            elif isinstance(value, UUID):
+                values[key] = str(value)
+            elif isinstance(value, dict):
+                NativeCodec.to_json_values(value)
+
+        return values
+
+
+class MsgPackCodec(NativeCodec):
+    """ MessagePack. Las fechas se envían con el tipo Timestamp de MessagePack y los uuid como tipo
+    extendido UUID_EXT_TYPE con sus 16 bytes """
+
+    name = 'msgpack'
+    marker = 0x01
+
+    UUID_EXT_TYPE = 1
+
+    def encode(self, item: BaseItem) -> bytes:
+        return bytes((self.marker,)) + msgpack.packb(self.to_primitive(item), default=self._default)
+
+    def encode_many(self, items: List[BaseItem]) -> bytes:
+        return bytes((self.marker,)) + msgpack.packb([self.to_primitive(item) for item in items],
+                                                     default=self._default)
+
+    def decode(self, payload: bytes, cls=None) -> Union[dict, List[dict]]:
+        return self.to_json_values(msgpack.unpackb(payload[1:], raw=False, timestamp=3, ext_hook=self._ext_hook))
+
+    def _default(self, value):
+        if isinstance(value, UUID):
+            return msgpack.ExtType(self.UUID_EXT_TYPE, value.bytes)
+        elif isinstance(value, datetime):
+            return msgpack.Timestamp.from_datetime(value if value.tzinfo else value.astimezone())
+        raise TypeError("Unknown type %s" % (type(value),))
+
+    def _ext_hook(self, code, data):
+        if code == self.UUID_EXT_TYPE:
+            return UUID(bytes=data)
+        return msgpack.ExtType(code, data)
+
+    def is_available(self):
+        return msgpack is not None
+
+
+class CborCodec(NativeCodec):
+    """ CBOR. Las fechas se envían como marca de tiempo (etiqueta 1) y los uuid con la etiqueta 37 """
+
+    name = 'cbor'
+    marker = 0x02
+
+    def encode(self, item: BaseItem) -> bytes:
+        return bytes((self.marker,)) + cbor2.dumps(self.to_primitive(item), datetime_as_timestamp=True,
+                                                   timezone=timezone.utc)
+
+    def encode_many(self, items: List[BaseItem]) -> bytes:
+        return bytes((self.marker,)) + cbor2.dumps([self.to_primitive(item) for item in items],
+                                                   datetime_as_timestamp=True, timezone=timezone.utc)
+
+    def decode(self, payload: bytes, cls=None) -> Union[dict, List[dict]]:
+        return self.to_json_values(cbor2.loads(payload[1:]))
+
+    def is_available(self):
+        return cbor2 is not None
+
+
+class StructLayout(object):
+    """ Formato binario fijo de una clase de item. Tras el marcador va un mapa de bits con los campos que
+    tienen valor y después los campos en el orden del esquema: uuid en 16 bytes, fechas en milisegundos
+    UTC, decimales como double y enteros de 64 bits """
+
+    FORMATS = {
+        UUID: ('16s', lambda value: value.bytes, lambda value: str(UUID(bytes=value))),
+        datetime: ('q', lambda value: int(round(value.timestamp() * 1000)),
+                   lambda value: datetime.fromtimestamp(value / 1000, tz=timezone.utc).isoformat(
+                       timespec='milliseconds')),
+        Decimal: ('d', lambda value: round(float(value), 3), lambda value: value),
+        int: ('q', lambda value: value, lambda value: value)
+    }
+
+    EMPTY = {'16s': bytes(16), 'q': 0, 'd': 0.0}
+
+    def __init__(self, cls):
+        self.fields = []
+        for field in cls._fields:
+            if field.type not in self.FORMATS:
+                raise CodecError("Field %s of %s has no fixed binary format" % (field.name, cls.__name__,))
+            self.fields.append(field)
+
+        self.bitmap_size = (len(self.fields) + 7) // 8
+        self.struct = struct.Struct('<' + str(self.bitmap_size) + 's' +
+                                    ''.join(self.FORMATS[field.type][0] for field in self.fields))
+
+    def pack(self, item: BaseItem) -> bytes:
+        bitmap = 0
+        values = []
+        for idx, field in enumerate(self.fields):
+            value = getattr(item, field.name)
+            fmt, encode, _ = self.FORMATS[field.type]
+            if value is None:
+                values.append(self.EMPTY[fmt])
+            else:
+                bitmap |= 1 << idx
+                values.append(encode(value))
+
+        return self.struct.pack(bitmap.to_bytes(self.bitmap_size, 'little'), *values)
+
+    def unpack(self, payload: bytes) -> dict:
+        bitmap, *values = self.struct.unpack(payload)
+        bitmap = int.from_bytes(bitmap, 'little')
+        serial = {}
+        for idx, (field, value) in enumerate(zip(self.fields, values)):
+            if bitmap & (1 << idx):
+                serial[field.json_name] = self.FORMATS[field.type][2](value)
+
+        return serial
+
+
+class StructCodec(Codec):
+    """ Formato fijo generado a partir de los campos del item. Los lotes llevan BATCH_FLAG en la cabecera,
+    el número de items en 2 bytes y los items uno detrás de otro, todos de la misma clase """
+
+    name = 'struct'
+    marker = 0x03
+
+    count = struct.Struct('<H')
+
+    def __init__(self):
+        self.layouts = {}
+
+    def get_layout(self, cls) -> StructLayout:
+        layout = self.layouts.get(cls)
+        if layout is None:
+            layout = StructLayout(cls)
+            self.layouts[cls] = layout
+
+        return layout
+
+    def encode(self, item: BaseItem) -> bytes:
+        return bytes((self.marker,)) + self.get_layout(type(item)).pack(item)
+
+    def encode_many(self, items: List[BaseItem]) -> bytes:
+        cls = type(items[0])
+        if any(type(item) is not cls for item in items):
+            raise CodecError("Struct batches need items of the same class")
+        layout = self.get_layout(cls)
+
+        return bytes((self.marker | BATCH_FLAG,)) + self.count.pack(len(items)) + \
+            b''.join([layout.pack(item) for item in items])
+
+    def decode(self, payload: bytes, cls=None) -> Union[dict, List[dict]]:
+        if cls is None:
+            raise CodecError("Struct payloads need the item class to be decoded")
+        layout = self.get_layout(cls)
+        if not payload[0] & BATCH_FLAG:
+            return layout.unpack(payload[1:])
+
+        num, = self.count.unpack_from(payload, 1)
+        start = 1 + self.count.size
+        size = layout.struct.size
+        return [layout.unpack(payload[start + idx * size:start + (idx + 1) * size]) for idx in range(0, num)]
+
+
+class Compressor(object):
+    """ Comprime los mensajes con un diccionario creado a partir de los nombres de los campos de la clase
+    del item, que se repiten en cada mensaje. El mensaje comprimido lleva una cabecera con el bit del
+    compresor y el formato del mensaje original (0 para JSON) seguida del mensaje original comprimido """
+
+    name = None
+    flag = None
+
+    def __init__(self):
+        self.dictionaries = {}
+
+    def get_dictionary(self, cls) -> bytes:
+        dictionary = self.dictionaries.get(cls)
+        if dictionary is None:
+            dictionary = ''.join(['"%s":' % (field.json_name,) for field in cls._fields]).encode('utf-8')
+            self.dictionaries[cls] = dictionary
+
+        return dictionary
+
+    def compress(self, data: bytes, cls) -> bytes:
+        raise NotImplementedError()
+
+    def decompress(self, data: bytes, cls) -> bytes:
+        raise NotImplementedError()
+
+    def is_available(self):
+        return True
+
+
+class ZlibCompressor(Compressor):
+    """ Deflate sin cabecera ni checksum, con el diccionario como diccionario predefinido """
+
+    name = 'zlib'
+    flag = 0x10
+
+    def compress(self, data: bytes, cls) -> bytes:
+        compressor = zlib.compressobj(9, zlib.DEFLATED, -15, zdict=self.get_dictionary(cls))
+        return compressor.compress(data) + compressor.flush()
+
+    def decompress(self, data: bytes, cls) -> bytes:
+        decompressor = zlib.decompressobj(-15, zdict=self.get_dictionary(cls))
+        return decompressor.decompress(data) + decompressor.flush()
+
+
+class ZstdCompressor(Compressor):
+    """ Zstandard con el diccionario como diccionario de contenido, sin identificador de diccionario ni
+    checksum en la trama. Los objetos de zstandard no se pueden usar desde varios hilos a la vez, así que
+    cada hilo crea los suyos """
+
+    name = 'zstd'
+    flag = 0x20
+
+    def __init__(self):
+        super(ZstdCompressor, self).__init__()
+        self.local = threading.local()
+
+    def get_zstd_dictionary(self, cls):
+        return zstandard.ZstdCompressionDict(self.get_dictionary(cls), dict_type=zstandard.DICT_TYPE_RAWCONTENT)
+
+    def get_local(self, name) -> dict:
+        """ Retorna el diccionario, del hilo actual, con los objetos de zstandard de cada clase """
+        objects = getattr(self.local, name, None)
+        if objects is None:
+            objects = {}
+            setattr(self.local, name, objects)
+        return objects
+
+    def compress(self, data: bytes, cls) -> bytes:
+        compressors = self.get_local('compressors')
+        compressor = compressors.get(cls)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=19, dict_data=self.get_zstd_dictionary(cls),
+                                                  write_checksum=False, write_dict_id=False)
+            compressors[cls] = compressor
+
+        return compressor.compress(data)
+
+    def decompress(self, data: bytes, cls) -> bytes:
+        decompressors = self.get_local('decompressors')
+        decompressor = decompressors.get(cls)
+        if decompressor is None:
+            decompressor = zstandard.ZstdDecompressor(dict_data=self.get_zstd_dictionary(cls))
+            decompressors[cls] = decompressor
+
+        return decompressor.decompress(data)
+
+    def is_available(self):
+        return zstandard is not None
+
+
+def register(codec: Codec):
+    CODECS[codec.name] = codec
+
+
+def register_compressor(compressor: Compressor):
+    COMPRESSORS[compressor.name] = compressor
+
+
+def get_compressor(name) -> Compressor:
+    """ Retorna el compresor registrado con el nombre dado """
+    compressor = COMPRESSORS.get(name)
+    if compressor is None:
+        raise CodecError("Unknown compression %s" % (name,))
+    if not compressor.is_available():
+        raise CodecError("Compression %s needs a package that is not installed" % (name,))
+
+    return compressor
+
+
+def compress(payload: bytes, cls, compressor: Compressor, min_size=0) -> bytes:
+    """ Comprime el mensaje si tiene al menos min_size bytes y si comprimido ocupa menos """
+    if len(payload) < min_size:
+        return payload
+
+    codec = get_codec_by_payload(payload)
+    compressed = bytes((compressor.flag | (codec.marker or 0),)) + compressor.compress(payload, cls)
+    if len(compressed) >= len(payload):
+        return payload
+
+    return compressed
+
+
+def decompress(payload: bytes, cls=None) -> bytes:
+    """ Retorna el mensaje original si está comprimido o el mismo mensaje si no lo está """
+    if payload[:1] in (b'{', b'[') or not len(payload) or not payload[0] & COMPRESSION_MASK:
+        return payload
+    if cls is None:
+        raise CodecError("Compressed payloads need the item class to be decompressed")
+
+    for compressor in COMPRESSORS.values():
+        if payload[0] & COMPRESSION_MASK == compressor.flag:
+            if not compressor.is_available():
+                raise CodecError("Compression %s needs a package that is not installed" % (compressor.name,))
+            return compressor.decompress(payload[1:], cls)
+
+    raise CodecError("Unknown compression in header %r" % (payload[:1],))
+
+
+def get_codec(name) -> Codec:
+    """ Retorna el codec registrado con el nombre dado """
+    codec = CODECS.get(name)
+    if codec is None:
+        raise CodecError("Unknown payload format %s" % (name,))
+    if not codec.is_available():
+        raise CodecError("Payload format %s needs a package that is not installed" % (name,))
+
+    return codec
+
+
+def get_codec_by_payload(payload: bytes) -> Codec:
+    """ Retorna el codec con el que se codificó el mensaje a partir de su primer byte """
+    if payload[:1] in (b'{', b'['):
+        return CODECS['json']
+    for codec in CODECS.values():
+        if codec.marker is not None and len(payload) and payload[0] & FORMAT_MASK == codec.marker:
+            return codec
+
+    raise CodecError("Unknown payload marker %r" % (payload[:1],))
+
+
+def decode(payload: bytes, cls=None) -> Union[dict, List[dict]]:
+    payload = decompress(payload, cls)
+    return get_codec_by_payload(payload).decode(payload, cls)
+
+
+for registered in (JsonCodec(), MsgPackCodec(), CborCodec(), StructCodec()):
+    register(registered)
+
+for registered in (ZlibCompressor(), ZstdCompressor()):
+    register_compressor(registered)
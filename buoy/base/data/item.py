@@ -3,81 +3,159 @@
 import json
 import logging
 from datetime import datetime, timezone, timedelta
-from decimal import *
+from decimal import Decimal, InvalidOperation
 from enum import Enum
+from operator import attrgetter
 from uuid import uuid4, UUID
-from buoy.base.data.utils import convert_to_seconds, round_time
 
 from dateutil import parser
 
+from buoy.base.data.aggregation import get_aggregation
+from buoy.base.data.utils import convert_to_seconds, round_time
+
 logger = logging.getLogger(__name__)
 
 
-class BaseItem(object):
-    def __init__(self, **kwargs):
-        self.uuid = kwargs.pop('uuid', uuid4())
-        self.date = kwargs.pop('date', datetime.now(tz=timezone.utc))
+def to_decimal(value):
+    val = None
+    if value is not None:
+        try:
+            val = Decimal(value)
+        except InvalidOperation:
+            logger.error("Convert string to decimal", value)
 
-    @property
-    def uuid(self):
-        """
-        :return: Identifier
-        :rtype: Integer
-        """
-        return self._uuid
+    return val
+
+
+def to_datetime(value):
+    if type(value) is int:
+        value = datetime.fromtimestamp(value / 1000.0)
+    elif type(value) is str:
+        value = parser.parse(value)
+
+    return value
+
+
+class Field(property):
+    """ Propiedad de un campo de un item que declara además su tipo, conversor, columna en la base de datos y
+    nombre en JSON. El valor se guarda en _<nombre>, que la clase declara en __slots__, y se convierte con
+    converter al asignarlo.
+
+    aggregation es la agregación con la que BufferItems resume el campo en cada intervalo (mean por defecto)
+    y source el campo, o la tupla de campos, de los que se calcula. Así un item puede declarar campos con
+    varios estadísticos de un mismo valor, por ejemplo air_temp_max = Field(aggregation='max', source='air_temp')
+    """
+
+    def __init__(self, converter=None, default=None, doc=None, **kwargs):
+        super(Field, self).__init__(self._get, self._set, None, doc)
+        self.converter = converter
+        self.default = default
+        self.type = kwargs.pop('type', None)
+        self.column = kwargs.pop('column', None)
+        self.json_name = kwargs.pop('json_name', None)
+        self.aggregation = kwargs.pop('aggregation', 'mean')
+        self.source = kwargs.pop('source', None)
+        self.name = None
+        self.slot = None
+        self.__doc__ = doc
 
-    @uuid.setter
-    def uuid(self, value):
-        self._uuid = value
+    def bind(self, name):
+        self.name = name
+        self.column = self.column or name
+        self.json_name = self.json_name or name
+        return self
+
+    def __set_name__(self, owner, name):
+        self.bind(name)
+        self.slot = '_' + name
+
+    def _get(self, instance):
+        return getattr(instance, self.slot)
+
+    def _set(self, instance, value):
+        if self.converter:
+            value = self.converter(value)
+        setattr(instance, self.slot, value)
+
+    def get_default(self):
+        return self.default() if callable(self.default) else self.default
 
     @property
-    def date(self):
-        """
-        :return: Datetime
-        :rtype: Datetime
-        """
-        return self._date
-
-    @date.setter
-    def date(self, value):
-        if type(value) is int:
-            value = datetime.fromtimestamp(value / 1000.0)
-        elif type(value) is str:
-            value = parser.parse(value)
-
-        self._date = value
+    def is_declared(self):
+        return self.slot is not None
+
+
+class BaseItem(object):
+    """ Item leído de un dispositivo. Los campos se declaran con Field, o con propiedades con setter, y
+    _fields es el esquema de la clase, ordenado por nombre """
+
+    __slots__ = ('_uuid', '_date')
+
+    uuid = Field(default=uuid4, doc="Identifier", type=UUID)
+    date = Field(to_datetime, default=lambda: datetime.now(tz=timezone.utc), doc="Datetime", type=datetime)
+
+    def __init__(self, **kwargs):
+        for field in self._declared_fields:
+            setattr(self, field.name, kwargs.pop(field.name, field.get_default()))
+
+    def __init_subclass__(cls, **kwargs):
+        super(BaseItem, cls).__init_subclass__(**kwargs)
+        cls._set_fields()
+
+    @classmethod
+    def _set_fields(cls):
+        """ Calcula, una vez por clase, los campos heredados y los propios. En las clases que usan
+        propiedades, cada propiedad pública con setter es un campo """
+        fields = {}
+        for base in reversed(cls.__mro__[1:]):
+            for field in base.__dict__.get('_fields', ()):
+                fields[field.name] = field
+        for key, value in cls.__dict__.items():
+            if isinstance(value, Field):
+                fields[key] = value
+            elif isinstance(value, property) and value.fset is not None and not key.startswith('_'):
+                fields[key] = Field(doc=value.__doc__).bind(key)
+        cls._fields = tuple(sorted(fields.values(), key=lambda field: field.name))
+        cls._declared_fields = tuple(field for field in cls._fields if field.is_declared)
+        cls._slots = tuple(slot for klass in cls.__mro__ for slot in klass.__dict__.get('__slots__', ()))
+
+    @classmethod
+    def from_columns(cls, row):
+        """ Crea el item a partir de un registro de la base de datos """
+        values = dict(row)
+        for field in cls._fields:
+            if field.column != field.name and field.column in values:
+                values[field.name] = values.pop(field.column)
+
+        return cls(**values)
 
     @staticmethod
     def _convert_string_to_decimal(value):
-        val = None
-        if value is not None:
-            try:
-                val = Decimal(value)
-            except InvalidOperation:
-                logger.error("Convert string to decimal", value)
-
-        return val
+        return to_decimal(value)
 
     def to_json(self):
-        item = json.dumps(self, cls=DataEncoder, sort_keys=True, separators=(',', ':'))
-        return item
+        return self.get_json_serializer().dumps(self)
+
+    @classmethod
+    def get_json_serializer(cls):
+        """ Retorna el serializador JSON de la clase, que se crea la primera vez que se usa """
+        serializer = cls.__dict__.get('_json_serializer')
+        if serializer is None:
+            serializer = JsonSerializer(cls)
+            cls._json_serializer = serializer
+
+        return serializer
 
     def __iter__(self):
-        for name in dir(self):
-            yield name, getattr(self, name)
+        for field in self._fields:
+            yield field.name, getattr(self, field.name)
 
     def __dir__(self):
-        list_props = []
-        for name in vars(self):
-            list_props.append(name[1:])
-
-        return list_props
+        return [field.name for field in self._fields]
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            a = dict(other)
-            b = dict(self)
-            return a == b
+            return all(getattr(self, field.name) == getattr(other, field.name) for field in self._fields)
         return False
 
     def __lt__(self, other):
@@ -91,15 +169,22 @@ class BaseItem(object):
     def __copy__(self):
         cls = self.__class__
         result = cls.__new__(cls)
-        result.__dict__.update(self.__dict__)
+        for slot in cls._slots:
+            setattr(result, slot, getattr(self, slot))
+        if hasattr(self, '__dict__'):
+            result.__dict__.update(self.__dict__)
         return result
 
 
+BaseItem._set_fields()
+
+
 class DataEncoder(json.JSONEncoder):
     def default(self, o):
         serial = {}
-        for name in dir(o):
-            value = getattr(o, name)
+        for field in o._fields:
+            name = field.json_name
+            value = getattr(o, field.name)
             datatype = type(value)
             if datatype is datetime:
                 serial[name] = value.isoformat(timespec='milliseconds')
@@ -122,6 +207,54 @@ class DataEncoder(json.JSONEncoder):
         return serial
 
 
+class JsonSerializer(object):
+    """ Serializador JSON de una clase de item. El orden de los campos y la conversión de cada tipo se
+    calculan al crearlo y genera exactamente la misma salida que json.dumps con DataEncoder """
+
+    CONVERTERS = {
+        datetime: lambda value: value.isoformat(timespec='milliseconds'),
+        Decimal: lambda value: round(float(value), 3),
+        int: None,
+        str: None,
+        UUID: str
+    }
+
+    encoder = json.JSONEncoder(separators=(',', ':'))
+
+    def __init__(self, cls, **kwargs):
+        self.converters = dict(self.CONVERTERS)
+        self.converters.update(kwargs.pop('converters', {}))
+
+        fields = sorted(cls._fields, key=lambda field: field.json_name)
+        self.getter = attrgetter(*[field.slot if field.is_declared else field.name for field in fields])
+        if len(fields) == 1:
+            getter = self.getter
+            self.getter = lambda item: (getter(item),)
+        self.plan = [(field.json_name, field.name, field.type, self.converters.get(field.type)) for field in fields]
+
+    def to_primitive(self, item) -> dict:
+        """ Retorna un diccionario, con las claves ordenadas, con los valores serializables del item """
+        serial = {}
+        for (key, name, field_type, converter), value in zip(self.plan, self.getter(item)):
+            if value is None:
+                continue
+            datatype = type(value)
+            if datatype is not field_type:
+                if datatype not in self.converters:
+                    if isinstance(value, BaseItem):
+                        serial[key] = value.get_json_serializer().to_primitive(value)
+                    elif value:
+                        logger.error("No serialize property %s with value %s" % (name, value,))
+                    continue
+                converter = self.converters[datatype]
+            serial[key] = converter(value) if converter else value
+
+        return serial
+
+    def dumps(self, item) -> str:
+        return self.encoder.encode(self.to_primitive(item))
+
+
 class Status(Enum):
     NEW = 0
     SENT = 1
@@ -135,21 +268,74 @@ class ItemQueue(object):
 
 
 class BufferItems(object):
+    """
+    Agrupa los items por intervalos de tiempo y, al cerrar cada intervalo, retorna un item con los campos
+    agregados según su Field (aggregation y source), o según aggregations, un diccionario de nombre de campo a
+    agregación o a (agregación, campo origen), cuyos nombres deben ser campos del item. Los valores se
+    acumulan según llegan, por lo que la memoria no depende del número de items del intervalo. Los valores
+    None no cuentan, los ceros sí
+    """
+
     def __init__(self, **kwargs):
-        self.__buffer = []
         self.interval = kwargs.pop("interval", None)
         if self.interval:
             self.interval = convert_to_seconds(self.interval)
+        self.aggregations = kwargs.pop("aggregations", None) or {}
 
         self.__limit_higher = None
         self.__limit_lower = None
 
         self.__item_cls = None
         self.__fields = None
+        self.__getter = None
+        self.__accumulators = None
+        self.__single = None
+        self.__multiple = None
+        self.__size = 0
 
     @staticmethod
     def extract_fieldname_parameters(item):
-        return list(set(dir(item)) - set(dir(BaseItem)))
+        base_fields = set(field.name for field in BaseItem._fields)
+        return [field.name for field in type(item)._fields if field.name not in base_fields]
+
+    def get_spec(self, field: Field):
+        """ Retorna la agregación y los campos origen de un campo """
+        spec = self.aggregations.get(field.name, (field.aggregation, field.source))
+        aggregation, source = (spec, None) if isinstance(spec, str) else spec
+        source = source or field.name
+
+        return aggregation, (source,) if isinstance(source, str) else tuple(source)
+
+    def compile(self, item: BaseItem):
+        """ Prepara, una vez por clase, los acumuladores de los campos. Los valores de los campos con un único
+        origen se obtienen con un solo attrgetter y los de varios orígenes con uno propio por campo """
+        cls = type(item)
+        fields = {field.name: field for field in cls._fields}
+        self.__item_cls = cls
+        self.__fields = self.extract_fieldname_parameters(item)
+
+        unknown = set(self.aggregations) - set(self.__fields)
+        if unknown:
+            raise ValueError("Aggregations for unknown fields %s in %s" % (", ".join(sorted(unknown)), cls.__name__))
+
+        self.__accumulators = []
+        single, self.__multiple = [], []
+        for name in self.__fields:
+            aggregation, sources = self.get_spec(fields[name])
+            accumulator = get_aggregation(aggregation)
+            self.__accumulators.append(accumulator)
+            if len(sources) == 1:
+                single.append((accumulator.add, sources[0]))
+            else:
+                self.__multiple.append((accumulator.add, attrgetter(*sources)))
+
+        self.__single = [add for add, _ in single]
+        self.__getter = None
+        if len(single) == 1:
+            getter = attrgetter(single[0][1])
+            self.__getter = lambda item: (getter(item),)
+        elif len(single):
+            self.__getter = attrgetter(*[source for _, source in single])
 
     def append(self, other: BaseItem):
         item = None
@@ -160,14 +346,13 @@ class BufferItems(object):
         if self.interval is None:
             item = other
         elif self.inside_interval(other.date):
-            if len(self.__buffer) == 0:
+            if self.__size == 0:
                 if self.__fields is None and self.__item_cls is None:
-                    self.__item_cls = type(other)
-                    self.__fields = self.extract_fieldname_parameters(other)
+                    self.compile(other)
 
                 self.set_limits(other.date)
             logger.debug("Inserting item in buffer")
-            self.__buffer.append(other)
+            self.accumulate(other)
         else:
             item = self.process_buffer()
             self.clear()
@@ -175,6 +360,14 @@ class BufferItems(object):
 
         return item
 
+    def accumulate(self, item: BaseItem):
+        self.__size += 1
+        if self.__getter is not None:
+            for add, value in zip(self.__single, self.__getter(item)):
+                add(value)
+        for add, getter in self.__multiple:
+            add(*getter(item))
+
     def set_limits(self, date):
         logger.debug("Setting limits %s", str(date))
         logger.debug("Interval %i", self.interval)
@@ -183,10 +376,15 @@ class BufferItems(object):
         logger.debug("Set limits lower: %s", str(self.__limit_lower))
 
     def clear(self):
-        self.__buffer.clear()
+        self.__size = 0
+        for accumulator in self.__accumulators or []:
+            accumulator.clear()
         self.__limit_lower = None
         self.__limit_higher = None
 
+    def size(self):
+        return self.__size
+
     def limits(self):
         return self.__limit_lower, self.__limit_higher
 
@@ -195,17 +393,13 @@ class BufferItems(object):
                (self.__limit_lower < date <= self.__limit_higher)
 
     def process_buffer(self):
-        logger.debug("Proccesing buffer %i", len(self.__buffer))
+        logger.debug("Proccesing buffer %i", self.__size)
         logger.debug("Fieldnames: %s", " , ".join(self.__fields))
         item_attr = {
             "date": self.__limit_higher
         }
-        for key in self.__fields:
-            attr = [getattr(o, key) for o in self.__buffer if getattr(o, key)]
-            if len(attr) > 0:
-                item_attr[key] = sum(attr) / len(attr)
-            else:
-                item_attr[key] = None
+        for key, accumulator in zip(self.__fields, self.__accumulators):
+            item_attr[key] = accumulator.result()
 
         logger.debug("Item processed")
         return self.__item_cls(**item_attr)
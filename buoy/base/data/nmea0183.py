@@ -1,22 +1,25 @@
 # -*- coding: utf-8 -*-
 
-from buoy.client.device.common.item import BaseItem
+from decimal import Decimal
+
+from buoy.base.data.item import BaseItem, Field, to_decimal
 
 
 class WIMDA(BaseItem):
-    def __init__(self, **kwargs):
-        self.press_inch = kwargs.pop('press_inch', None)
-        self.press_mbar = kwargs.pop('press_mbar', None)
-        self.air_temp = kwargs.pop('air_temp', None)
-        self.water_temp = kwargs.pop('water_temp', None)
-        self.rel_humidity = kwargs.pop('rel_humidity', None)
-        self.abs_humidity = kwargs.pop('abs_humidity', None)
-        self.dew_point = kwargs.pop('dew_point', None)
-        self.wind_dir_true = kwargs.pop('wind_dir_true', None)
-        self.wind_dir_magnetic = kwargs.pop('wind_dir_magnetic', None)
-        self.wind_knots = kwargs.pop('wind_knots', None)
-        self.wind_meters = kwargs.pop('wind_meters', None)
-        super(WIMDA, self).__init__(**kwargs)
+    __slots__ = ('_press_inch', '_press_mbar', '_air_temp', '_water_temp', '_rel_humidity', '_abs_humidity',
+                 '_dew_point', '_wind_dir_true', '_wind_dir_magnetic', '_wind_knots', '_wind_meters')
+
+    press_inch = Field(to_decimal, doc="Barometric pressure, inches of mercury", type=Decimal)
+    press_mbar = Field(to_decimal, doc="Barometric pressure, bars", type=Decimal)
+    air_temp = Field(to_decimal, doc="Air temperature, degrees Celsius", type=Decimal)
+    water_temp = Field(to_decimal, doc="Water temperature, degrees Celsius", type=Decimal)
+    rel_humidity = Field(to_decimal, doc="Relative humidity, percent", type=Decimal)
+    abs_humidity = Field(to_decimal, doc="Absolute humidity, percent", type=Decimal)
+    dew_point = Field(to_decimal, doc="Dew point, degrees C", type=Decimal)
+    wind_dir_true = Field(to_decimal, doc="Wind direction true", type=Decimal, aggregation='circular_mean')
+    wind_dir_magnetic = Field(to_decimal, doc="Wind direction magnetic", type=Decimal, aggregation='circular_mean')
+    wind_knots = Field(to_decimal, doc="Wind speed knots", type=Decimal)
+    wind_meters = Field(to_decimal, doc="Wind speed meters/second", type=Decimal)
 
     @staticmethod
     def from_nmea(in_datetime, wimda):
@@ -37,138 +40,6 @@ class WIMDA(BaseItem):
             wind_knots=wimda.wind_speed_knots,
             wind_meters=wimda.wind_speed_meters)
 
-    @property
-    def press_inch(self):
-        """
-        :return: Barometric pressure, inches of mercury
-        :rtype: Decimal
-        """
-        return self._press_inch
-
-    @press_inch.setter
-    def press_inch(self, value):
-        self._press_inch = self._convert_string_to_decimal(value)
-
-    @property
-    def press_mbar(self):
-        """
-        :return: Barometric pressure, bars
-        :rtype: Decimal
-        """
-        return self._press_mbar
-
-    @press_mbar.setter
-    def press_mbar(self, value):
-        self._press_mbar = self._convert_string_to_decimal(value)
-
-    @property
-    def air_temp(self):
-        """
-        :return: Barometric pressure, bars
-        :rtype: Decimal
-        """
-        return self._air_temp
-
-    @air_temp.setter
-    def air_temp(self, value):
-        self._air_temp = self._convert_string_to_decimal(value)
-
-    @property
-    def water_temp(self):
-        """
-        :return: Water temperature, degrees Celsius
-        :rtype: Decimal
-        """
-        return self._water_temp
-
-    @water_temp.setter
-    def water_temp(self, value):
-        self._water_temp = self._convert_string_to_decimal(value)
-
-    @property
-    def rel_humidity(self):
-        """
-        :return: Relative humidity, percent
-        :rtype: Decimal
-        """
-        return self._rel_humidity
-
-    @rel_humidity.setter
-    def rel_humidity(self, value):
-        self._rel_humidity = self._convert_string_to_decimal(value)
-
-    @property
-    def abs_humidity(self):
-        """
-        :return: Absolute humidity, percent
-        :rtype: Decimal
-        """
-        return self._abs_humidity
-
-    @abs_humidity.setter
-    def abs_humidity(self, value):
-        self._abs_humidity = self._convert_string_to_decimal(value)
-
-    @property
-    def dew_point(self):
-        """
-        :return: Dew point, degrees C
-        :rtype: Decimal
-        """
-        return self._dew_point
-
-    @dew_point.setter
-    def dew_point(self, value):
-        self._dew_point = self._convert_string_to_decimal(value)
-
-    @property
-    def wind_dir_true(self):
-        """
-        :return: Wind direction true
-        :rtype: Decimal
-        """
-        return self._wind_dir_true
-
-    @wind_dir_true.setter
-    def wind_dir_true(self, value):
-        self._wind_dir_true = self._convert_string_to_decimal(value)
-
-    @property
-    def wind_dir_magnetic(self):
-        """
-        :return: Wind direction magnetic
-        :rtype: Decimal
-        """
-        return self._wind_dir_magnetic
-
-    @wind_dir_magnetic.setter
-    def wind_dir_magnetic(self, value):
-        self._wind_dir_magnetic = self._convert_string_to_decimal(value)
-
-    @property
-    def wind_knots(self):
-        """
-        :return: Wind speed knots
-        :rtype: Decimal
-        """
-        return self._wind_knots
-
-    @wind_knots.setter
-    def wind_knots(self, value):
-        self._wind_knots = self._convert_string_to_decimal(value)
-
-    @property
-    def wind_meters(self):
-        """
-        :return: Wind speed meters/second
-        :rtype: Decimal
-        """
-        return self._wind_meters
-
-    @wind_meters.setter
-    def wind_meters(self, value):
-        self._wind_meters = self._convert_string_to_decimal(value)
-
     def __str__(self):
         return ("Uuid: {uuid}\n"
                 "Date: {date}\n"
@@ -1,50 +1,522 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from typing import List, AnyStr
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+from itertools import count, chain
+from threading import Lock
+from typing import List, AnyStr, Iterator, Iterable, Optional
+from uuid import UUID
 
 import psycopg2
-from psycopg2 import DatabaseError, IntegrityError, errorcodes
-from psycopg2.extensions import AsIs
+from psycopg2 import DatabaseError, IntegrityError, OperationalError, errorcodes
+from psycopg2.extensions import AsIs, connection, TRANSACTION_STATUS_IDLE
 from psycopg2.extras import DictCursor, DictRow, register_uuid
+from psycopg2.pool import PoolError
+from dateutil import parser
+from dateutil.relativedelta import relativedelta
 
 from buoy.base.data.item import BaseItem
+from buoy.base.data.utils import convert_to_seconds
 
 register_uuid()
 logger = logging.getLogger(__name__)
 
 
+KEYSET_START = (datetime(1, 1, 1, tzinfo=timezone.utc), UUID(int=0))
+PARTITION_INTERVALS = {"day": relativedelta(days=1), "month": relativedelta(months=1)}
+
+
+class DeviceConnection(connection):
+    """ Conexión que recuerda las sentencias preparadas en su sesión, de forma que al reconectar
+    se vuelven a preparar """
+
+    def __init__(self, *args, **kwargs):
+        super(DeviceConnection, self).__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class CopySource(object):
+    """ Fichero de sólo lectura que genera, según se va leyendo, las líneas CSV de los items para COPY """
+
+    def __init__(self, items: Iterable[BaseItem], names: List[AnyStr]):
+        self.items = iter(items)
+        self.names = names
+        self.rows = 0
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            item = next(self.items, None)
+            if item is None:
+                break
+            self._buffer += ','.join([self.format(getattr(item, name)) for name in self.names]) + '\n'
+            self.rows += 1
+
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    readline = read
+
+    @staticmethod
+    def format(value) -> str:
+        if value is None:
+            return ''
+        elif isinstance(value, bool):
+            return 't' if value else 'f'
+        elif isinstance(value, datetime):
+            return value.isoformat()
+        elif isinstance(value, str):
+            return '"' + value.replace('"', '""') + '"'
+        return str(value)
+
+
+class BulkLoadStats(object):
+    """ Resultado de una carga masiva """
+
+    def __init__(self, rows=0, inserted=0, seconds=0.0):
+        self.rows = rows
+        self.inserted = inserted
+        self.seconds = seconds
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+class ThreadToken(object):
+    """ Identifica a un hilo ante el pool. Se guarda en un threading.local, de modo que al terminar el hilo se
+    destruye y el pool cierra las conexiones que el hilo no devolvió """
+
+
+class ConnectionPool(object):
+    """ Pool de conexiones seguro entre hilos. Cada hilo toma una conexión para cada operación y la devuelve
+    al terminarla. Las conexiones que llevan tiempo sin usarse se comprueban antes de entregarlas y, si se
+    han perdido o el pool está agotado, se espera de forma exponencial antes de volver a intentarlo """
+
+    def __init__(self, db_config, **kwargs):
+        self.max_connections = kwargs.pop('max_connections', 10)
+        self.health_check_interval = kwargs.pop('health_check_interval', 30)
+        self.max_attempts = kwargs.pop('max_attempts', 5)
+        reconnect_delay = kwargs.pop('reconnect_delay', {"min_delay": 1, "max_delay": 120})
+        self.min_delay = reconnect_delay['min_delay']
+        self.max_delay = reconnect_delay['max_delay']
+
+        self.db_config = db_config
+        self._idle = []
+        self._used = {}
+        self._last_used = {}
+        self._local = threading.local()
+        self._lock = Lock()
+
+    def _thread_connections(self) -> dict:
+        """ Retorna las conexiones, por nombre, que tiene tomadas el hilo actual """
+        token = getattr(self._local, 'token', None)
+        if token is None:
+            token = ThreadToken()
+            self._local.token = token
+            weakref.finalize(token, self._abandon, id(token))
+        with self._lock:
+            return self._used.setdefault(id(token), {})
+
+    def _abandon(self, key):
+        """ Cierra las conexiones que un hilo terminado no devolvió, sin saber en qué estado las dejó """
+        with self._lock:
+            conns = self._used.pop(key, None)
+        for conn in (conns or {}).values():
+            self._close(conn)
+
+    def size(self) -> int:
+        """ Número de conexiones abiertas, libres o en uso """
+        with self._lock:
+            return len(self._idle) + sum(len(conns) for conns in self._used.values())
+
+    def getconn(self, name=None) -> DeviceConnection:
+        """ Retorna la conexión del hilo actual, que se mantiene hasta devolverla con putconn. Con name se
+        obtiene otra conexión del mismo hilo, independiente de la principal """
+        conns = self._thread_connections()
+        conn = conns.get(name)
+        if conn is not None:
+            return conn
+
+        conn = self._connect(conns, name)
+        if conn.closed or not self.is_healthy(conn):
+            self.discard(conn, name=name)
+            conn = self._connect(conns, name)
+
+        with self._lock:
+            self._last_used[conn] = time.monotonic()
+
+        return conn
+
+    def is_checked_out(self, name=None) -> bool:
+        """ Indica si el hilo actual tiene ya una conexión sin devolver """
+        return name in self._thread_connections()
+
+    def is_healthy(self, conn) -> bool:
+        with self._lock:
+            last_used = self._last_used.get(conn)
+        if last_used is None or time.monotonic() - last_used < self.health_check_interval:
+            return True
+
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+        except DatabaseError:
+            logger.warning("Lost connection to database")
+            return False
+
+        return True
+
+    def _connect(self, conns: dict, name) -> DeviceConnection:
+        delay = self.min_delay
+        attempt = 0
+        while True:
+            try:
+                conn = self._checkout(conns, name)
+                if conn is None:
+                    conn = psycopg2.connect(connection_factory=DeviceConnection, **self.db_config)
+                    with self._lock:
+                        conns[name] = conn
+                return conn
+            except (OperationalError, PoolError) as ex:
+                with self._lock:
+                    if name in conns and conns[name] is None:
+                        del conns[name]
+                attempt += 1
+                if self.max_attempts and attempt >= self.max_attempts:
+                    if isinstance(ex, PoolError):
+                        raise OperationalError(str(ex)) from ex
+                    raise
+                logger.warning("Database is unavailable, retrying in %i seconds", delay)
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_delay)
+
+    def _checkout(self, conns: dict, name) -> Optional[DeviceConnection]:
+        """ Asigna al hilo una conexión libre, o reserva el hueco de una nueva (retorna None) """
+        with self._lock:
+            if len(self._idle):
+                conns[name] = self._idle.pop()
+                return conns[name]
+            if len(self._idle) + sum(len(used) for used in self._used.values()) >= self.max_connections:
+                raise PoolError("connection pool exhausted")
+            conns[name] = None
+            return None
+
+    def putconn(self, conn, name=None):
+        """ Devuelve la conexión del hilo actual al pool para que la use cualquier hilo """
+        conns = self._thread_connections()
+        with self._lock:
+            conns.pop(name, None)
+        if conn.closed:
+            self._close(conn)
+            return
+        if conn.info.transaction_status != TRANSACTION_STATUS_IDLE:
+            conn.rollback()
+        with self._lock:
+            self._idle.append(conn)
+
+    def discard(self, conn, name=None):
+        """ Cierra y descarta la conexión del hilo actual """
+        conns = self._thread_connections()
+        with self._lock:
+            conns.pop(name, None)
+        self._close(conn)
+
+    def _close(self, conn):
+        with self._lock:
+            self._last_used.pop(conn, None)
+        if conn is not None and not conn.closed:
+            conn.close()
+
+    def closeall(self):
+        with self._lock:
+            conns = self._idle + [conn for used in self._used.values() for conn in used.values()]
+            self._idle = []
+            for used in self._used.values():
+                used.clear()
+        for conn in conns:
+            self._close(conn)
+
+
 class DeviceDB(object):
-    """ Clase encargada de gestionar la base de datos """
+    """ Clase encargada de gestionar la base de datos
+
+    Las conexiones se obtienen de un ConnectionPool, propio o compartido con otros dispositivos (pool),
+    de forma que cada operación usa una conexión del pool y se reconecta si la base de datos se reinicia
+
+    Con partition la tabla se particiona por date, por días o por meses:
+        * interval: day o month
+        * premake: número de particiones futuras a crear
+        * retention: antigüedad (30d, 12w...) a partir de la cual se eliminan las particiones ya enviadas
+        * archive_schema: si se indica, las particiones se mueven a este esquema en lugar de eliminarse
+
+    Los registros con fechas fuera de las particiones creadas se guardan en la partición <tabla>_default
+    """
 
     def __init__(self, db_config, db_tablename, cls_item, **kwargs):
 
-        self.connection = None
-        self.connect(db_config)
+        self.pool_config = kwargs.pop('pool_config', {})
+        self.pool = kwargs.pop('pool', None)
+        if not self.pool:
+            self.connect(db_config)
         self.tablename_data = db_tablename
         self.cls = cls_item
         self.window_time = kwargs.pop('window_time', 300)
+        self.prepare = kwargs.pop('prepare', True)
+
+        self._statement_prefix = re.sub(r'\W', '_', self.tablename_data) + '_'
+        self._insert_statements = {}
 
         self._insert_sql = """INSERT INTO """ + self.tablename_data + """(%s) VALUES %s RETURNING uuid"""
         self._find_by_id_sql = """SELECT * FROM """ + self.tablename_data + """ WHERE uuid = ANY(%s)"""
-        self._update_status_sql = """UPDATE """ + self.tablename_data + """ SET sent=%s WHERE uuid = ANY(%s)"""
+        self._update_status_sql = """UPDATE """ + self.tablename_data + \
+                                  """ SET sent=%s, leased_until=NULL WHERE uuid = ANY(%s)"""
+        self._lease_items_to_send_sql = """UPDATE """ + self.tablename_data + \
+                                        """ SET num_attempts = num_attempts + 1, """ + \
+                                        """leased_until = now() + %s * interval '1 second' """ + \
+                                        """WHERE uuid IN (SELECT uuid FROM """ + self.tablename_data + \
+                                        """ WHERE sent IS false AND num_attempts < %s """ + \
+                                        """AND date < now() - %s * interval '1 second' """ + \
+                                        """AND (leased_until IS NULL OR leased_until < now()) """ + \
+                                        """AND (date, uuid) > (%s, %s) """ + \
+                                        """ORDER BY date, uuid LIMIT %s FOR UPDATE SKIP LOCKED) RETURNING *"""
         self._select_items_to_send_sql = """SELECT * FROM """ + self.tablename_data + \
                                          """ WHERE sent IS false AND num_attempts < %s """ + \
                                          """AND date < now() - %s * interval '1 second' """ + \
-                                         """ORDER BY date LIMIT %s"""
+                                         """AND (leased_until IS NULL OR leased_until < now()) """ + \
+                                         """ORDER BY date, uuid"""
+        self._lease_items_sql = """UPDATE """ + self.tablename_data + \
+                                """ SET num_attempts = num_attempts + 1, """ + \
+                                """leased_until = now() + %s * interval '1 second' """ + \
+                                """WHERE uuid = ANY(%s) AND sent IS false """ + \
+                                """AND (leased_until IS NULL OR leased_until < now()) RETURNING *"""
+        self._release_items_sql = """UPDATE """ + self.tablename_data + \
+                                  """ SET num_attempts = num_attempts - 1, leased_until = NULL """ + \
+                                  """WHERE uuid = ANY(%s) AND sent IS false AND leased_until IS NOT NULL"""
+        self._add_lease_column_sql = """ALTER TABLE """ + self.tablename_data + \
+                                     """ ADD COLUMN IF NOT EXISTS leased_until TIMESTAMP WITH TIME ZONE"""
+        self._create_index_to_send_sql = """CREATE INDEX IF NOT EXISTS """ + self._statement_prefix + \
+                                         """to_send_idx ON """ + self.tablename_data + \
+                                         """ (date, uuid) WHERE sent IS false"""
+
+        self.lease_time = kwargs.pop('lease_time', 600)
+        self._last_seen = KEYSET_START
+
+        self.partition = kwargs.pop('partition', None)
+        if self.partition:
+            self.partition_interval = PARTITION_INTERVALS[self.partition.get('interval', 'month')]
+            self.partition_premake = self.partition.get('premake', 2)
+            self.partition_retention = self.partition.get('retention', None)
+            self.partition_archive_schema = self.partition.get('archive_schema', None)
+
+        if kwargs.pop('prepare_schema', True):
+            self.prepare_schema()
 
     def connect(self, db_config):
         logger.debug("Connecting to database")
-        self.connection = psycopg2.connect(**db_config)
+        if self.pool:
+            self.pool.closeall()
+        self.pool = ConnectionPool(db_config, **self.pool_config)
+
+    def close(self):
+        self.pool.closeall()
+
+    def prepare_schema(self):
+        """ Crea, si no existen, la columna con la reserva de los registros en envío y el índice parcial
+        sobre los registros pendientes de enviar. Si está configurado el particionado, convierte la tabla
+        en una tabla particionada y crea las particiones futuras """
+        def prepare(cur):
+            cur.execute(self._add_lease_column_sql)
+            if self.partition and not self._is_partitioned(cur):
+                self._partition_table(cur)
+            if self.partition:
+                self._create_unique_uuid_trigger(cur)
+            cur.execute(self._create_index_to_send_sql)
+
+        try:
+            self.run(prepare)
+            if self.partition:
+                self.create_partitions()
+        except DatabaseError:
+            logger.warning("No prepare schema in table %s", self.tablename_data, exc_info=True)
+
+    def _is_partitioned(self, cur) -> bool:
+        cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", (self.tablename_data,))
+        return cur.fetchone() is not None
+
+    def _partition_table(self, cur):
+        """ Convierte la tabla en una tabla particionada por date. Los datos existentes se conservan en la
+        partición <tabla>_legacy, que abarca hasta el final del periodo del registro más reciente """
+        logger.info("Partitioning table %s", self.tablename_data)
+        legacy = self.tablename_data + '_legacy'
+        cur.execute("SELECT max(date) FROM " + self.tablename_data)
+        max_date = cur.fetchone()[0]
+
+        cur.execute("DROP INDEX IF EXISTS " + self._table_schema(cur) + "." + self._statement_prefix + "to_send_idx")
+        cur.execute("ALTER TABLE " + self.tablename_data + " RENAME TO " + legacy.split('.')[-1])
+        cur.execute("CREATE TABLE " + self.tablename_data + " (LIKE " + legacy +
+                    " INCLUDING DEFAULTS) PARTITION BY RANGE (date)")
+        cur.execute("ALTER TABLE " + self.tablename_data + " ADD PRIMARY KEY (uuid, date)")
+        if max_date is None:
+            cur.execute("DROP TABLE " + legacy)
+        else:
+            cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'p'",
+                        (legacy,))
+            for row in cur.fetchall():
+                cur.execute("ALTER TABLE " + legacy + " DROP CONSTRAINT " + row['conname'])
+            cur.execute("ALTER TABLE " + self.tablename_data + " ATTACH PARTITION " + legacy +
+                        " FOR VALUES FROM (MINVALUE) TO (%s)",
+                        (self._period_start(max_date) + self.partition_interval,))
+
+    def _table_schema(self, cur) -> str:
+        cur.execute("SELECT quote_ident(n.nspname) FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                    "WHERE c.oid = %s::regclass", (self.tablename_data,))
+        return cur.fetchone()[0]
+
+    def _create_unique_uuid_trigger(self, cur):
+        """ La clave primaria de la tabla particionada es (uuid, date), porque debe incluir la columna de
+        particionado, así que la unicidad de uuid se comprueba con un trigger que lanza unique_violation,
+        igual que lo haría la clave primaria de la tabla sin particionar """
+        name = self._table_schema(cur) + "." + self._statement_prefix + "unique_uuid"
+        cur.execute("CREATE OR REPLACE FUNCTION " + name + "() RETURNS trigger AS $$ BEGIN "
+                    "IF EXISTS (SELECT 1 FROM " + self.tablename_data +
+                    " WHERE uuid = NEW.uuid AND date <> NEW.date) THEN "
+                    "RAISE unique_violation USING MESSAGE = 'duplicate uuid ' || NEW.uuid; "
+                    "END IF; RETURN NULL; END $$ LANGUAGE plpgsql")
+        cur.execute("SELECT 1 FROM pg_trigger WHERE tgrelid = %s::regclass AND tgname = %s",
+                    (self.tablename_data, self._statement_prefix + "unique_uuid",))
+        if cur.fetchone() is None:
+            cur.execute("CREATE TRIGGER " + self._statement_prefix + "unique_uuid AFTER INSERT ON " +
+                        self.tablename_data + " FOR EACH ROW EXECUTE FUNCTION " + name + "()")
+
+    def _period_start(self, date: datetime) -> datetime:
+        start = date.astimezone(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.partition.get('interval', 'month') == 'month':
+            start = start.replace(day=1)
+        return start
+
+    def partitions(self) -> List:
+        """ Retorna la lista de particiones de la tabla como tuplas (nombre, inicio, fin). El inicio de la
+        partición con los datos anteriores al particionado es None. No incluye la partición por defecto """
+        def select(cur):
+            cur.execute("SELECT c.oid::regclass::text AS name, pg_get_expr(c.relpartbound, c.oid) AS bound "
+                        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                        "WHERE i.inhparent = %s::regclass", (self.tablename_data,))
+            return cur.fetchall()
+
+        partitions = []
+        for row in self.run(select):
+            if row['bound'] == 'DEFAULT':
+                continue
+            lower, upper = re.search(r"FROM \((.+?)\) TO \((.+?)\)", row['bound']).groups()
+            partitions.append((row['name'],
+                               None if lower == 'MINVALUE' else parser.parse(lower.strip("'")),
+                               parser.parse(upper.strip("'")),))
+
+        return sorted(partitions, key=lambda p: p[2])
+
+    def create_partitions(self, now: datetime = None):
+        """ Crea las particiones del periodo actual y de los premake periodos siguientes, y la partición por
+        defecto, que recoge los registros con fechas sin partición (por ejemplo los de una carga de datos
+        antiguos). Si la partición por defecto tiene registros de un periodo que se va a crear, se mueven a
+        la nueva partición """
+        start = self._period_start(now or datetime.now(tz=timezone.utc))
+        existing = self.partitions()
+        default = self.tablename_data + "_default"
+
+        def create(cur):
+            cur.execute("CREATE TABLE IF NOT EXISTS " + default + " PARTITION OF " + self.tablename_data +
+                        " DEFAULT")
+            period = start
+            for _ in range(0, self.partition_premake + 1):
+                end = period + self.partition_interval
+                if not any((lower is None or lower < end) and period < upper for _, lower, upper in existing):
+                    name = self.tablename_data + "_p" + period.strftime("%Y%m%d")
+                    logger.info("Creating partition %s", name)
+                    cur.execute("CREATE TABLE IF NOT EXISTS " + name + " (LIKE " + self.tablename_data +
+                                " INCLUDING DEFAULTS)")
+                    cur.execute("WITH moved AS (DELETE FROM " + default + " WHERE date >= %s AND date < %s "
+                                "RETURNING *) INSERT INTO " + name + " SELECT * FROM moved", (period, end,))
+                    cur.execute("ALTER TABLE " + self.tablename_data + " ATTACH PARTITION " + name +
+                                " FOR VALUES FROM (%s) TO (%s)", (period, end,))
+                period = end
+
+        self.run(create)
+
+    def apply_retention(self, now: datetime = None, max_attemps=3):
+        """ Elimina, o mueve a archive_schema, las particiones anteriores al periodo de retención en las que
+        no queda ningún registro pendiente de enviar (sin enviar y con intentos disponibles) """
+        if not self.partition_retention:
+            return
+
+        limit = (now or datetime.now(tz=timezone.utc)) - \
+            timedelta(seconds=convert_to_seconds(self.partition_retention))
+
+        for name, _, upper in self.partitions():
+            if upper > limit:
+                continue
+
+            def retire(cur):
+                cur.execute("SELECT 1 FROM " + name + " WHERE sent IS false AND num_attempts < %s LIMIT 1",
+                            (max_attemps,))
+                if cur.fetchone():
+                    logger.warning("Partition %s has items pending to send", name)
+                    return
+                if self.partition_archive_schema:
+                    logger.info("Archiving partition %s", name)
+                    cur.execute("CREATE SCHEMA IF NOT EXISTS " + self.partition_archive_schema)
+                    cur.execute("ALTER TABLE " + self.tablename_data + " DETACH PARTITION " + name)
+                    cur.execute("ALTER TABLE " + name + " SET SCHEMA " + self.partition_archive_schema)
+                else:
+                    logger.info("Dropping partition %s", name)
+                    cur.execute("DROP TABLE " + name)
+
+            self.run(retire)
+
+    def run(self, operation, retries=1):
+        """ Ejecuta operation(cursor) en una transacción con la conexión del hilo actual y retorna su resultado.
+        Si la conexión se ha perdido, se descarta y la operación se reintenta con una conexión nueva. Al
+        terminar la conexión se devuelve al pool, salvo que el hilo ya la tuviera antes de empezar """
+        while True:
+            checked_out = self.pool.is_checked_out()
+            conn = self.pool.getconn()
+            try:
+                with conn.cursor(cursor_factory=DictCursor) as cur:
+                    result = operation(cur)
+                conn.commit()
+                return result
+            except DatabaseError:
+                if not conn.closed:
+                    conn.rollback()
+                    raise
+                self.pool.discard(conn)
+                if retries <= 0:
+                    raise
+                retries -= 1
+                logger.warning("Lost connection to database, retrying")
+            finally:
+                if not checked_out and not conn.closed:
+                    self.pool.putconn(conn)
 
     def save(self, item: BaseItem) -> BaseItem:
         """ Inserta un nuevo registro en la base de datos """
+        columns = self.__get_column_names(item)
+        name, sql = self.__get_insert_statement(columns)
+
+        def insert(cur):
+            self.execute(cur, name, sql, self.__get_values(item))
+            return cur.fetchone()[0]
+
         try:
-            with self.get_cursor() as cur:
-                sql = self.create_insert_sql(item, cur)
-                cur.execute(sql)
-                item.id = cur.fetchone()[0]
-            self.connection.commit()
+            item.uuid = self.run(insert)
         except IntegrityError as e:
             if e.pgcode == errorcodes.UNIQUE_VIOLATION:
                 logger.warning("The data exists in database yet")
@@ -55,43 +527,161 @@ class DeviceDB(object):
 
         return item
 
+    def save_many(self, items: List[BaseItem]) -> List[BaseItem]:
+        """ Inserta un lote de registros en la base de datos con una única sentencia y un único commit.
+        Si algún registro ya existe, el lote se inserta registro a registro para no perder el resto """
+        items = list(items)
+        if not len(items):
+            return items
+
+        def insert_many(cur):
+            cur.execute(self.create_insert_many_sql(items, cur))
+            return [row[0] for row in cur.fetchall()]
+
+        try:
+            uuids = self.run(insert_many)
+            for item, uuid in zip(items, uuids):
+                item.uuid = uuid
+        except IntegrityError as e:
+            if e.pgcode == errorcodes.UNIQUE_VIOLATION:
+                logger.warning("Some data exists in database yet, inserting one by one")
+                items = [self.save(item) for item in items]
+            else:
+                logger.exception("No insert data", exc_info=e)
+        except DatabaseError as e:
+            logger.exception("No insert data", exc_info=e)
+
+        return items
+
+    def bulk_load(self, items: Iterable[BaseItem], merge=False) -> BulkLoadStats:
+        """ Inserta los items con COPY ... FROM STDIN, leyéndolos del iterable según se envían.
+        Con merge se copian a una tabla temporal y se insertan en la tabla descartando los uuid repetidos,
+        tanto dentro de la carga como los que ya existían en la tabla """
+        items = iter(items)
+        first = next(items, None)
+        if first is None:
+            return BulkLoadStats()
+
+        columns = self.__get_column_names(first)
+        source = CopySource(chain([first], items), [field.name for field in type(first)._fields])
+        copy_sql = """COPY %s (""" + ','.join(columns) + """) FROM STDIN WITH (FORMAT csv)"""
+
+        def copy(cur):
+            if not merge:
+                cur.copy_expert(copy_sql % (self.tablename_data,), source)
+                return cur.rowcount
+
+            staging = self._statement_prefix + 'staging'
+            cur.execute("CREATE TEMP TABLE " + staging + " (LIKE " + self.tablename_data +
+                        " INCLUDING DEFAULTS) ON COMMIT DROP")
+            cur.copy_expert(copy_sql % (staging,), source)
+            cur.execute("INSERT INTO " + self.tablename_data + " (" + ','.join(columns) + ") " +
+                        "SELECT DISTINCT ON (uuid) " + ','.join(columns) + " FROM " + staging + " s " +
+                        "WHERE NOT EXISTS (SELECT 1 FROM " + self.tablename_data + " t WHERE t.uuid = s.uuid) " +
+                        "ON CONFLICT DO NOTHING")
+            return cur.rowcount
+
+        start = time.perf_counter()
+        inserted = self.run(copy, retries=0)
+        stats = BulkLoadStats(rows=source.rows, inserted=inserted, seconds=time.perf_counter() - start)
+        logger.info("Bulk load %i rows (%i inserted) in %.3f seconds - %.0f rows/s", stats.rows, stats.inserted,
+                    stats.seconds, stats.rows_per_second)
+
+        return stats
+
     def get(self, identifier):
         """ Retorna un registro un registro dado un identificador """
-        with self.get_cursor() as cur:
-            sql = cur.mogrify(self._find_by_id_sql, (identifier,))
-            cur.execute(sql)
-            row = cur.fetchone()
+        def find(cur):
+            self.execute(cur, 'find_by_id', self._find_by_id_sql, (identifier,))
+            return cur.fetchone()
 
-        return row
+        return self.run(find)
 
     def _get_items_to_send(self, *args):
-        """ Retorna la lista de registros nuevos a enviar """
-        with self.get_cursor() as cur:
-            sql = cur.mogrify(self._select_items_to_send_sql, *args)
-            cur.execute(sql)
-            rows = cur.fetchall()
+        """ Retorna la lista de registros nuevos a enviar. En la misma sentencia incrementa el número de
+        intentos y los reserva durante lease_time segundos, de forma que no se vuelven a obtener mientras se
+        envían y varios procesos pueden obtener registros de la misma tabla """
+        def lease(cur):
+            self.execute(cur, 'lease_items_to_send', self._lease_items_to_send_sql, *args)
+            return sorted(cur.fetchall(), key=lambda row: (row['date'], row['uuid']))
+
+        rows = self.run(lease)
 
         items = []
         for row in rows:
-            items.append(self.cls(**row))
+            items.append(self.cls.from_columns(row))
 
         return items
 
     def get_items_to_send(self, **kwargs) -> List[DictRow]:
+        """ Retorna la siguiente página de registros pendientes de enviar. Las páginas se recorren por
+        (date, uuid) a partir del último registro devuelto y, al llegar al final, se vuelve al principio """
 
         window_time = kwargs.pop('window_time', 900)
         max_attemps = kwargs.pop('max_attemps', 3)
         size = kwargs.pop('size', 100)
 
-        return self._get_items_to_send((max_attemps, window_time, size))
+        last_date, last_uuid = self._last_seen
+        items = self._get_items_to_send((self.lease_time, max_attemps, window_time, last_date, last_uuid, size))
+
+        if len(items) < size:
+            self._last_seen = KEYSET_START
+        else:
+            self._last_seen = (items[-1].date, items[-1].uuid)
+
+        return items
+
+    def iter_items_to_send(self, **kwargs) -> Iterator[BaseItem]:
+        """ Retorna un generador con todos los registros pendientes de enviar, del más antiguo al más reciente.
+        Los registros se leen con un cursor en el servidor de itersize en itersize y cada bloque se reserva
+        antes de entregarlo, de forma que la memoria usada no depende del tamaño de la cola de pendientes.
+        Al cerrar el generador se liberan los registros reservados que no se han llegado a entregar """
+
+        window_time = kwargs.pop('window_time', 900)
+        max_attemps = kwargs.pop('max_attemps', 3)
+        itersize = kwargs.pop('itersize', 100)
+
+        conn = self.pool.getconn(name='stream')
+        pending = []
+        try:
+            with conn.cursor(name=self._statement_prefix + 'items_to_send', cursor_factory=DictCursor) as cur:
+                cur.itersize = itersize
+                cur.execute(self._select_items_to_send_sql, (max_attemps, window_time,))
+                while True:
+                    rows = cur.fetchmany(itersize)
+                    if not len(rows):
+                        break
+                    pending = self._lease_items([row['uuid'] for row in rows])
+                    while len(pending):
+                        yield pending.pop(0)
+        finally:
+            if len(pending):
+                self.release_items([item.uuid for item in pending])
+            if conn.closed:
+                self.pool.discard(conn, name='stream')
+            else:
+                conn.rollback()
+                self.pool.putconn(conn, name='stream')
+
+    def _lease_items(self, uuids: List) -> List[BaseItem]:
+        def lease(cur):
+            self.execute(cur, 'lease_items', self._lease_items_sql, (self.lease_time, uuids,))
+            return sorted(cur.fetchall(), key=lambda row: (row['date'], row['uuid']))
+
+        return [self.cls.from_columns(row) for row in self.run(lease)]
+
+    def release_items(self, uuids: List):
+        """ Libera la reserva de los registros para que se puedan volver a entregar sin esperar a lease_time
+        ni gastar un intento """
+        try:
+            self.run(lambda cur: self.execute(cur, 'release_items', self._release_items_sql, (uuids,)))
+        except DatabaseError:
+            logger.exception("No release items")
 
     def update_status(self, uuids: List, status=True):
         if len(uuids):
             try:
-                with self.get_cursor() as cur:
-                    sql = cur.mogrify(self._update_status_sql, (status, uuids))
-                    cur.execute(sql)
-                self.connection.commit()
+                self.run(lambda cur: self.execute(cur, 'update_status', self._update_status_sql, (status, uuids)))
             except DatabaseError:
                 logger.exception("No update data")
 
@@ -101,15 +691,71 @@ class DeviceDB(object):
     def set_failed(self, uuid):
         self.update_status([uuid], status=False)
 
+    def execute(self, cursor, name, sql, params):
+        """ Ejecuta la sentencia sql (con marcadores %s). Si prepare está activo, la sentencia se prepara
+        en el servidor la primera vez que se usa en la conexión y después sólo se envían los parámetros """
+        if not self.prepare:
+            cursor.execute(cursor.mogrify(sql, params))
+            return
+
+        statement = self._statement_prefix + name
+        prepared = cursor.connection.prepared
+        if statement not in prepared:
+            counter = count(1)
+            cursor.execute("PREPARE " + statement + " AS " + re.sub('%s', lambda m: '$%i' % next(counter), sql))
+            prepared.add(statement)
+
+        try:
+            cursor.execute("EXECUTE " + statement + " (" + ",".join(["%s"] * len(params)) + ")", params)
+        except DatabaseError as e:
+            if e.pgcode == errorcodes.INVALID_SQL_STATEMENT_NAME:
+                prepared.clear()
+            raise
+
+    def __get_insert_statement(self, columns: List[AnyStr]):
+        """ Retorna el nombre y la sentencia de inserción para el conjunto de columnas dado """
+        key = tuple(columns)
+        if key not in self._insert_statements:
+            name = 'insert_%i' % (len(self._insert_statements),)
+            sql = "INSERT INTO " + self.tablename_data + "(" + ",".join(columns) + ") VALUES (" + \
+                  ",".join(["%s"] * len(columns)) + ") RETURNING uuid"
+            self._insert_statements[key] = (name, sql,)
+
+        return self._insert_statements[key]
+
     def create_insert_sql(self, item, cursor):
         columns = self.__get_column_names(item)
-        values = [getattr(item, column) for column in columns]
-        sql = cursor.mogrify(self._insert_sql, (AsIs(','.join(columns)), tuple(values)))
+        sql = cursor.mogrify(self._insert_sql, (AsIs(','.join(columns)), tuple(self.__get_values(item))))
 
         return sql
 
+    def create_insert_many_sql(self, items: List[BaseItem], cursor):
+        columns = self.__get_column_names(items[0])
+        rows = [cursor.mogrify("%s", (tuple(self.__get_values(item)),)) for item in items]
+        sql = cursor.mogrify(self._insert_sql, (AsIs(','.join(columns)), AsIs(b','.join(rows).decode())))
+
+        return sql
+
+    @contextmanager
     def get_cursor(self):
-        return self.connection.cursor(cursor_factory=psycopg2.extras.DictCursor)
+        """ Cursor sobre una conexión del pool. Al salir del bloque se confirma la transacción, o se deshace si
+        hay un error, y la conexión se devuelve al pool """
+        checked_out = self.pool.is_checked_out()
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor(cursor_factory=DictCursor) as cur:
+                yield cur
+            conn.commit()
+        except DatabaseError:
+            if not conn.closed:
+                conn.rollback()
+            raise
+        finally:
+            if not checked_out:
+                if conn.closed:
+                    self.pool.discard(conn)
+                else:
+                    self.pool.putconn(conn)
 
     @staticmethod
     def __get_column_names(item: BaseItem) -> List[AnyStr]:
@@ -117,6 +763,9 @@ class DeviceDB(object):
         :param item: BaseItem
         :return: list
         """
-        columns = list(dict(item).keys())
+        return [field.column for field in type(item)._fields]
 
-        return columns
+    @staticmethod
+    def __get_values(item: BaseItem) -> List:
+        """ Retorna los valores del item en el orden de las columnas """
+        return [getattr(item, field.name) for field in type(item)._fields]
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from paho.mqtt.client import MQTT_ERR_SUCCESS
+from psycopg2 import DatabaseError
+
+from buoy.base.device.device import Device
+from buoy.base.device.exceptions import LostConnectionException
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncioMqttLoop(object):
+    """
+    Ejecuta la red del cliente de paho en el bucle de eventos en lugar de en su propio hilo. El socket se
+    registra en el bucle con los callbacks on_socket_* y loop_misc se llama cada segundo
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, client):
+        self.loop = loop
+        self.client = client
+        self.misc = None
+
+        client.on_socket_open = self.on_socket_open
+        client.on_socket_close = self.on_socket_close
+        client.on_socket_register_write = self.on_socket_register_write
+        client.on_socket_unregister_write = self.on_socket_unregister_write
+
+    def call(self, function, *args):
+        """ Ejecuta la función en el bucle, directamente si ya se está en él. Paho puede abrir el socket
+        desde otro hilo, por ejemplo al reconectar desde el executor """
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+
+        if running is self.loop:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def on_socket_open(self, client, userdata, sock):
+        self.call(self._open, sock.fileno())
+
+    def _open(self, fd):
+        self.loop.add_reader(fd, self.client.loop_read)
+        self.misc = self.loop.create_task(self.loop_misc())
+
+    def on_socket_close(self, client, userdata, sock):
+        # El descriptor se toma ahora porque paho cierra el socket nada más volver del callback
+        self.call(self._close, sock.fileno())
+
+    def _close(self, fd):
+        self.loop.remove_reader(fd)
+        if self.misc:
+            self.misc.cancel()
+            self.misc = None
+
+    def on_socket_register_write(self, client, userdata, sock):
+        self.call(self.loop.add_writer, sock.fileno(), self.client.loop_write)
+
+    def on_socket_unregister_write(self, client, userdata, sock):
+        self.call(self.loop.remove_writer, sock.fileno())
+
+    async def loop_misc(self):
+        while self.client.loop_misc() == MQTT_ERR_SUCCESS:
+            await asyncio.sleep(1)
+
+
+class AsyncDevice(Device):
+    """
+    Dispositivo que ejecuta todas las etapas como corrutinas en un único bucle de eventos, en lugar de un
+    hilo por etapa. Los hilos se crean igual que en Device, pero no se arrancan: sirven de configuración y
+    sus métodos (parser del lector, escritura de lotes, envío al broker...) se llaman desde las corrutinas.
+
+    El puerto serie se lee cuando el bucle indica que hay datos, las llamadas a la base de datos se ejecutan
+    en un executor y el cliente MQTT usa el socket del bucle
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.executor_workers = kwargs.pop('executor_workers', 4)
+        super(AsyncDevice, self).__init__(*args, **kwargs)
+
+        self.loop = None
+        self.executor = None
+        self.tasks = []
+        self.mqtt_loop = None
+
+    def _create_queues(self):
+        self.queues = {}
+
+    def _create_async_queues(self):
+        for queue_name in ['notice', 'write_data', 'save_data', 'send_data']:
+            qsize = 0
+            if queue_name == 'send_data':
+                qsize = self.qsize_send_data
+            self.queues[queue_name] = asyncio.Queue(maxsize=qsize)
+
+    def run(self):
+        asyncio.run(self.run_async())
+
+    async def run_async(self):
+        self.loop = asyncio.get_running_loop()
+        self.executor = ThreadPoolExecutor(max_workers=self.executor_workers)
+        self._create_async_queues()
+        try:
+            self.connect()
+            self._create_threads()
+            self._start_tasks()
+            self.configure()
+            await self._listener_exceptions_async()
+        except Exception as ex:
+            logger.error(ex)
+            raise ex
+        finally:
+            await self._stop_tasks()
+            self.executor.shutdown(wait=True)
+
+    def _start_tasks(self):
+        if hasattr(self, '_thread_reader'):
+            self.loop.add_reader(self._dev_connection.fileno(), self.read)
+        if hasattr(self, '_thread_writer'):
+            self.tasks.append(self.loop.create_task(self.write_stage()))
+        if hasattr(self, '_thread_save'):
+            self.tasks.append(self.loop.create_task(self.save_stage()))
+        if hasattr(self, '_thread_reader_from_db'):
+            self.tasks.append(self.loop.create_task(self.resend_stage()))
+        if hasattr(self, '_thread_maintenance'):
+            self.tasks.append(self.loop.create_task(self.maintenance_stage()))
+        if hasattr(self, '_thread_send'):
+            self.tasks.append(self.loop.create_task(self.send_stage()))
+        for task in self.tasks:
+            task.add_done_callback(self.notify_task_error)
+
+    def notify_task_error(self, task: asyncio.Task):
+        """ Si una etapa termina por un error, lo notifica para que se detenga el dispositivo """
+        if not task.cancelled() and task.exception():
+            self.queues['notice'].put_nowait(task.exception())
+
+    async def _stop_tasks(self):
+        if hasattr(self, '_thread_reader') and self._dev_connection:
+            self.loop.remove_reader(self._dev_connection.fileno())
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        if hasattr(self, '_thread_save') and self._thread_save.acks:
+            try:
+                await self.run_db(self._thread_save.acks.flush)
+            except DatabaseError:
+                logger.exception("Error saving acks")
+        if hasattr(self, '_thread_send'):
+            self._thread_send.client.disconnect()
+
+    async def _listener_exceptions_async(self):
+        while self.is_open():
+            try:
+                ex = await asyncio.wait_for(self.queues['notice'].get(), timeout=0.2)
+                raise ex
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_db(self, function, *args):
+        """ Ejecuta una llamada a la base de datos en el executor """
+        return await self.loop.run_in_executor(self.executor, function, *args)
+
+    def read(self):
+        """ Lee los datos disponibles en el puerto serie y los procesa con el lector del dispositivo. Se llama
+        cuando el bucle indica que el puerto está listo, así que la lectura no bloquea sea cual sea read_mode """
+        reader = self._thread_reader
+        try:
+            if reader.read_available():
+                reader.process_data()
+        except (OSError, Exception) as ex:
+            logger.error("Device disconnected")
+            self.loop.remove_reader(self._dev_connection.fileno())
+            reader.error(LostConnectionException(exception=ex))
+
+    async def write_stage(self):
+        writer = self._thread_writer
+        queue = self.queues['write_data']
+        while True:
+            data = await queue.get()
+            try:
+                self._dev_connection.write(data.encode())
+                logger.info("Write data in device - " + data)
+            except OSError as ex:
+                logger.error("Device disconnected")
+                writer.error(LostConnectionException(exception=ex))
+            queue.task_done()
+
+    async def save_stage(self):
+        save = self._thread_save
+        queue = self.queues['save_data']
+        while True:
+            items = [await queue.get()]
+            deadline = self.loop.time() + save.max_latency / 1000
+            while len(items) < save.batch_size:
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self.run_db(save.write, items)
+                if save.acks and save.acks.is_ready():
+                    await self.run_db(save.acks.flush)
+            except DatabaseError:
+                logger.exception("Error saving items")
+            for _ in items:
+                queue.task_done()
+
+    async def resend_stage(self):
+        resend = self._thread_reader_from_db
+        queue = self.queues['send_data']
+        while True:
+            if not queue.full():
+                try:
+                    items = await self.run_db(partial(resend.db.get_items_to_send, size=resend.free_slots()))
+                except DatabaseError:
+                    logger.exception("Error reading items to send")
+                    items = []
+                for item in items:
+                    await queue.put(item)
+            await asyncio.sleep(resend.timeout_wait)
+
+    async def maintenance_stage(self):
+        maintenance = self._thread_maintenance
+        while True:
+            await self.run_db(maintenance.activity)
+            await asyncio.sleep(maintenance.timeout_wait)
+
+    def connect_to_mqtt(self, sender):
+        """ Prepara el cliente MQTT para usar el bucle de eventos para la red. La conexión la abre send_stage
+        con reconnect_to_mqtt, de modo que si el broker no está disponible se reintenta con espera """
+        client = sender.client
+        client.on_connect = sender.on_connect
+        client.on_disconnect = sender.on_disconnect
+        client.on_publish = sender.on_publish
+        self.mqtt_loop = AsyncioMqttLoop(self.loop, client)
+        client.connect_async(host=sender.broker_url, port=sender.broker_port, keepalive=sender.keepalive)
+
+    async def reconnect_to_mqtt(self, sender, delay):
+        """ Reconecta con el broker desde el executor, doblando la espera tras cada intento fallido """
+        try:
+            await self.loop.run_in_executor(self.executor, sender.client.reconnect)
+            return sender.reconnect_delay["min_delay"]
+        except OSError:
+            logger.warning("Can't reconnect to broker, retrying in %i seconds", delay)
+            await asyncio.sleep(delay)
+            return min(delay * 2, sender.reconnect_delay["max_delay"])
+
+    async def send_stage(self):
+        sender = self._thread_send
+        queue = self.queues['send_data']
+        self.connect_to_mqtt(sender)
+        delay = sender.reconnect_delay["min_delay"]
+        while True:
+            sender.fail_items(sender.limbo.expire())
+            if sender.client.socket() is None:
+                delay = await self.reconnect_to_mqtt(sender, delay)
+                continue
+            if not sender.is_connected_to_mqtt() or sender.limbo.is_full():
+                await asyncio.sleep(sender.timeout_wait)
+                continue
+
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=sender.timeout_wait)
+            except asyncio.TimeoutError:
+                continue
+
+            items = [item]
+            while not queue.empty() and len(items) < sender.batch_size:
+                items.append(queue.get_nowait())
+
+            if sender.batch_size > 1:
+                sender.send_many(items)
+            else:
+                for item in items:
+                    sender.send(item)
+            for _ in items:
+                queue.task_done()
@@ -5,6 +5,7 @@ from queue import Queue, Empty
 
 from serial import Serial, SerialException
 
+from buoy.base.device.threads.maintenance import MaintenanceThread
 from buoy.base.device.threads.mqtt import MqttThread
 from buoy.base.device.threads.resender import DBToSendThread
 from buoy.base.device.threads.save import SaveThread
@@ -22,8 +23,12 @@ class Device(object):
         self.reader_conf = kwargs.pop('reader', {})
         self.cls_writer = kwargs.pop('cls_writer', None)
         self.cls_save = kwargs.pop('cls_save', SaveThread)
+        self.save_conf = kwargs.pop('save', {})
         self.cls_send = kwargs.pop('cls_send', MqttThread)
         self.cls_reader_from_db = kwargs.pop('cls_reader_from_db', DBToSendThread)
+        self.resend_conf = kwargs.pop('resend', {})
+        self.cls_maintenance = kwargs.pop('cls_maintenance', MaintenanceThread)
+        self.maintenance_conf = kwargs.pop('maintenance', {})
         self.mqtt_conf = kwargs.pop('mqtt', None)
 
         self.qsize_send_data = kwargs.pop('qsize_send_data', 1000)
@@ -75,11 +80,17 @@ class Device(object):
         if self.cls_save:
             self._thread_save = self.cls_save(queue_save_data=self.queues['save_data'],
                                               queue_notice=self.queues['notice'],
-                                              db=self.db)
+                                              db=self.db,
+                                              **self.save_conf)
         if self.cls_reader_from_db:
-            self._thread_send = self.cls_reader_from_db(queue_send_data=self.queues['send_data'],
-                                                        queue_notice=self.queues['notice'],
-                                                        db=self.db)
+            self._thread_reader_from_db = self.cls_reader_from_db(queue_send_data=self.queues['send_data'],
+                                                                  queue_notice=self.queues['notice'],
+                                                                  db=self.db,
+                                                                  **self.resend_conf)
+        if self.cls_maintenance and getattr(self.db, 'partition', None):
+            self._thread_maintenance = self.cls_maintenance(queue_notice=self.queues['notice'],
+                                                            db=self.db,
+                                                            **self.maintenance_conf)
         if self.cls_send:
             self._thread_send = self.cls_send(queue_send_data=self.queues['send_data'],
                                               queue_data_sent=self.queues['save_data'],
@@ -91,7 +102,7 @@ class Device(object):
 
     def _run_action_threads(self, action='start'):
         prefix = '_thread_'
-        names = ['reader', 'writer', 'save', 'send', 'reader_from_db']
+        names = ['reader', 'writer', 'save', 'send', 'reader_from_db', 'maintenance']
 
         for name in names:
             field = prefix + name
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import selectors
+import time
+from queue import Queue, Empty
+from typing import List
+
+from buoy.base.database import ConnectionPool
+from buoy.base.device.device import Device
+from buoy.base.device.exceptions import LostConnectionException
+from buoy.base.device.threads.base import BaseThread
+from buoy.base.device.threads.mqtt import MqttConnection
+from buoy.base.device.threads.reader import DeviceReader
+
+logger = logging.getLogger(__name__)
+
+
+class MultiPortReader(BaseThread):
+    """
+    Hilo que lee varios puertos serie a la vez. Los puertos se registran en un selector y, cuando alguno tiene
+    datos, se leen y se procesan con el DeviceReader de su dispositivo. Un puerto con error se quita del
+    selector y el error se notifica en la cola de su dispositivo
+    """
+
+    def __init__(self, queue_notice: Queue = None, **kwargs):
+        super(MultiPortReader, self).__init__(queue_notice or Queue(), timeout_wait=kwargs.pop('timeout_wait', 1))
+        self.selector = selectors.DefaultSelector()
+
+    def register(self, reader: DeviceReader):
+        reader.active = True
+        self.selector.register(reader.device.fileno(), selectors.EVENT_READ, reader)
+
+    def unregister(self, reader: DeviceReader):
+        """ Deja de leer el puerto del lector, si no se ha quitado ya por un error """
+        try:
+            self.selector.unregister(reader.device.fileno())
+        except (KeyError, ValueError, OSError):
+            pass
+
+    def size(self) -> int:
+        return len(self.selector.get_map())
+
+    def activity(self):
+        if not self.size():
+            time.sleep(self.timeout_wait)
+            return
+
+        for key, _ in self.selector.select(timeout=self.timeout_wait):
+            self.read(key)
+
+    def read(self, key: selectors.SelectorKey):
+        reader = key.data
+        try:
+            if reader.read_available():
+                reader.process_data()
+        except (OSError, Exception) as ex:
+            logger.error("Device disconnected")
+            self.selector.unregister(key.fileobj)
+            reader.error(LostConnectionException(exception=ex))
+
+    def wait(self):
+        pass
+
+    def after_activity(self):
+        self.selector.close()
+
+
+class DeviceGroup(object):
+    """
+    Ejecuta varios dispositivos en un único proceso. Los puertos serie se leen todos desde un MultiPortReader
+    en lugar de un hilo lector por dispositivo, y los hilos de envío comparten una única conexión con el
+    broker (MqttConnection) en lugar de una por dispositivo
+
+    Las DeviceDB de los dispositivos usan también un único ConnectionPool: el que se pasa en pool o el que se
+    crea con la configuración db (db_config y los parámetros del pool)
+
+    Si un dispositivo notifica un error se para sólo ese dispositivo y el resto sigue funcionando
+    """
+
+    def __init__(self, devices: List[Device], **kwargs):
+        self.devices = devices
+        self.mqtt_connection = kwargs.pop('mqtt_connection', None)
+        mqtt_conf = kwargs.pop('mqtt', None)
+        if not self.mqtt_connection and mqtt_conf:
+            self.mqtt_connection = MqttConnection(**mqtt_conf)
+        self.pool = kwargs.pop('pool', None)
+        db_conf = kwargs.pop('db', None)
+        if not self.pool and db_conf:
+            self.pool = ConnectionPool(**db_conf)
+
+        self.reader = MultiPortReader(timeout_wait=kwargs.pop('read_timeout', 1))
+        self.readers = {}
+        self.running = []
+        self.active = False
+
+    def run(self):
+        try:
+            self.start()
+            self._listener_exceptions()
+        except Exception as ex:
+            logger.error(ex)
+            raise ex
+        finally:
+            self.stop()
+
+    def start(self):
+        for device in self.devices:
+            if self.mqtt_connection and device.mqtt_conf is not None:
+                device.mqtt_conf = dict(device.mqtt_conf, connection=self.mqtt_connection)
+            if self.pool:
+                self.share_pool(device.db)
+            device.connect()
+            device._create_threads()
+            if hasattr(device, '_thread_reader'):
+                self.readers[device] = device._thread_reader
+                self.reader.register(device._thread_reader)
+                # El lector lo ejecuta el MultiPortReader, el dispositivo no debe arrancarlo
+                del device._thread_reader
+            device._start_threads()
+            self.running.append(device)
+            device.configure()
+
+        self.active = True
+        self.reader.start()
+
+    def _listener_exceptions(self):
+        while self.is_active() and len(self.running):
+            for device in list(self.running):
+                try:
+                    ex = device.queues['notice'].get_nowait()
+                except Empty:
+                    continue
+                logger.error("Error in device %s: %s", device.name, ex)
+                self.stop_device(device)
+            time.sleep(0.2)
+
+    def stop_device(self, device: Device):
+        """ Para los hilos de un dispositivo y cierra su puerto, sin afectar al resto """
+        logger.info("Stopping device %s", device.name)
+        if device in self.running:
+            self.running.remove(device)
+        if device in self.readers:
+            self.reader.unregister(self.readers[device])
+        device._stop_threads()
+        if device._dev_connection:
+            device._dev_connection.close()
+
+    def share_pool(self, db):
+        """ Sustituye el pool de la DeviceDB del dispositivo por el del grupo """
+        if db is None or db.pool is self.pool:
+            return
+        if db.pool:
+            db.pool.closeall()
+        db.pool = self.pool
+
+    def is_active(self):
+        return self.active
+
+    def stop(self):
+        self.active = False
+        self.reader.stop()
+        if self.reader.is_alive():
+            self.reader.join()
+        for device in list(self.running):
+            self.stop_device(device)
@@ -1,14 +1,18 @@
 # -*- coding: utf-8 -*-
 
+import asyncio
 import logging
 import time
-from queue import Queue
+from queue import Queue, Full
 from threading import Thread
 
 from serial import Serial
 
 logger = logging.getLogger(__name__)
 
+# Excepciones de una cola llena. AsyncDevice pasa a los hilos colas de asyncio, que lanzan QueueFull
+QUEUE_FULL = (Full, asyncio.QueueFull)
+
 
 class BaseThread(Thread):
     def __init__(self, queue_notice: Queue, **kwargs):
@@ -23,7 +27,7 @@ class BaseThread(Thread):
         self.active = True
         while self.is_active():
             self.activity()
-            time.sleep(self.timeout_wait)
+            self.wait()
         self.after_activity()
 
     def is_active(self) -> bool:
@@ -47,6 +51,13 @@ class BaseThread(Thread):
         """
         pass
 
+    def wait(self):
+        """
+        Espera entre dos ejecuciones de activity. Los hilos que esperan dentro de activity, por ejemplo
+        bloqueados en una cola, pueden sobrescribirla para no esperar de más
+        """
+        time.sleep(self.timeout_wait)
+
     def stop(self):
         """ Para el hilo """
         self.active = False
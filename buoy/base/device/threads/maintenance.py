@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from queue import Queue
+from threading import Event
+
+from psycopg2 import DatabaseError
+
+from buoy.base.database import DeviceDB
+from buoy.base.device.threads.base import BaseThread
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceThread(BaseThread):
+    """
+    Clase encargada de las tareas periódicas de mantenimiento de la base de datos: crear las particiones
+    futuras y aplicar la retención a las antiguas
+    """
+
+    def __init__(self, db: DeviceDB, queue_notice: Queue, **kwargs):
+        super(MaintenanceThread, self).__init__(queue_notice,
+                                                timeout_wait=kwargs.pop('timeout_wait', 3600))
+        self.db = db
+        self.stopped = Event()
+
+    def activity(self):
+        try:
+            self.db.create_partitions()
+            self.db.apply_retention()
+        except DatabaseError:
+            logger.exception("Error in database maintenance")
+
+    def wait(self):
+        """ Espera hasta la siguiente ejecución o hasta que se pare el hilo """
+        self.stopped.wait(self.timeout_wait)
+
+    def stop(self):
+        super(MaintenanceThread, self).stop()
+        self.stopped.set()
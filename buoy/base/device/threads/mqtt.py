@@ -1,42 +1,103 @@
 # -*- coding: utf-8 -*-
 
+import time
 from queue import Queue, Empty
-from threading import Thread
+from collections import deque
+from threading import Thread, Lock, Condition, local
 
 from paho.mqtt.client import *
 
+from buoy.base.data.codec import get_codec, get_compressor, compress
 from buoy.base.data.item import ItemQueue, Status
-from buoy.base.device.threads.base import BaseThread
+from buoy.base.device.threads.base import BaseThread, QUEUE_FULL
 
 logger = logging.getLogger(__name__)
 
 
 class Limbo(object):
-    def __init__(self):
+    """
+    Mensajes publicados pendientes de confirmar por el broker. Con max_size limita el número de mensajes
+    en vuelo y con timeout (segundos) cada mensaje caduca si no se confirma a tiempo. A release se le pasan
+    los identificadores que salen del limbo sin confirmar, al caducar o al vaciarlo
+    """
+
+    def __init__(self, **kwargs):
         self.items = dict()
+        self.deadlines = dict()
+        self.max_size = kwargs.pop('max_size', None)
+        self.timeout = kwargs.pop('timeout', None)
+        self.release = kwargs.pop('release', None)
+        self.lock = Lock()
+        self.not_full = Condition(self.lock)
 
     def add(self, id, item):
         logger.debug("Add item %s with id %s to limbo" % (item, id,))
-        self.items[id] = item
+        with self.lock:
+            self.items[id] = item
+            if self.timeout is not None:
+                self.deadlines[id] = time.monotonic() + self.timeout
 
     def clear(self):
-        self.items.clear()
+        self.pop_all()
 
     def get(self, id):
-        if self.exists(id):
-            return self.items[id]
-        return None
+        return self.items.get(id)
 
     def pop(self, id):
-        item = self.get(id)
-        if item:
-            del self.items[id]
+        with self.lock:
+            item = self.items.pop(id, None)
+            self.deadlines.pop(id, None)
+            self.not_full.notify_all()
         logger.debug("Remove item %s with id %s to limbo" % (item, id,))
         return item
 
+    def pop_all(self, keep=None) -> list:
+        """ Vacía el limbo y retorna los elementos que contenía. Con keep se conservan los elementos cuyo
+        identificador cumple keep(id) """
+        with self.lock:
+            ids = [id for id in self.items.keys() if not (keep and keep(id))]
+            items = [self.items.pop(id) for id in ids]
+            for id in ids:
+                self.deadlines.pop(id, None)
+            self.not_full.notify_all()
+        self.release_ids(ids)
+        return items
+
+    def expire(self, now=None) -> list:
+        """ Saca del limbo y retorna los elementos cuyo plazo ha vencido """
+        now = now or time.monotonic()
+        ids = []
+        expired = []
+        with self.lock:
+            for id, deadline in list(self.deadlines.items()):
+                if deadline > now:
+                    break
+                del self.deadlines[id]
+                ids.append(id)
+                expired.append(self.items.pop(id))
+            if len(expired):
+                self.not_full.notify_all()
+        if len(expired):
+            logger.warning("Expired %i items in limbo", len(expired))
+            self.release_ids(ids)
+        return expired
+
+    def release_ids(self, ids):
+        if self.release:
+            for id in ids:
+                self.release(id)
+
     def size(self):
         return len(self.items)
 
+    def is_full(self):
+        return self.max_size is not None and self.size() >= self.max_size
+
+    def wait_not_full(self, timeout):
+        """ Espera como máximo timeout segundos a que haya hueco en el limbo """
+        with self.not_full:
+            return self.not_full.wait_for(lambda: not self.is_full(), timeout)
+
     def exists(self, id):
         return id in self.items
 
@@ -48,6 +109,9 @@ def loop(client):
 class MqttThread(BaseThread):
     """
     Clase base encargada de enviar los datos al servidor
+
+    El hilo espera bloqueado en la cola de envío y, cada vez que despierta, publica todos los elementos
+    disponibles mientras quede hueco en el limbo
     """
 
     def __init__(self, queue_send_data: Queue, queue_data_sent: Queue, queue_notice: Queue, **kwargs):
@@ -71,21 +135,42 @@ class MqttThread(BaseThread):
         self.keepalive = kwargs.pop("keepalive", 60)
         self.reconnect_delay = kwargs.pop("reconnect_delay", {"min_delay": 1, "max_delay": 120})
 
-        self.client = MqttClient(client_id=self.client_id, protocol=self.protocol, clean_session=self.clean_session)
+        self.limbo = Limbo(max_size=kwargs.pop("max_inflight", 100), timeout=kwargs.pop("inflight_timeout", 60),
+                           release=self.release_mid)
+        self.requeue_on_disconnect = kwargs.pop("requeue_on_disconnect", False)
 
-        self.limbo = Limbo()
+        self.connection = kwargs.pop("connection", None)
+        if self.connection:
+            self.mids = self.connection.mids
+            self.client = self.connection.client
+        else:
+            self.mids = MidAllocator()
+            self.client = MqttClient(client_id=self.client_id, protocol=self.protocol,
+                                     clean_session=self.clean_session, mids=self.mids)
+            self.client.max_inflight_messages_set(self.limbo.max_size)
 
-        if "username" in kwargs:
-            self.username = kwargs.pop("username", "username")
-            self.password = kwargs.pop("password", None)
-            self.client.username_pw_set(self.username, self.password)
+            if "username" in kwargs:
+                self.username = kwargs.pop("username", "username")
+                self.password = kwargs.pop("password", None)
+                self.client.username_pw_set(self.username, self.password)
 
         self.qos = kwargs.pop("qos", 0)
+        self.codec = get_codec(kwargs.pop("payload_format", "json"))
+        self.batch_size = kwargs.pop("batch_size", 1)
+        self.max_latency = kwargs.pop("max_latency", 500)
+
+        compression = kwargs.pop("compression", None)
+        self.compressor = get_compressor(compression) if compression else None
+        self.compression_min_size = kwargs.pop("compression_min_size", 128)
 
     def before_activity(self):
         self.connect_to_mqtt()
 
     def connect_to_mqtt(self):
+        if self.connection:
+            self.connection.register(self)
+            return
+
         logger.info("Try to connect to broker")
         self.client.connect(host=self.broker_url, port=self.broker_port, keepalive=self.keepalive)
         self.client.on_connect = self.on_connect
@@ -96,14 +181,47 @@ class MqttThread(BaseThread):
         self.thread_mqtt.start()
 
     def activity(self):
-        if self.is_connected_to_mqtt():
+        # Los identificadores de los mensajes caducados se liberan con release_mid, salvo los que paho sigue
+        # reenviando, que se liberan cuando llega su confirmación
+        self.fail_items(self.limbo.expire())
+
+        if not self.is_connected_to_mqtt():
+            return
+
+        if self.limbo.is_full():
+            logger.debug("Limbo is full, waiting for broker confirmations")
+            return
+
+        if self.batch_size > 1:
+            items = self.drain()
+            while len(items):
+                self.send_many(items)
+                for _ in items:
+                    self.queue_send_data.task_done()
+                items = [] if self.limbo.is_full() else self.drain(timeout=0)
+        else:
             try:
-                item = self.queue_send_data.get_nowait()
-                self.send(item)
-                self.queue_send_data.task_done()
+                item = self.queue_send_data.get(timeout=self.timeout_wait)
             except Empty:
                 logger.debug("No data for sending to broker")
-                pass
+                return
+
+            while item is not None:
+                self.send(item)
+                self.queue_send_data.task_done()
+                item = None if self.limbo.is_full() else self.get_nowait()
+
+    def get_nowait(self):
+        try:
+            return self.queue_send_data.get_nowait()
+        except Empty:
+            return None
+
+    def wait(self):
+        if not self.is_connected_to_mqtt():
+            time.sleep(self.timeout_wait)
+        elif self.limbo.is_full():
+            self.limbo.wait_not_full(self.timeout_wait)
 
     def is_connected_to_mqtt(self):
         return self.__connected_to_mqtt
@@ -113,18 +231,104 @@ class MqttThread(BaseThread):
 
         :param item:
         """
-        json = str(item.to_json())
-        logger.info("Publish data '%s' to topic '%s'" % (self.topic_data, json))
+        payload = self.compress(self.codec.encode(item), type(item))
+        logger.info("Publish data '%s' to topic '%s'" % (self.topic_data, payload))
+        mid = None
         try:
-            self.limbo.add(item.uuid, item)
-            self.client.publish(self.topic_data, json, qos=self.qos, mid=item.uuid)
+            mid = self.mids.allocate()
+            self.limbo.add(mid, item)
+            self.client.publish(self.topic_data, payload, qos=self.qos, mid=mid)
         except ValueError:
             logger.warning("Can't sent item", exc_info=True)
-            self.limbo.pop(item.uuid)
+            if mid is not None:
+                self.limbo.pop(mid)
+                self.mids.release(mid)
             self.queue_data_sent.put_nowait(ItemQueue(data=item, status=Status.FAILED))
-            pass
+
+    def drain(self, timeout=None):
+        """ Extrae de la cola hasta batch_size elementos, esperando como máximo timeout segundos (por defecto
+        timeout_wait) al primero y max_latency milisegundos desde el primero al resto """
+        items = []
+        try:
+            items.append(self.queue_send_data.get(timeout=self.timeout_wait if timeout is None else timeout))
+        except Empty:
+            logger.debug("No data for sending to broker")
+            return items
+
+        deadline = time.monotonic() + self.max_latency / 1000
+        while len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self.queue_send_data.get(timeout=timeout))
+            except Empty:
+                break
+
+        return items
+
+    def send_many(self, items):
+        """ Publica un lote de items en un único mensaje. El lote se guarda en el limbo con el identificador
+        del mensaje y, cuando el broker confirma el mensaje, se marcan todos como enviados
+
+        :param items:
+        """
+        logger.info("Publish %i items to topic '%s'" % (len(items), self.topic_data,))
+        mid = None
+        try:
+            payload = self.compress(self.codec.encode_many(items), type(items[0]))
+            mid = self.mids.allocate()
+            self.limbo.add(mid, items)
+            self.client.publish(self.topic_data, payload, qos=self.qos, mid=mid)
+        except ValueError:
+            logger.warning("Can't sent items", exc_info=True)
+            if mid is not None:
+                self.limbo.pop(mid)
+                self.mids.release(mid)
+            for item in items:
+                self.queue_data_sent.put_nowait(ItemQueue(data=item, status=Status.FAILED))
+
+    def release_mid(self, mid):
+        """ Devuelve al MidAllocator el identificador de un mensaje que ha salido del limbo sin confirmar. Con
+        QoS 0 paho no guarda el mensaje y al reconectar descarta los pendientes, así que se libera siempre; con
+        QoS mayor sólo si paho ya no lo tiene, si no on_publish lo liberará cuando llegue la confirmación """
+        if not self.is_held_by_client(mid):
+            self.mids.release(mid)
+
+    def compress(self, payload, cls):
+        if self.compressor:
+            payload = compress(payload, cls, self.compressor, min_size=self.compression_min_size)
+
+        return payload
+
+    def fail_items(self, entries):
+        """ Marca como fallidos los elementos de las entradas del limbo dadas """
+        for entry in entries:
+            for item in entry if isinstance(entry, list) else [entry]:
+                self.queue_data_sent.put_nowait(ItemQueue(data=item, status=Status.FAILED))
+
+    def requeue_items(self, entries):
+        """ Devuelve a la cola de envío los elementos de las entradas del limbo dadas. Si la cola se llena,
+        los que no caben se marcan como fallidos para que se reenvíen desde la base de datos """
+        items = [item for entry in entries for item in (entry if isinstance(entry, list) else [entry])]
+        for index, item in enumerate(items):
+            try:
+                self.queue_send_data.put_nowait(item)
+            except QUEUE_FULL:
+                logger.warning("Send queue is full, %i items marked as failed", len(items) - index)
+                self.fail_items(items[index:])
+                return
+
+    def is_held_by_client(self, mid) -> bool:
+        """ Indica si paho guarda el mensaje para reenviarlo él mismo al reconectar, como hace con QoS > 0 """
+        return self.qos > 0 and mid in self.client._out_messages
 
     def stop(self):
+        if self.connection:
+            self.connection.unregister(self)
+            super().stop()
+            return
+
         logger.info("Disconnecting to broker")
         self.client.disconnect()
 
@@ -137,10 +341,12 @@ class MqttThread(BaseThread):
         :param userdata:
         :param mid:
         """
-        if self.limbo.exists(mid):
-            item = self.limbo.pop(mid)
-            logger.debug("Update item in db %s", item.uuid)
-            self.queue_data_sent.put_nowait(ItemQueue(data=item, status=Status.SENT))
+        items = self.limbo.pop(mid)
+        self.mids.release(mid)
+        if items is not None:
+            for item in items if isinstance(items, list) else [items]:
+                logger.debug("Update item in db %s", item.uuid)
+                self.queue_data_sent.put_nowait(ItemQueue(data=item, status=Status.SENT))
         else:
             logger.warning("Item isn't in limbo")
 
@@ -181,7 +387,12 @@ class MqttThread(BaseThread):
         :param rc:
         """
         self.__connected_to_mqtt = False
-        self.limbo.clear()
+        # Los mensajes que paho reenvía al reconectar se quedan en el limbo a la espera de su confirmación
+        entries = self.limbo.pop_all(keep=self.is_held_by_client)
+        if self.requeue_on_disconnect:
+            self.requeue_items(entries)
+        else:
+            self.fail_items(entries)
         if rc != 0:
             logger.error("Unexpected disconnection to broker")
         else:
@@ -190,123 +401,159 @@ class MqttThread(BaseThread):
         logger.info("Disconnected to broker with result code %s" % str(rc))
 
 
-try:
-    import ssl
-except ImportError:
-    ssl = None
+class MidAllocator(object):
+    """
+    Reparte los identificadores de mensaje MQTT, enteros de 16 bits entre 1 y 65535. Los identificadores
+    liberados se reutilizan antes de estrenar otros nuevos y nunca se entrega uno que siga en uso
+    """
+
+    MAX_MID = 65535
+
+    def __init__(self):
+        self.next_mid = 1
+        self.free = deque()
+        self.used = set()
+        self.lock = Lock()
+
+    def allocate(self) -> int:
+        with self.lock:
+            if len(self.free):
+                mid = self.free.popleft()
+            elif self.next_mid <= self.MAX_MID:
+                mid = self.next_mid
+                self.next_mid += 1
+            else:
+                raise ValueError("No free message ids, %i messages in flight" % (len(self.used),))
+            self.used.add(mid)
+            return mid
+
+    def release(self, mid):
+        with self.lock:
+            if mid in self.used:
+                self.used.remove(mid)
+                self.free.append(mid)
+
+    def size(self):
+        return len(self.used)
 
 
 class MqttClient(Client):
-    def __init__(self, client_id="", clean_session=True, userdata=None,
-                 protocol=MQTTv311, transport="tcp"):
+    """
+    Cliente de paho que toma los identificadores de mensaje de un MidAllocator. Publish acepta el
+    identificador ya reservado, para poder guardar el mensaje en el limbo antes de publicarlo
+    """
+
+    def __init__(self, client_id="", clean_session=True, userdata=None, protocol=MQTTv311, transport="tcp",
+                 mids: MidAllocator = None):
         super(MqttClient, self).__init__(client_id=client_id, clean_session=clean_session,
                                          userdata=userdata, protocol=protocol, transport=transport)
+        self.mids = mids or MidAllocator()
+        self._reserved = local()
 
     def publish(self, topic, payload=None, qos=0, retain=False, mid=None):
-        """Publish a message on a topic.
-
-        This causes a message to be sent to the broker and subsequently from
-        the broker to any clients subscribing to matching topics.
-
-        topic: The topic that the message should be published on.
-        payload: The actual message to send. If not given, or set to None a
-        zero length message will be used. Passing an int or float will result
-        in the payload being converted to a string representing that number. If
-        you wish to send a true int/float, use struct.pack() to create the
-        payload you require.
-        qos: The quality of service level to use.
-        retain: If set to true, the message will be set as the "last known
-        good"/retained message for the topic.
-
-        Returns a MQTTMessageInfo class, which can be used to determine whether
-        the message has been delivered (using info.is_published()) or to block
-        waiting for the message to be delivered (info.wait_for_publish()). The
-        message ID and return code of the publish() call can be found at
-        info.mid and info.rc.
-
-        For backwards compatibility, the MQTTMessageInfo class is iterable so
-        the old construct of (rc, mid) = client.publish(...) is still valid.
-
-        rc is MQTT_ERR_SUCCESS to indicate success or MQTT_ERR_NO_CONN if the
-        client is not currently connected.  mid is the message ID for the
-        publish request. The mid value can be used to track the publish request
-        by checking against the mid argument in the on_publish() callback if it
-        is defined.
-
-        A ValueError will be raised if topic is None, has zero length or is
-        invalid (contains a wildcard), if qos is not one of 0, 1 or 2, or if
-        the length of the payload is greater than 268435455 bytes."""
-        if topic is None or len(topic) == 0:
-            raise ValueError('Invalid topic.')
-
-        topic = topic.encode('utf-8')
-
-        if self._topic_wildcard_len_check(topic) != MQTT_ERR_SUCCESS:
-            raise ValueError('Publish topic cannot contain wildcards.')
-
-        if qos < 0 or qos > 2:
-            raise ValueError('Invalid QoS level.')
-
-        if isinstance(payload, unicode):
-            local_payload = payload.encode('utf-8')
-        elif isinstance(payload, (bytes, bytearray)):
-            local_payload = payload
-        elif isinstance(payload, (int, float)):
-            local_payload = str(payload).encode('ascii')
-        elif payload is None:
-            local_payload = b''
-        else:
-            raise TypeError('payload must be a string, bytearray, int, float or None.')
+        self._reserved.mid = mid
+        try:
+            return super(MqttClient, self).publish(topic, payload=payload, qos=qos, retain=retain)
+        finally:
+            self._reserved.mid = None
 
-        if len(local_payload) > 268435455:
-            raise ValueError('Payload too large.')
+    def _mid_generate(self):
+        mid = getattr(self._reserved, 'mid', None)
+        if mid is not None:
+            self._reserved.mid = None
+            return mid
 
-        if mid:
-            local_mid = mid
-        else:
-            local_mid = self._mid_generate()
+        return self.mids.allocate()
 
-        if qos == 0:
-            info = MQTTMessageInfo(local_mid)
-            rc = self._send_publish(local_mid, topic, local_payload, qos, retain, False, info)
-            info.rc = rc
-            return info
-        else:
-            message = MQTTMessage(local_mid, topic)
-            message.timestamp = time_func()
-            message.payload = local_payload
-            message.qos = qos
-            message.retain = retain
-            message.dup = False
-
-            with self._out_message_mutex:
-                if self._max_queued_messages > 0 and len(self._out_messages) >= self._max_queued_messages:
-                    message.info.rc = MQTT_ERR_QUEUE_SIZE
-                    return message.info
-
-                if local_mid in self._out_messages:
-                    message.info.rc = MQTT_ERR_QUEUE_SIZE
-                    return message.info
-
-                self._out_messages[message.mid] = message
-                if self._max_inflight_messages == 0 or self._inflight_messages < self._max_inflight_messages:
-                    self._inflight_messages += 1
-                    if qos == 1:
-                        message.state = mqtt_ms_wait_for_puback
-                    elif qos == 2:
-                        message.state = mqtt_ms_wait_for_pubrec
-
-                    rc = self._send_publish(message.mid, topic, message.payload, message.qos, message.retain,
-                                            message.dup)
-
-                    # remove from inflight messages so it will be send after a connection is made
-                    if rc is MQTT_ERR_NO_CONN:
-                        self._inflight_messages -= 1
-                        message.state = mqtt_ms_publish
-
-                    message.info.rc = rc
-                    return message.info
-                else:
-                    message.state = mqtt_ms_queued
-                    message.info.rc = MQTT_ERR_SUCCESS
-                    return message.info
+
+class MqttConnection(object):
+    """
+    Conexión con el broker compartida por varios MqttThread, por ejemplo los de los dispositivos de un
+    DeviceGroup. Hay un único cliente, un único hilo de red y un único MidAllocator; las confirmaciones se
+    entregan al hilo que tiene el mensaje en su limbo y el resto de eventos se entregan a todos
+
+    La conexión se abre al registrar el primer hilo y se cierra al quitar el último
+    """
+
+    def __init__(self, **kwargs):
+        self.broker_url = kwargs.pop("broker_url", "iot.eclipse.org")
+        self.broker_port = kwargs.pop("broker_port", 1883)
+        self.keepalive = kwargs.pop("keepalive", 60)
+
+        self.mids = MidAllocator()
+        self.client = MqttClient(client_id=kwargs.pop("client_id", ""), protocol=MQTTv311,
+                                 clean_session=kwargs.pop("clean_session", True), mids=self.mids)
+        if "username" in kwargs:
+            self.client.username_pw_set(kwargs.pop("username"), kwargs.pop("password", None))
+        self.client.on_connect = self.on_connect
+        self.client.on_disconnect = self.on_disconnect
+        self.client.on_publish = self.on_publish
+
+        self.senders = []
+        self.lock = Lock()
+        self.connected = False
+        self.flags = None
+        self.started = False
+        self.thread_mqtt = None
+
+    def register(self, sender: MqttThread):
+        with self.lock:
+            self.senders.append(sender)
+            self.client.max_inflight_messages_set(self.max_inflight())
+            start = not self.started
+            self.started = True
+            connected, flags = self.connected, self.flags
+
+        if start:
+            self.connect()
+        elif connected:
+            sender.on_connect(self.client, None, flags, 0)
+
+    def unregister(self, sender: MqttThread):
+        with self.lock:
+            if sender in self.senders:
+                self.senders.remove(sender)
+            last = not len(self.senders)
+
+        if last:
+            logger.info("Disconnecting to broker")
+            self.client.disconnect()
+
+    def max_inflight(self) -> int:
+        """ Suma de los límites de los limbos, 0 (sin límite) si alguno no lo tiene """
+        sizes = [sender.limbo.max_size for sender in self.senders]
+        return 0 if None in sizes else sum(sizes)
+
+    def connect(self):
+        logger.info("Try to connect to broker")
+        self.client.connect(host=self.broker_url, port=self.broker_port, keepalive=self.keepalive)
+
+        self.thread_mqtt = Thread(target=loop, args=(self.client,))
+        self.thread_mqtt.start()
+
+    def get_senders(self) -> list:
+        with self.lock:
+            return list(self.senders)
+
+    def on_connect(self, client, userdata, flags, rc):
+        self.connected = rc == 0
+        self.flags = flags
+        for sender in self.get_senders():
+            sender.on_connect(client, userdata, flags, rc)
+
+    def on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        for sender in self.get_senders():
+            sender.on_disconnect(client, userdata, rc)
+        if rc == 0:
+            client.loop_stop()
+            self.started = False
+
+    def on_publish(self, client, userdata, mid):
+        for sender in self.get_senders():
+            if sender.limbo.exists(mid):
+                sender.on_publish(client, userdata, mid)
+                return
+
+        self.mids.release(mid)
+        logger.warning("Item isn't in limbo")
@@ -1,31 +1,110 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import select
 from copy import copy
-from queue import Queue, Full
-from typing import List
+from queue import Queue
+from typing import List, Optional
 
 from serial import Serial
 
 from buoy.base.data.item import ItemQueue, BaseItem
 from buoy.base.device.exceptions import LostConnectionException, ProcessDataExecption
-from buoy.base.device.threads.base import DeviceBaseThread
+from buoy.base.device.threads.base import DeviceBaseThread, QUEUE_FULL
 from buoy.base.data.item import BufferItems
 
 logger = logging.getLogger(__name__)
 
 
+class LineFramer(object):
+    """
+    Separa en líneas los bytes leídos del dispositivo. Los datos se acumulan en un bytearray y cada búsqueda
+    del separador empieza donde terminó la anterior, de modo que cada byte se examina una sola vez y sólo
+    se decodifican las líneas completas. Si el fragmento sin separador supera max_size se descarta
+    """
+
+    def __init__(self, splitter: bytes = b'\n', max_size: int = 4096):
+        self.splitter = splitter
+        self.text_splitter = splitter.decode()
+        self.max_size = max_size
+        self.data = bytearray()
+        self.scanned = 0
+        # Un separador de varios bytes puede haber llegado a medias: se vuelven a buscar sus primeros bytes
+        self.overlap = len(splitter) - 1
+
+    def feed(self, data: bytes) -> bool:
+        """ Añade los datos leídos y retorna si hay alguna línea completa """
+        buffer = self.data
+        buffer += data
+        if buffer.find(self.splitter, self.scanned) != -1:
+            return True
+        if len(buffer) > self.max_size:
+            self.discard()
+        elif len(buffer) > self.overlap:
+            self.scanned = len(buffer) - self.overlap
+        return False
+
+    def has_line(self) -> bool:
+        """ Indica si hay alguna línea completa, examinando sólo los bytes que no se han buscado antes """
+        if self.data.find(self.splitter, self.scanned) != -1:
+            return True
+        if len(self.data) > self.overlap:
+            self.scanned = len(self.data) - self.overlap
+        return False
+
+    def lines(self) -> Optional[List[str]]:
+        """ Saca del buffer las líneas completas y las retorna sin espacios al principio ni al final, omitiendo
+        las vacías, o None si no hay ningún separador. Las líneas se decodifican juntas, hasta el último
+        separador, que se busca una sola vez desde donde terminó la búsqueda anterior """
+        end = self.data.rfind(self.splitter, self.scanned)
+        if end == -1:
+            return None
+
+        text = self.data[:end].decode()
+        del self.data[:end + len(self.splitter)]
+        self.scanned = 0
+        if len(self.data) > self.max_size:
+            self.discard()
+        elif len(self.data) > self.overlap:
+            self.scanned = len(self.data) - self.overlap
+
+        return [line for line in (line.strip() for line in text.split(self.text_splitter)) if line]
+
+    def discard(self):
+        logger.warning("Discarded %i bytes without line splitter", len(self.data))
+        self.clear()
+
+    def clear(self):
+        self.data.clear()
+        self.scanned = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __str__(self):
+        return self.data.decode(errors='replace')
+
+
 class DeviceReader(DeviceBaseThread):
-    """ Clase encargada de leer y parsear los datos que devuelve el dispositivo """
+    """
+    Clase encargada de leer y parsear los datos que devuelve el dispositivo
+
+    Con read_mode 'poll' lee lo que haya en el puerto y espera timeout_wait segundos entre lecturas. Con
+    'select' espera bloqueado en el descriptor del puerto y lee en cuanto llegan datos. La espera dura como
+    máximo read_timeout segundos, que es lo que puede tardar el hilo en parar
+    """
 
     def __init__(self, device: Serial, queue_notice: Queue, **kwargs):
         self.char_splitter = kwargs.pop('char_splitter', '\n')
         self.interval = kwargs.pop("interval", None)
+        self.read_mode = kwargs.pop("read_mode", "poll")
+        self.read_timeout = kwargs.pop("read_timeout", 1)
+        self.framer = LineFramer(splitter=self.char_splitter.encode(), max_size=kwargs.pop("max_line_size", 4096))
 
         super(DeviceReader, self).__init__(device, queue_notice)
+        self.timeout_wait = kwargs.pop("timeout_wait", self.timeout_wait)
 
-        self.buffer = ''
-        self.buffer_items = BufferItems(interval=self.interval)
+        self.buffer_items = BufferItems(interval=self.interval, aggregations=kwargs.pop("aggregations", None))
 
         self.queue_save_data = kwargs.pop('queue_save_data', None)
         if not self.queue_save_data:
@@ -36,30 +115,55 @@ class DeviceReader(DeviceBaseThread):
 
     def activity(self):
         try:
-            self.read_data()
+            has_line = self.read_data()
             logger.debug("Waiting data")
-            if not self.is_buffer_empty():
+            if has_line:
                 self.process_data()
 
         except (OSError, Exception) as ex:
             logger.error("Device disconnected")
             self.error(LostConnectionException(exception=ex))
 
-    def read_data(self):
-        logger.debug("Data in buffer %s" % self.buffer)
-        self.buffer += self.device.read(self.device.in_waiting).decode()
+    @property
+    def buffer(self) -> str:
+        """ Datos leídos pendientes de completar una línea """
+        return str(self.framer).strip()
+
+    @buffer.setter
+    def buffer(self, value: str):
+        self.framer.clear()
+        self.framer.feed(value.encode())
+
+    def read_data(self) -> bool:
+        """ Lee los datos del puerto y retorna si hay alguna línea completa """
+        logger.debug("Data in buffer %s", self.framer)
+        if self.read_mode == "select":
+            return self.wait_readable() and self.read_available()
+        return self.framer.feed(self.device.read(self.device.in_waiting))
+
+    def read_available(self) -> bool:
+        """ Lee los datos de un puerto que ya está listo para leer y retorna si hay alguna línea completa. Si
+        el descriptor está listo pero no hay datos, read(1) detecta que el puerto se ha cerrado """
+        return self.framer.feed(self.device.read(self.device.in_waiting or 1))
+
+    def wait_readable(self) -> bool:
+        """ Espera como máximo read_timeout segundos a que haya datos en el puerto """
+        readable, _, _ = select.select([self.device.fileno()], [], [], self.read_timeout)
+        return len(readable) > 0
+
+    def wait(self):
+        if self.read_mode != "select":
+            super().wait()
 
     def is_buffer_empty(self):
-        return self.char_splitter not in self.buffer
+        return not self.framer.has_line()
 
     def process_data(self):
-        logger.debug("Proccessing data: %s", self.buffer)
-        buffer = self.buffer.rsplit(self.char_splitter, 1)
-        try:
-            self.buffer = buffer[1].strip()
-        except IndexError as ex:
-            raise ProcessDataExecption(message="Proccesing data without char split", exception=ex)
-        for line in self.split_by_lines(buffer[0]):
+        logger.debug("Proccessing data: %s", self.framer)
+        lines = self.framer.lines()
+        if lines is None:
+            raise ProcessDataExecption(message="Proccesing data without char split", exception=None)
+        for line in lines:
             item = self.parser(line)
             logger.debug("Returned item: %s", str(item))
             if item:
@@ -68,10 +172,6 @@ class DeviceReader(DeviceBaseThread):
                     self.put_in_queues(aggs_item)
             logger.debug("Received data - " + line)
 
-    def split_by_lines(self, buffer: str) -> List[str]:
-        lines = buffer.split(self.char_splitter)
-        return [l.strip() for l in lines if len(l.strip())]
-
     def parser(self, data) -> BaseItem:
         pass
 
@@ -81,11 +181,11 @@ class DeviceReader(DeviceBaseThread):
         if self.queue_save_data and not self.queue_save_data.full():
             try:
                 self.queue_save_data.put_nowait(ItemQueue(data=copy(item)))
-            except Full:
+            except QUEUE_FULL:
                 logger.error("Save data queue is full")
 
         if self.queue_send_data and not self.queue_send_data.full():
             try:
                 self.queue_send_data.put_nowait(item)
-            except Full:
+            except QUEUE_FULL:
                 logger.warning("Send data queue is full")
@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import logging
-from queue import Queue, Full
+from queue import Queue
 
 from buoy.base.database import DeviceDB
-from buoy.base.device.threads.base import BaseThread
+from buoy.base.device.threads.base import BaseThread, QUEUE_FULL
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +12,9 @@ logger = logging.getLogger(__name__)
 class DBToSendThread(BaseThread):
     """
     Clase base encargada buscar datos en la base de datos que no han sido enviados
+
+    Con stream activo los datos se leen de la base de datos según hay sitio en la cola de envío,
+    sin cargar en memoria toda la lista de pendientes
     """
 
     def __init__(self, db: DeviceDB, queue_send_data: Queue, queue_notice: Queue, **kwargs):
@@ -22,13 +25,40 @@ class DBToSendThread(BaseThread):
         self.queue_send_data = queue_send_data
         self.queue_notice = queue_notice
         self.limit_queue = kwargs.pop("limit_queue", 100)
+        self.stream = kwargs.pop("stream", False)
+        self.itersize = kwargs.pop("itersize", 100)
 
     def activity(self):
-        if not self.queue_send_data.full():
-            items = self.db.get_items_to_send()
-            for item in items:
+        if self.stream:
+            self.activity_stream()
+        elif not self.queue_send_data.full():
+            items = self.db.get_items_to_send(size=self.free_slots())
+            for index, item in enumerate(items):
+                try:
+                    self.queue_send_data.put_nowait(item)
+                except QUEUE_FULL:
+                    logger.warning("Send queue is full")
+                    self.db.release_items([item.uuid for item in items[index:]])
+                    break
+
+    def free_slots(self) -> int:
+        """ Número de registros a reservar: limit_queue, o el hueco libre en la cola si es menor """
+        if self.queue_send_data.maxsize <= 0:
+            return self.limit_queue
+        return max(min(self.limit_queue, self.queue_send_data.maxsize - self.queue_send_data.qsize()), 1)
+
+    def activity_stream(self):
+        items = self.db.iter_items_to_send(itersize=self.itersize)
+        try:
+            while not self.queue_send_data.full():
+                item = next(items, None)
+                if item is None:
+                    break
                 try:
                     self.queue_send_data.put_nowait(item)
-                except Full:
+                except QUEUE_FULL:
                     logger.warning("Send queue is full")
+                    self.db.release_items([item.uuid])
                     break
+        finally:
+            items.close()
@@ -1,26 +1,123 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import time
 from queue import Queue, Empty
+from typing import List
 
-from buoy.base.data.item import Status
+from buoy.base.data.item import Status, ItemQueue
 from buoy.base.database import DeviceDB
 from buoy.base.device.threads.base import BaseThread
 
 logger = logging.getLogger(__name__)
 
 
+class SaveStats(object):
+    """ Contadores de los lotes escritos en la base de datos """
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.last_batch_size = 0
+        self.max_batch_size = 0
+        self.flush_time = 0.0
+        self.last_flush_time = 0.0
+        self.max_flush_time = 0.0
+
+    def add(self, size, elapsed):
+        self.batches += 1
+        self.items += size
+        self.last_batch_size = size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.flush_time += elapsed
+        self.last_flush_time = elapsed
+        self.max_flush_time = max(self.max_flush_time, elapsed)
+
+    @property
+    def mean_batch_size(self):
+        return self.items / self.batches if self.batches else 0
+
+    @property
+    def mean_flush_time(self):
+        return self.flush_time / self.batches if self.batches else 0.0
+
+
+class AckAccumulator(object):
+    """ Acumula los uuids de los elementos enviados o fallidos para actualizar su estado con una única
+    sentencia por estado. Si un uuid se recibe varias veces prevalece el último estado """
+
+    def __init__(self, db: DeviceDB, **kwargs):
+        self.db = db
+        self.interval = kwargs.pop('interval', 1)
+        self.max_size = kwargs.pop('max_size', 1000)
+        self.acks = dict()
+        self.last_flush = time.monotonic()
+
+    def add(self, uuid, status: Status):
+        self.acks[uuid] = status
+
+    def size(self):
+        return len(self.acks)
+
+    def is_ready(self):
+        return self.size() >= self.max_size or \
+               (self.size() > 0 and time.monotonic() - self.last_flush >= self.interval)
+
+    def flush(self):
+        acks, self.acks = self.acks, dict()
+        self.last_flush = time.monotonic()
+
+        sent = [uuid for uuid, status in acks.items() if status == Status.SENT]
+        failed = [uuid for uuid, status in acks.items() if status == Status.FAILED]
+
+        logger.debug("Flush acks - Sent: %i, Failed: %i", len(sent), len(failed))
+        if len(sent):
+            self.db.update_status(sent, status=True)
+        if len(failed):
+            self.db.update_status(failed, status=False)
+
+
 class SaveThread(BaseThread):
     """
     Clase encargada de guardar los datos en la base de datos
+
+    Con batch_size mayor que 1 agrupa los elementos de la cola hasta completar el lote o hasta que
+    pasen max_latency milisegundos desde el primero, y escribe cada grupo (nuevos, enviados y
+    fallidos) con una única sentencia
     """
 
-    def __init__(self, db: DeviceDB, queue_save_data: Queue, queue_notice: Queue):
+    def __init__(self, db: DeviceDB, queue_save_data: Queue, queue_notice: Queue, **kwargs):
         super(SaveThread, self).__init__(queue_notice)
         self.db = db
         self.queue_save_data = queue_save_data
+        self.batch_size = kwargs.pop('batch_size', 1)
+        self.max_latency = kwargs.pop('max_latency', 500)
+        self.stats = SaveStats()
+
+        ack_interval = kwargs.pop('ack_interval', 0)
+        self.acks = None
+        if ack_interval > 0:
+            self.acks = AckAccumulator(db, interval=ack_interval, max_size=kwargs.pop('ack_max_size', 1000))
 
     def activity(self):
+        if self.batch_size > 1:
+            self.activity_batch()
+        else:
+            self.activity_item()
+
+        if self.acks and self.acks.is_ready():
+            self.acks.flush()
+
+    def after_activity(self):
+        if self.acks:
+            self.acks.flush()
+
+    def wait(self):
+        # En modo lote la espera ya se hace en drain, bloqueado en la cola
+        if self.batch_size <= 1:
+            super().wait()
+
+    def activity_item(self):
         try:
             item = self.queue_save_data.get(timeout=self.timeout_wait)
 
@@ -37,6 +134,63 @@ class SaveThread(BaseThread):
         except Empty:
             pass
 
+    def activity_batch(self):
+        items = self.drain()
+        if len(items):
+            self.flush(items)
+
+    def drain(self) -> List[ItemQueue]:
+        """ Extrae de la cola hasta batch_size elementos, esperando como máximo max_latency
+        milisegundos desde la llegada del primero """
+        items = []
+        try:
+            items.append(self.queue_save_data.get(timeout=self.timeout_wait))
+        except Empty:
+            return items
+
+        deadline = time.monotonic() + self.max_latency / 1000
+        while len(items) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                items.append(self.queue_save_data.get(timeout=timeout))
+            except Empty:
+                break
+
+        return items
+
+    def flush(self, items: List[ItemQueue]):
+        """ Escribe el lote en la base de datos y lo marca como procesado en la cola, aunque falle la escritura """
+        try:
+            self.write(items)
+        finally:
+            for _ in items:
+                self.queue_save_data.task_done()
+
+    def write(self, items: List[ItemQueue]):
+        """ Escribe el lote en la base de datos, primero los nuevos y después los cambios de estado """
+        start = time.perf_counter()
+
+        new = [item.data for item in items if item.status == Status.NEW]
+        sent = [item.data.uuid for item in items if item.status == Status.SENT]
+        failed = [item.data.uuid for item in items if item.status == Status.FAILED]
+
+        logger.debug("Flush batch - New: %i, Sent: %i, Failed: %i", len(new), len(sent), len(failed))
+        if len(new):
+            self.db.save_many(new)
+        if self.acks:
+            for item in items:
+                if item.status != Status.NEW:
+                    self.acks.add(item.data.uuid, item.status)
+        else:
+            if len(sent):
+                self.db.update_status(sent, status=True)
+            if len(failed):
+                self.db.update_status(failed, status=False)
+
+        self.stats.add(len(items), time.perf_counter() - start)
+
     def save(self, item):
         """ Guarda el registro en la base de datos """
         logger.debug("Save to item %s" % str(item))
@@ -44,8 +198,14 @@ class SaveThread(BaseThread):
 
     def set_sent(self, item):
         logger.debug("Mark item with sent %s" % str(item))
-        self.db.set_sent(item.uuid)
+        if self.acks:
+            self.acks.add(item.uuid, Status.SENT)
+        else:
+            self.db.set_sent(item.uuid)
 
     def set_failed(self, item):
         logger.debug("Mark item with send failed %s" % str(item))
-        self.db.set_failed(item.uuid)
+        if self.acks:
+            self.acks.add(item.uuid, Status.FAILED)
+        else:
+            self.db.set_failed(item.uuid)
@@ -3,7 +3,7 @@ from os import path
 from queue import Queue, Full
 from unittest.mock import MagicMock
 
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from buoy.base.database import DeviceDB
 from buoy.base.device.threads.resender import DBToSendThread
@@ -36,6 +36,7 @@ class DBToSendThreadTest(unittest.TestCase):
         thread.activity()
 
         eq_(queue_send_data.qsize(), 0)
+        ok_(len(self.dev_db.get_items_to_send()))
 
     def test_putItemInQueue_when_queueIsFullInLoop(self):
         queue_notice = Queue()
@@ -47,3 +48,41 @@ class DBToSendThreadTest(unittest.TestCase):
         thread.activity()
 
         eq_(queue_send_data.qsize(), 5)
+
+    def test_putItemsUntilQueueIsFull_when_streamIsEnabled(self):
+        queue_notice = Queue()
+        queue_send_data = Queue(maxsize=3)
+        apply_sql_file(path.join(self.path_sql, 'data_5_items_to_send.sql'))
+
+        thread = DBToSendThread(queue_send_data=queue_send_data, db=self.dev_db, queue_notice=queue_notice,
+                                stream=True, itersize=2)
+
+        thread.activity()
+
+        eq_(queue_send_data.qsize(), 3)
+        eq_(len(self.dev_db.get_items_to_send()), 2)
+
+    def test_leaseOnlyFreeSlots_when_queueIsBounded(self):
+        queue_notice = Queue()
+        queue_send_data = Queue(maxsize=3)
+        apply_sql_file(path.join(self.path_sql, 'data_5_items_to_send.sql'))
+
+        thread = DBToSendThread(queue_send_data=queue_send_data, db=self.dev_db, queue_notice=queue_notice)
+
+        thread.activity()
+
+        eq_(queue_send_data.qsize(), 3)
+        eq_(len(self.dev_db.get_items_to_send()), 2)
+
+    def test_releaseTakenItem_when_queueIsFullInStream(self):
+        queue_notice = Queue()
+        queue_send_data = Queue()
+        queue_send_data.put_nowait = MagicMock(side_effect=Full())
+        apply_sql_file(path.join(self.path_sql, 'data_5_items_to_send.sql'))
+
+        thread = DBToSendThread(queue_send_data=queue_send_data, db=self.dev_db, queue_notice=queue_notice,
+                                stream=True, itersize=2)
+
+        thread.activity()
+
+        eq_(len(self.dev_db.get_items_to_send()), 5)
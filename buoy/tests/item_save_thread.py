@@ -1,11 +1,11 @@
 import unittest
 from queue import Queue
-from unittest.mock import patch, call
+from unittest.mock import patch, call, MagicMock
 
 from nose.tools import eq_
 
 from buoy.base.data.item import ItemQueue, Status
-from buoy.base.device.threads.save import SaveThread
+from buoy.base.device.threads.save import SaveThread, AckAccumulator
 
 
 def get_item():
@@ -45,3 +45,94 @@ class ItemSaveThreadTest(unittest.TestCase):
         eq_(mock_save.call_args, call(items[0].data))
         eq_(mock_set_sent.call_args, call(items[1].data))
         eq_(mock_set_failed.call_args, call(items[2].data))
+
+    @patch.object(SaveThread, 'is_active', side_effect=[True, False])
+    def test_flushGroupsInOneBatch_when_batchModeIsEnabled(self, mock_is_active):
+        queue_data = Queue()
+        db = MagicMock()
+
+        items = [ItemQueue(data=MagicMock()), ItemQueue(data=MagicMock()),
+                 ItemQueue(data=MagicMock(), status=Status.SENT), ItemQueue(data=MagicMock(), status=Status.SENT),
+                 ItemQueue(data=MagicMock(), status=Status.FAILED)]
+
+        for item in items:
+            queue_data.put_nowait(item)
+
+        thread = SaveThread(queue_save_data=queue_data, db=db, queue_notice=Queue(), batch_size=10, max_latency=50)
+        thread.timeout_wait = 0
+        thread.run()
+
+        eq_(db.save_many.call_args, call([items[0].data, items[1].data]))
+        eq_(db.update_status.call_args_list, [call([items[2].data.uuid, items[3].data.uuid], status=True),
+                                              call([items[4].data.uuid], status=False)])
+        eq_(db.save.call_count, 0)
+        eq_(thread.stats.batches, 1)
+        eq_(thread.stats.last_batch_size, 5)
+        eq_(queue_data.unfinished_tasks, 0)
+
+    def test_markItemsAsDone_when_writeRaisesException(self):
+        queue_data = Queue()
+        items = [ItemQueue(data=MagicMock()), ItemQueue(data=MagicMock(), status=Status.SENT)]
+        for item in items:
+            queue_data.put_nowait(item)
+
+        db = MagicMock()
+        db.save_many.side_effect = Exception()
+        thread = SaveThread(queue_save_data=queue_data, db=db, queue_notice=Queue(), batch_size=10)
+
+        self.assertRaises(Exception, thread.flush, thread.drain())
+        eq_(queue_data.unfinished_tasks, 0)
+
+    def test_drainBatchSizeItems_when_queueHasMoreItems(self):
+        queue_data = Queue()
+        for _ in range(0, 5):
+            queue_data.put_nowait(ItemQueue(data=MagicMock()))
+
+        thread = SaveThread(queue_save_data=queue_data, db=MagicMock(), queue_notice=Queue(), batch_size=3)
+
+        eq_(len(thread.drain()), 3)
+        eq_(queue_data.qsize(), 2)
+
+    @patch('buoy.base.device.threads.base.time.sleep')
+    def test_noSleepBetweenBatches_when_batchModeIsEnabled(self, mock_sleep):
+        thread = SaveThread(queue_save_data=Queue(), db=MagicMock(), queue_notice=Queue(), batch_size=3)
+
+        thread.wait()
+
+        eq_(mock_sleep.call_count, 0)
+
+    def test_oneUpdatePerStatus_when_flushAcks(self):
+        db = MagicMock()
+        acks = AckAccumulator(db, interval=60)
+        uuids = [MagicMock() for _ in range(0, 4)]
+
+        acks.add(uuids[0], Status.SENT)
+        acks.add(uuids[1], Status.FAILED)
+        acks.add(uuids[2], Status.SENT)
+        acks.add(uuids[1], Status.SENT)
+        acks.add(uuids[3], Status.FAILED)
+
+        eq_(acks.is_ready(), False)
+        acks.flush()
+
+        eq_(db.update_status.call_args_list, [call([uuids[0], uuids[1], uuids[2]], status=True),
+                                              call([uuids[3]], status=False)])
+        eq_(acks.size(), 0)
+
+    @patch.object(SaveThread, 'is_active', side_effect=[True, True, False])
+    def test_flushAcks_when_stopThread(self, mock_is_active):
+        queue_data = Queue()
+        db = MagicMock()
+
+        items = [ItemQueue(data=MagicMock(), status=Status.SENT), ItemQueue(data=MagicMock(), status=Status.FAILED)]
+        for item in items:
+            queue_data.put_nowait(item)
+
+        thread = SaveThread(queue_save_data=queue_data, db=db, queue_notice=Queue(), ack_interval=60)
+        thread.timeout_wait = 0
+        thread.run()
+
+        eq_(db.set_sent.call_count, 0)
+        eq_(db.set_failed.call_count, 0)
+        eq_(db.update_status.call_args_list, [call([items[0].data.uuid], status=True),
+                                              call([items[1].data.uuid], status=False)])
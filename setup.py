@@ -85,6 +85,9 @@ setup(
     extras_require={
         'dev': ['check-manifest'],
         'test': ['coverage'],
+        'msgpack': ['msgpack'],
+        'cbor': ['cbor2'],
+        'zstd': ['zstandard'],
     },
 
     tests_require=[
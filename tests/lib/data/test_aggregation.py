@@ -0,0 +1,95 @@
+import unittest
+from decimal import Decimal
+
+from nose.tools import eq_, ok_
+
+from buoy.base.data.aggregation import Mean, Min, Max, Std, Median, Last, Count, CircularMean, VectorMean, \
+    VectorSpeed, VectorDirection, get_aggregation
+
+
+def aggregate(accumulator, values):
+    for value in values:
+        if isinstance(value, tuple):
+            accumulator.add(*value)
+        else:
+            accumulator.add(value)
+    return accumulator.result()
+
+
+class TestMean(unittest.TestCase):
+    def test_returnExactMean_when_addDecimalValues(self):
+        mean = Mean()
+        for value in ["0.1", "0.2", "0", "0.3"]:
+            mean.add(Decimal(value))
+
+        eq_(mean.result(), Decimal("0.15"))
+
+    def test_ignoreNoneValues_when_addValues(self):
+        mean = Mean()
+        for value in [None, 4, None, 2]:
+            mean.add(value)
+
+        eq_(mean.count, 2)
+        eq_(mean.result(), 3)
+
+    def test_returnNone_when_noValues(self):
+        mean = Mean()
+        mean.add(None)
+
+        eq_(mean.result(), None)
+
+    def test_resetState_when_clear(self):
+        mean = Mean()
+        mean.add(1)
+        mean.clear()
+        mean.add(3)
+
+        eq_(mean.result(), 3)
+
+
+class TestAggregations(unittest.TestCase):
+    def test_returnMinMaxLastAndCount_when_addValuesWithZerosAndNones(self):
+        values = [Decimal("3"), None, Decimal("0"), Decimal("-1.5"), Decimal("2")]
+
+        eq_(aggregate(Min(), values), Decimal("-1.5"))
+        eq_(aggregate(Max(), values), Decimal("3"))
+        eq_(aggregate(Last(), values + [None]), Decimal("2"))
+        eq_(aggregate(Count(), values), 4)
+
+    def test_returnSampleStd_when_addValues(self):
+        values = [Decimal(value) for value in ["2", "4", "4", "4", "5", "5", "7", "9"]]
+
+        eq_(round(aggregate(Std(), values), 6), Decimal("2.138090"))
+        eq_(round(aggregate(Std(), [2.0, 4.0, 4.0, 4.0, 5.0, 5.0, 7.0, 9.0]), 6), 2.13809)
+        eq_(aggregate(Std(), [Decimal("1")]), None)
+
+    def test_returnMedian_when_addValues(self):
+        eq_(aggregate(Median(), [Decimal("5"), Decimal("1"), None, Decimal("3")]), Decimal("3"))
+        eq_(aggregate(Median(), [Decimal("4"), Decimal("1")]), Decimal("2.5"))
+        eq_(aggregate(Median(), []), None)
+
+    def test_returnNorth_when_circularMeanOfAnglesAroundNorth(self):
+        eq_(aggregate(CircularMean(), [Decimal("350"), Decimal("10")]), Decimal("0"))
+        eq_(aggregate(CircularMean(), [Decimal("350"), Decimal("20"), None]), Decimal("5"))
+        eq_(aggregate(CircularMean(), [90, 270]), None)
+
+    def test_returnVectorAverage_when_addSpeedAndDirection(self):
+        samples = [(Decimal("10"), Decimal("90")), (Decimal("10"), Decimal("180")), (None, Decimal("0"))]
+
+        eq_(aggregate(VectorSpeed(), samples), Decimal("7.071068"))
+        eq_(aggregate(VectorDirection(), samples), Decimal("135"))
+        eq_(aggregate(VectorDirection(), [(1, 0), (1, 180)]), None)
+
+    def test_returnSpeedAndDirection_when_vectorMean(self):
+        samples = [(Decimal("10"), Decimal("90")), (Decimal("10"), Decimal("180"))]
+
+        eq_(aggregate(VectorMean(), samples), (Decimal("7.071068"), Decimal("135")))
+        eq_(VectorMean().result(), (None, None))
+
+    def test_raiseException_when_aggregationIsUnknown(self):
+        ok_(isinstance(get_aggregation("circular_mean"), CircularMean))
+        self.assertRaises(ValueError, get_aggregation, "mode")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import json
+import unittest
+from decimal import Decimal
+from threading import Thread
+
+from nose.tools import eq_, ok_
+
+from buoy.base.data import codec
+from buoy.base.data.codec import CodecError, get_codec, get_compressor, compress, decompress, decode
+from buoy.base.data.nmea0183 import WIMDA
+from buoy.tests.item import get_item
+
+
+def get_wimda():
+    return WIMDA(date="2019-04-05T07:29:06.356+00:00", press_mbar="1019.3", air_temp="12.34567",
+                 wind_dir_true="270", wind_knots="12.4")
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_shouldPublishSameJson_when_useJsonCodec(self):
+        item = get_item()
+
+        payload = get_codec('json').encode(item)
+
+        eq_(payload, item.to_json().encode('utf-8'))
+        eq_(decode(payload), json.loads(item.to_json()))
+
+    @unittest.skipIf(codec.msgpack is None, "msgpack is not installed")
+    def test_shouldDecodeSameValuesThanJson_when_useMsgPackCodec(self):
+        item = get_wimda()
+
+        payload = get_codec('msgpack').encode(item)
+
+        eq_(payload[0], 0x01)
+        eq_(decode(payload), json.loads(item.to_json()))
+
+    @unittest.skipIf(codec.cbor2 is None, "cbor2 is not installed")
+    def test_shouldDecodeSameValuesThanJson_when_useCborCodec(self):
+        item = get_wimda()
+
+        payload = get_codec('cbor').encode(item)
+
+        eq_(payload[0], 0x02)
+        eq_(decode(payload), json.loads(item.to_json()))
+
+    def test_shouldDecodeSameValuesThanJson_when_useStructCodec(self):
+        item = get_wimda()
+
+        payload = get_codec('struct').encode(item)
+
+        eq_(payload[0], 0x03)
+        ok_(len(payload) < len(item.to_json()))
+        eq_(decode(payload, WIMDA), json.loads(item.to_json()))
+
+    def test_shouldOmitEmptyFields_when_useStructCodec(self):
+        item = WIMDA(air_temp=Decimal("0"))
+
+        values = decode(get_codec('struct').encode(item), WIMDA)
+
+        eq_(values["air_temp"], 0.0)
+        ok_("water_temp" not in values)
+
+    def test_shouldRaiseError_when_structCodecEncodeUntypedItem(self):
+        with self.assertRaises(CodecError):
+            get_codec('struct').encode(get_item())
+
+    def test_shouldDecodeArray_when_encodeBatchWithAnyCodec(self):
+        items = [get_wimda() for _ in range(0, 3)]
+        expected = [json.loads(item.to_json()) for item in items]
+
+        for name in ['json', 'msgpack', 'cbor', 'struct']:
+            if not codec.CODECS[name].is_available():
+                continue
+            payload = get_codec(name).encode_many(items)
+            eq_(decode(payload, WIMDA), expected)
+
+    def test_shouldRaiseError_when_structBatchMixItemClasses(self):
+        with self.assertRaises(CodecError):
+            get_codec('struct').encode_many([get_wimda(), get_item()])
+
+    def test_shouldDecodeSameValues_when_compressWithAnyCompressor(self):
+        items = [get_wimda() for _ in range(0, 10)]
+        expected = [json.loads(item.to_json()) for item in items]
+
+        for compressor_name in ['zlib', 'zstd']:
+            compressor = codec.COMPRESSORS[compressor_name]
+            if not compressor.is_available():
+                continue
+            for name in ['json', 'msgpack', 'cbor', 'struct']:
+                if not codec.CODECS[name].is_available():
+                    continue
+                payload = get_codec(name).encode_many(items)
+                compressed = compress(payload, WIMDA, compressor)
+
+                ok_(len(compressed) < len(payload))
+                eq_(compressed[0], compressor.flag | (codec.CODECS[name].marker or 0))
+                eq_(decode(compressed, WIMDA), expected)
+
+    def test_shouldDecodeSameValues_when_compressFromSeveralThreads(self):
+        compressor = codec.COMPRESSORS['zstd']
+        if not compressor.is_available():
+            return
+        payloads = [get_codec('json').encode_many([get_wimda() for _ in range(0, idx + 1)]) for idx in range(0, 8)]
+        errors = []
+
+        def run(payload):
+            for _ in range(0, 50):
+                if decompress(compress(payload, WIMDA, compressor), WIMDA) != payload:
+                    errors.append(payload)
+
+        threads = [Thread(target=run, args=(payload,)) for payload in payloads]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        eq_(errors, [])
+
+    def test_shouldNotCompress_when_payloadIsSmallerThanMinSize(self):
+        payload = get_codec('json').encode(get_wimda())
+
+        eq_(compress(payload, WIMDA, get_compressor('zlib'), min_size=len(payload) + 1), payload)
+
+    def test_shouldRaiseError_when_decodeCompressedPayloadWithoutClass(self):
+        payload = compress(get_codec('json').encode(get_wimda()), WIMDA, get_compressor('zlib'))
+
+        with self.assertRaises(CodecError):
+            decode(payload)
+
+    def test_shouldRaiseError_when_formatIsUnknown(self):
+        with self.assertRaises(CodecError):
+            get_codec('xml')
+
+        with self.assertRaises(CodecError):
+            decode(b'\x7f')
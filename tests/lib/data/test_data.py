@@ -4,12 +4,31 @@ from unittest.mock import patch
 
 from nose.tools import eq_
 
-from buoy.base.data.item import BufferItems
+from decimal import Decimal
+
+from buoy.base.data.item import BufferItems, Field, to_decimal
+from buoy.base.data.nmea0183 import WIMDA
 from dateutil import parser
 from buoy.base.data.utils import convert_to_seconds
 from buoy.tests.item import Item, get_items, get_item
 
 
+class WIMDASummary(WIMDA):
+    air_temp_max = Field(to_decimal, type=Decimal, aggregation='max', source='air_temp')
+    air_temp_std = Field(to_decimal, type=Decimal, aggregation='std', source='air_temp')
+    wind_speed = Field(to_decimal, type=Decimal, aggregation='vector_speed', source=('wind_meters', 'wind_dir_true'))
+    wind_dir = Field(to_decimal, type=Decimal, aggregation='vector_dir', source=('wind_meters', 'wind_dir_true'))
+    samples = Field(aggregation='count', source='air_temp')
+
+
+def aggregate(buffer, cls, samples):
+    """ Añade las muestras al buffer dentro del mismo minuto y retorna el item del intervalo """
+    date = parser.parse("2019-01-01T00:01:00+00:00")
+    for idx, sample in enumerate(samples):
+        buffer.append(cls(date=date + timedelta(seconds=idx + 1), **sample))
+    return buffer.append(cls(date=date + timedelta(minutes=1, seconds=1)))
+
+
 class TestData(unittest.TestCase):
 
     def test_shouldReturnNumberSeconds_when_passFewIntervals(self):
@@ -102,6 +121,55 @@ class TestData(unittest.TestCase):
         eq_(getattr(item_processed, "date"), getattr(item_expected, "date"))
         eq_(getattr(item_processed, "value"), getattr(item_expected, "value"))
 
+    def test_keepZeroValues_when_calculateMean(self):
+        buffer = BufferItems(interval="1m")
+        dates = ["2019-01-01T00:01:01", "2019-01-01T00:01:02", "2019-01-01T00:01:03", "2019-01-01T00:02:01"]
+        values = [0, None, 10, 0]
+
+        items = [buffer.append(Item(date=parser.parse(date), value=value)) for date, value in zip(dates, values)]
+
+        eq_(items[:3], [None, None, None])
+        eq_(items[3].value, 5)
+        eq_(buffer.size(), 1)
+
+    def test_returnCircularMean_when_aggregateWindDirectionsAroundNorth(self):
+        samples = [{"wind_dir_true": "350", "air_temp": "10"}, {"wind_dir_true": "10", "air_temp": "20"}]
+
+        item = aggregate(BufferItems(interval="1m"), WIMDA, samples)
+
+        eq_(item.wind_dir_true, 0)
+        eq_(item.air_temp, 15)
+
+    def test_returnSeveralStatistics_when_itemDeclaresAggregatedFields(self):
+        samples = [{"air_temp": "10", "wind_meters": "10", "wind_dir_true": "90"},
+                   {"air_temp": "0", "wind_meters": "10", "wind_dir_true": "180"},
+                   {"air_temp": "20", "wind_meters": None, "wind_dir_true": "0"}]
+
+        item = aggregate(BufferItems(interval="1m"), WIMDASummary, samples)
+
+        eq_(item.air_temp, 10)
+        eq_(item.air_temp_max, 20)
+        eq_(item.air_temp_std, 10)
+        eq_(item.samples, 3)
+        eq_(item.wind_meters, 10)
+        eq_(item.wind_speed, Decimal("7.071068"))
+        eq_(item.wind_dir, 135)
+        eq_(item.wind_dir_true, 90)
+
+    def test_overrideFieldAggregation_when_passAggregations(self):
+        samples = [{"air_temp": "10"}, {"air_temp": "30"}, {"air_temp": "20"}]
+        buffer = BufferItems(interval="1m", aggregations={"air_temp": "last", "air_temp_max": ("min", "air_temp")})
+
+        item = aggregate(buffer, WIMDASummary, samples)
+
+        eq_(item.air_temp, 20)
+        eq_(item.air_temp_max, 10)
+
+    def test_raiseException_when_aggregationsHasUnknownField(self):
+        buffer = BufferItems(interval="1m", aggregations={"air_tmp": "last"})
+
+        self.assertRaises(ValueError, aggregate, buffer, WIMDASummary, [{"air_temp": "10"}])
+
     def test_returnListWithFieldName_when_passIntance(self):
         item = get_item()
         fields = BufferItems.extract_fieldname_parameters(item)
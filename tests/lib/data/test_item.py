@@ -0,0 +1,132 @@
+import json
+import unittest
+from copy import copy
+from decimal import Decimal
+
+from nose.tools import eq_, ok_
+
+from buoy.base.data.item import BaseItem, DataEncoder, Field, to_decimal
+from buoy.base.data.nmea0183 import WIMDA
+from buoy.tests.item import Item, get_item
+
+
+class LegacyWIMDA(BaseItem):
+    def __init__(self, **kwargs):
+        self.air_temp = kwargs.pop('air_temp', None)
+        self.wind_knots = kwargs.pop('wind_knots', None)
+        super(LegacyWIMDA, self).__init__(**kwargs)
+
+    @property
+    def air_temp(self):
+        return self._air_temp
+
+    @air_temp.setter
+    def air_temp(self, value):
+        self._air_temp = self._convert_string_to_decimal(value)
+
+    @property
+    def wind_knots(self):
+        return self._wind_knots
+
+    @wind_knots.setter
+    def wind_knots(self, value):
+        self._wind_knots = self._convert_string_to_decimal(value)
+
+
+class SlottedWIMDA(BaseItem):
+    air_temp = Field(to_decimal)
+    wind_knots = Field(to_decimal)
+
+
+class MixedItem(BaseItem):
+    value = Field(type=Decimal)
+    name = Field()
+    counter = Field(type=int)
+    ratio = Field()
+    flag = Field()
+    nested = Field()
+
+
+class RenamedItem(BaseItem):
+    air_temp = Field(to_decimal, type=Decimal, column='temperature', json_name='temp')
+
+
+class TestItem(unittest.TestCase):
+
+    def test_shouldNotHaveDict_when_itemDeclaresFields(self):
+        item = WIMDA(air_temp="12.3")
+
+        ok_(not hasattr(item, '__dict__'))
+        with self.assertRaises(AttributeError):
+            item.not_field = 1
+
+    def test_shouldConvertValues_when_assignField(self):
+        item = WIMDA(air_temp="12.3", date="2019-04-05T07:29:06.356+00:00")
+
+        eq_(item.air_temp, Decimal("12.3"))
+        eq_(item.date.year, 2019)
+        eq_(item.water_temp, None)
+
+    def test_shouldReturnSameDictAndJson_when_compareLegacyAndSlottedItem(self):
+        legacy = LegacyWIMDA(air_temp="12.3", wind_knots="4")
+        slotted = SlottedWIMDA(uuid=legacy.uuid, date=legacy.date, air_temp="12.3", wind_knots="4")
+
+        eq_(dict(legacy), dict(slotted))
+        eq_(legacy.to_json(), slotted.to_json())
+
+    def test_shouldReturnEqualItem_when_copySlottedItem(self):
+        item = WIMDA(air_temp="12.3", wind_knots="4")
+
+        item_copy = copy(item)
+
+        ok_(item_copy is not item)
+        eq_(item_copy, item)
+
+    def test_shouldReturnEqualItem_when_copyLegacyItem(self):
+        item = get_item()
+
+        item_copy = copy(item)
+
+        eq_(item_copy, item)
+        eq_(dict(item_copy), dict(item))
+
+    def test_shouldKeepBaseFields_when_itemIsLegacy(self):
+        item = Item(value="1.5")
+
+        eq_(sorted(dict(item).keys()), ['date', 'uuid', 'value'])
+
+    def test_shouldReturnFieldsSortedByName_when_classIsCreated(self):
+        eq_([field.name for field in WIMDA._fields][:4], ['abs_humidity', 'air_temp', 'date', 'dew_point'])
+        eq_([name for name, _ in WIMDA()], [field.name for field in WIMDA._fields])
+
+    def test_shouldDeriveFieldsFromProperties_when_itemIsLegacy(self):
+        eq_([field.name for field in LegacyWIMDA._fields], ['air_temp', 'date', 'uuid', 'wind_knots'])
+        eq_([field.name for field in LegacyWIMDA._declared_fields], ['date', 'uuid'])
+
+    def test_shouldUseJsonName_when_serializeItem(self):
+        item = RenamedItem(air_temp="12.3")
+
+        ok_('"temp":12.3' in item.to_json())
+        eq_(RenamedItem._fields[0].column, 'temperature')
+
+    def test_shouldMapColumnsToFields_when_createFromColumns(self):
+        item = RenamedItem(air_temp="12.3")
+
+        other = RenamedItem.from_columns({'uuid': item.uuid, 'date': item.date, 'temperature': Decimal("12.3"),
+                                          'sent': False})
+
+        eq_(other, item)
+
+    def test_shouldReturnSameJsonThanDataEncoder_when_serializeValuesOfAnyType(self):
+        values = [None, Decimal("1.23456"), Decimal("-0.0004"), Decimal("NaN"), Decimal("Infinity"), 0, 12, -3,
+                  "", "text", "ñandú \"quoted\"\n", 1.5, True, False, [1], WIMDA(air_temp="3.3")]
+
+        for value in values:
+            item = MixedItem(value=value, name=value, counter=value, ratio=value, flag=value, nested=value)
+            expected = json.dumps(item, cls=DataEncoder, sort_keys=True, separators=(',', ':'))
+            eq_(item.to_json(), expected)
+
+    def test_shouldReturnSameJsonThanDataEncoder_when_serializeWIMDA(self):
+        item = WIMDA(press_inch="30.1", press_mbar="1019.3", air_temp="12.34567", wind_dir_true="270")
+
+        eq_(item.to_json(), json.dumps(item, cls=DataEncoder, sort_keys=True, separators=(',', ':')))
@@ -1,3 +1,4 @@
+import threading
 import unittest
 from datetime import datetime, timezone
 from os import path
@@ -9,6 +10,11 @@ from buoy.tests.database import *
 from buoy.tests.item import Item
 
 
+def get_connection(dev_db):
+    """ Conexión del pool que usan las operaciones del hilo actual """
+    return dev_db.run(lambda cur: cur.connection)
+
+
 class BaseDBTests(unittest.TestCase):
     item_class = None
     db_tablename = None
@@ -69,6 +75,254 @@ class BaseDBTests(unittest.TestCase):
 
         eq_(row['uuid'], item.uuid)
 
+    def test_add_items_in_db_when_saveMany(self):
+        items_to_insert = [self.item_class(**self.data) for _ in range(0, 5)]
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        items = dev_db.save_many(items_to_insert)
+
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+
+        eq_(len(rows), 5)
+        eq_(set([row['uuid'] for row in rows]), set([item.uuid for item in items]))
+
+    def test_insertRestOfItems_when_saveManyWithItemsInDb(self):
+        items_to_insert = [self.item_class(**self.data) for _ in range(0, 5)]
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        dev_db.save(items_to_insert[2])
+        dev_db.save_many(items_to_insert)
+
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+
+        eq_(len(rows), 5)
+
+    def test_prepareStatementsAgain_when_reconnect(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        dev_db.save(self.item_class(**self.data))
+        dev_db.get_items_to_send()
+        eq_(len(get_connection(dev_db).prepared), 2)
+
+        dev_db.connect(db_conf)
+        eq_(len(get_connection(dev_db).prepared), 0)
+
+        item = dev_db.save(self.item_class(**self.data))
+        eq_(dev_db.get([item.uuid])['uuid'], item.uuid)
+        eq_(len(get_connection(dev_db).prepared), 2)
+
+    def test_should_return15Items_when_getItemsToSendWithoutPreparedStatements(self):
+        apply_sql_file(path.join(self.path_sql, 'data_example.sql'))
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class,
+            prepare=False
+        )
+        rows = dev_db.get_items_to_send()
+
+        eq_(len(rows), 15)
+        eq_(len(get_connection(dev_db).prepared), 0)
+
+    def test_saveItem_when_connectionIsLost(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+        dev_db.save(self.item_class(**self.data))
+
+        apply_sql_clause("""SELECT pg_terminate_backend(%i)""" % (get_connection(dev_db).get_backend_pid(),))
+        item = dev_db.save(self.item_class(**self.data))
+
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+        eq_(len(rows), 2)
+        ok_(item.uuid in [row['uuid'] for row in rows])
+
+    def test_closeConnection_when_threadEndsWithoutReturningIt(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+        connections = []
+        thread = threading.Thread(target=lambda: connections.append(dev_db.pool.getconn()))
+        thread.start()
+        thread.join()
+
+        ok_(connections[0].closed)
+        ok_(get_connection(dev_db) is not connections[0])
+        eq_(dev_db.pool.size(), 1)
+
+    def test_returnConnectionToPool_when_operationEnds(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+        thread = threading.Thread(target=lambda: dev_db.save(self.item_class(**self.data)))
+        thread.start()
+        thread.join()
+
+        with dev_db.get_cursor() as cur:
+            cur.execute("SELECT 1")
+        ok_(not dev_db.pool.is_checked_out())
+        eq_(dev_db.pool.size(), 1)
+
+    def test_noSaveItem_when_poolIsExhausted(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class,
+            pool_config={'max_connections': 1, 'max_attempts': 2,
+                         'reconnect_delay': {"min_delay": 0, "max_delay": 0}}
+        )
+        taken, release = threading.Event(), threading.Event()
+
+        def hold():
+            with dev_db.get_cursor():
+                taken.set()
+                release.wait(5)
+
+        thread = threading.Thread(target=hold)
+        thread.start()
+        taken.wait(5)
+
+        dev_db.save(self.item_class(**self.data))
+        release.set()
+        thread.join()
+
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+        eq_(len(rows), 0)
+
+    def test_insertAllItems_when_bulkLoad(self):
+        items_to_insert = [self.item_class(**self.data) for _ in range(0, 50)]
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        stats = dev_db.bulk_load(item for item in items_to_insert)
+
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+        eq_(len(rows), 50)
+        eq_(stats.rows, 50)
+        eq_(stats.inserted, 50)
+        eq_(set([row['uuid'] for row in rows]), set([item.uuid for item in items_to_insert]))
+
+    def test_discardDuplicatedUuids_when_bulkLoadWithMerge(self):
+        items_to_insert = [self.item_class(**self.data) for _ in range(0, 10)]
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+        dev_db.save(items_to_insert[0])
+
+        stats = dev_db.bulk_load(items_to_insert + items_to_insert[5:], merge=True)
+
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+        eq_(len(rows), 10)
+        eq_(stats.rows, 15)
+        eq_(stats.inserted, 9)
+
+    def test_keepRowsInLegacyPartition_when_partitionExistingTable(self):
+        apply_sql_file(path.join(self.path_sql, 'data_example.sql'))
+
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class,
+            partition={"interval": "month", "premake": 2}
+        )
+
+        partitions = dev_db.partitions()
+        eq_(partitions[0][0], self.db_tablename + "_legacy")
+        ok_(partitions[0][1] is None)
+        eq_(len(partitions), 4)
+
+        dev_db.save(self.item_class(**self.data))
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+        eq_(len(rows), 22)
+        eq_(len(dev_db.get_items_to_send()), 15)
+
+    def test_dropOnlySentPartitions_when_applyRetention(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class,
+            partition={"interval": "day", "premake": 0, "retention": "30d"}
+        )
+        eq_(len(dev_db.partitions()), 1)
+
+        dev_db.create_partitions(now=datetime(2017, 1, 23, tzinfo=timezone.utc))
+        dev_db.create_partitions(now=datetime(2017, 1, 24, tzinfo=timezone.utc))
+        apply_sql_file(path.join(self.path_sql, 'data_not_send.sql'))
+        apply_sql_clause("""INSERT INTO %s (date, value) VALUES ('2017-01-24 10:00:00', 1.0) RETURNING uuid"""
+                         % (self.db_tablename,))
+        eq_(len(dev_db.partitions()), 3)
+
+        dev_db.apply_retention()
+
+        names = [name for name, _, _ in dev_db.partitions()]
+        eq_(len(names), 2)
+        ok_(self.db_tablename + "_p20170123" not in names)
+        ok_(self.db_tablename + "_p20170124" in names)
+
+    def test_noSaveDuplicatedUuid_when_tableIsPartitionedAndDatesDiffer(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class,
+            partition={"interval": "day", "premake": 0}
+        )
+        item = dev_db.save(self.item_class(**self.data))
+
+        dev_db.save(self.item_class(uuid=item.uuid, date=datetime(2017, 1, 23, tzinfo=timezone.utc), value=1.0))
+        dev_db.save_many([self.item_class(uuid=item.uuid, date=datetime(2017, 1, 24, tzinfo=timezone.utc),
+                                          value=1.0)])
+        stats = dev_db.bulk_load([self.item_class(uuid=item.uuid, date=datetime(2017, 1, 25, tzinfo=timezone.utc),
+                                                  value=1.0)], merge=True)
+
+        eq_(stats.inserted, 0)
+        rows = apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))
+        eq_(len(rows), 1)
+
+    def test_saveInDefaultPartition_when_dateHasNoPartition(self):
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class,
+            partition={"interval": "day", "premake": 0}
+        )
+        apply_sql_file(path.join(self.path_sql, 'data_not_send.sql'))
+        rows = apply_sql_clause("""SELECT * FROM %s_default""" % (self.db_tablename,))
+        ok_(len(rows))
+
+        dev_db.create_partitions(now=rows[0]['date'])
+
+        eq_(len(dev_db.partitions()), 2)
+        moved = apply_sql_clause("""SELECT * FROM %s_p%s""" % (self.db_tablename, rows[0]['date'].strftime("%Y%m%d")))
+        ok_(len(moved))
+        eq_(len(apply_sql_clause("""SELECT * FROM %s""" % (self.db_tablename,))), len(rows))
+
     def test_update_status_items_in_db(self):
 
         dev_db = self.db_cls(
@@ -104,6 +358,87 @@ class BaseDBTests(unittest.TestCase):
         eq_(len(rows), 15)
         ok_(all(a.date <= b.date for a, b in zip(rows[:-1], rows[1:])))
 
+    def test_returnNextPage_when_getItemsToSendAgain(self):
+        apply_sql_file(path.join(self.path_sql, 'data_example.sql'))
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        first_page = dev_db.get_items_to_send(size=10)
+        second_page = dev_db.get_items_to_send(size=10)
+        third_page = dev_db.get_items_to_send(size=10)
+
+        eq_(len(first_page), 10)
+        eq_(len(second_page), 5)
+        ok_(first_page[-1].date <= second_page[0].date)
+        eq_(len(set([i.uuid for i in first_page]) & set([i.uuid for i in second_page])), 0)
+        eq_(len(third_page), 0)
+
+    def test_leaseItemsAndIncrementAttempts_when_getItemsToSend(self):
+        apply_sql_file(path.join(self.path_sql, 'data_example.sql'))
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+        sql_clause = """SELECT * FROM %s ORDER BY uuid""" % (self.db_tablename,)
+        before_rows = {row['uuid']: row for row in apply_sql_clause(sql_clause)}
+
+        items = dev_db.get_items_to_send()
+
+        after_rows = {row['uuid']: row for row in apply_sql_clause(sql_clause)}
+        for item in items:
+            eq_(after_rows[item.uuid]['num_attempts'], before_rows[item.uuid]['num_attempts'] + 1)
+            ok_(after_rows[item.uuid]['leased_until'] is not None)
+        eq_(len(dev_db.get_items_to_send()), 0)
+
+        dev_db.set_failed(items[0].uuid)
+        rows = dev_db.get_items_to_send()
+
+        eq_([row.uuid for row in rows], [items[0].uuid])
+
+    def test_createPartialIndex_when_createDeviceDB(self):
+        self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        rows = apply_sql_clause("""SELECT indexdef FROM pg_indexes WHERE tablename = '%s'""" % (self.db_tablename,))
+
+        ok_(any("WHERE (sent IS FALSE)" in row['indexdef'] for row in rows))
+
+    def test_should_return15ItemsInOrder_when_iterItemsToSend(self):
+        apply_sql_file(path.join(self.path_sql, 'data_example.sql'))
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        rows = list(dev_db.iter_items_to_send(itersize=4))
+
+        eq_(len(rows), 15)
+        ok_(all(a.date <= b.date for a, b in zip(rows[:-1], rows[1:])))
+
+    def test_releaseNotDeliveredItems_when_closeIterItemsToSend(self):
+        apply_sql_file(path.join(self.path_sql, 'data_example.sql'))
+        dev_db = self.db_cls(
+            db_config=db_conf,
+            db_tablename=self.db_tablename,
+            cls_item=self.item_class
+        )
+
+        items = dev_db.iter_items_to_send(itersize=4)
+        delivered = [next(items) for _ in range(0, 6)]
+        items.close()
+
+        rows = apply_sql_clause("""SELECT uuid FROM %s WHERE leased_until IS NOT NULL""" % (self.db_tablename,))
+        eq_(set([row['uuid'] for row in rows]), set([item.uuid for item in delivered]))
+        eq_(len(list(dev_db.iter_items_to_send())), 9)
+
     def test_should_returnZeroItems_when_getItemsToSend(self):
         apply_sql_file(path.join(self.path_sql, 'data_not_send.sql'))
 
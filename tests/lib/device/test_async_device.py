@@ -0,0 +1,216 @@
+import asyncio
+import os
+import socket
+import time
+import unittest
+from threading import Thread
+from unittest.mock import MagicMock
+
+from nose.tools import eq_, ok_
+
+from buoy.base.database import DeviceDB
+from buoy.base.device.aio import AsyncDevice, AsyncioMqttLoop
+from buoy.base.device.threads.reader import DeviceReader
+from buoy.tests.item import Item
+
+
+class FakeDeviceDB(DeviceDB):
+    def __init__(self):
+        self.saved = []
+        self.sent = []
+        self.failed = []
+
+    def save_many(self, items):
+        self.saved.extend(items)
+
+    def update_status(self, uuids, status=True):
+        (self.sent if status else self.failed).extend(uuids)
+
+    def get_items_to_send(self, **kwargs):
+        return []
+
+
+class BrokenDeviceDB(FakeDeviceDB):
+    def get_items_to_send(self, **kwargs):
+        raise ValueError("broken")
+
+
+class ItemReader(DeviceReader):
+    def parser(self, data):
+        return Item(value=data)
+
+
+class FakeAsyncDevice(AsyncDevice):
+    def __init__(self, **kwargs):
+        self.active = True
+        super(FakeAsyncDevice, self).__init__(**kwargs)
+
+    def is_active(self):
+        return self.active
+
+    def connect_to_mqtt(self, sender):
+        """ Sustituye al broker por un cliente que confirma cada publicación al momento """
+        def publish(topic, payload, qos=0, mid=None):
+            self.loop.call_soon(sender.on_publish, None, None, mid)
+
+        sender.client = MagicMock()
+        sender.client.publish.side_effect = publish
+        sender.on_connect(None, None, flags={"session present": 0}, rc=0)
+
+
+class OfflineBrokerDevice(FakeAsyncDevice):
+    connect_to_mqtt = AsyncDevice.connect_to_mqtt
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestAsyncDevice(unittest.TestCase):
+    def setUp(self):
+        self.master, self.slave = os.openpty()
+        self.db = FakeDeviceDB()
+        self.device = self.create_device()
+        self.errors = []
+        self.thread = Thread(target=self.run_device)
+
+    def create_device(self, cls=FakeAsyncDevice, db=None, save=None, **kwargs):
+        return cls(device_name="test", db=db or self.db, cls_reader=ItemReader, cls_maintenance=None,
+                   serial={'port': os.ttyname(self.slave), 'timeout': 0},
+                   save=dict({'batch_size': 10, 'max_latency': 50}, **(save or {})),
+                   resend={'timeout_wait': 0.1},
+                   mqtt=dict({'timeout_wait': 0.05}, **kwargs))
+
+    def run_device(self):
+        try:
+            self.device.run()
+        except Exception as ex:
+            self.errors.append(ex)
+
+    def tearDown(self):
+        self.device.active = False
+        self.thread.join(timeout=5)
+        if self.device._dev_connection:
+            self.device._dev_connection.close()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def test_saveAndSendItems_when_deviceWritesLines(self):
+        self.thread.start()
+        ok_(wait_until(lambda: self.device.tasks))
+
+        os.write(self.master, b"1.5\n2.5\n3.5\n")
+
+        ok_(wait_until(lambda: len(self.db.sent) == 3))
+        eq_([str(item.value) for item in self.db.saved], ["1.5", "2.5", "3.5"])
+        eq_(set(self.db.sent), set(item.uuid for item in self.db.saved))
+        eq_(self.device._thread_send.limbo.size(), 0)
+        eq_(self.device._thread_save.stats.items, 6)
+
+    def test_stopTasks_when_deviceIsClosed(self):
+        self.thread.start()
+        ok_(wait_until(lambda: self.device.tasks))
+
+        self.device.active = False
+        self.thread.join(timeout=5)
+
+        ok_(not self.thread.is_alive())
+        eq_(self.device.tasks, [])
+
+    def test_flushAcks_when_deviceIsClosed(self):
+        self.device = self.create_device(save={'ack_interval': 60})
+        self.thread.start()
+        ok_(wait_until(lambda: self.device.tasks))
+
+        os.write(self.master, b"1.5\n")
+        ok_(wait_until(lambda: self.device._thread_save.acks.size() == 1))
+        eq_(self.db.sent, [])
+
+        self.device.active = False
+        self.thread.join(timeout=5)
+
+        eq_(len(self.db.sent), 1)
+
+    def test_stopDevice_when_stageFails(self):
+        self.device = self.create_device(db=BrokenDeviceDB())
+        self.thread.start()
+        self.thread.join(timeout=5)
+
+        ok_(not self.thread.is_alive())
+        eq_([str(ex) for ex in self.errors], ["broken"])
+
+    def test_retryConnection_when_brokerIsDown(self):
+        self.device = self.create_device(cls=OfflineBrokerDevice, broker_url="127.0.0.1", broker_port=free_port(),
+                                         reconnect_delay={"min_delay": 0.05, "max_delay": 0.1})
+        self.thread.start()
+        ok_(wait_until(lambda: self.device.tasks))
+        time.sleep(0.3)
+
+        ok_(self.thread.is_alive())
+        ok_(not any(task.done() for task in self.device.tasks))
+        eq_(self.errors, [])
+
+
+class TestAsyncioMqttLoop(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.client = MagicMock()
+        self.client.loop_misc.return_value = 0
+        self.mqtt_loop = AsyncioMqttLoop(self.loop, self.client)
+        self.sock, self.peer = socket.socketpair()
+
+    def tearDown(self):
+        if self.mqtt_loop.misc:
+            self.client.on_socket_close(self.client, None, self.sock)
+            self.run_once()
+        self.sock.close()
+        self.peer.close()
+        self.loop.close()
+
+    def run_once(self):
+        self.loop.run_until_complete(asyncio.sleep(0.05))
+
+    def test_readFromSocket_when_socketIsOpenedAndReceivesData(self):
+        self.client.on_socket_open(self.client, None, self.sock)
+        self.peer.send(b"x")
+        self.run_once()
+
+        ok_(self.client.loop_read.called)
+        ok_(self.client.loop_misc.called)
+
+    def test_writeToSocket_when_clientRegistersWrite(self):
+        self.client.on_socket_open(self.client, None, self.sock)
+        self.client.on_socket_register_write(self.client, None, self.sock)
+        self.run_once()
+        ok_(self.client.loop_write.called)
+
+        self.client.on_socket_unregister_write(self.client, None, self.sock)
+        self.client.loop_write.reset_mock()
+        self.run_once()
+        ok_(not self.client.loop_write.called)
+
+    def test_stopReadingAndMisc_when_socketIsClosed(self):
+        self.client.on_socket_open(self.client, None, self.sock)
+        self.run_once()
+        self.client.on_socket_close(self.client, None, self.sock)
+        self.run_once()
+
+        self.client.loop_read.reset_mock()
+        self.peer.send(b"x")
+        self.run_once()
+
+        ok_(not self.client.loop_read.called)
+        ok_(self.mqtt_loop.misc is None)
+
+
+if __name__ == '__main__':
+    unittest.main()
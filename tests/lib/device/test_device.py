@@ -1,10 +1,13 @@
 import unittest
 from unittest.mock import patch
 
+from nose.tools import ok_
 from serial import SerialException
 
 from buoy.base.device.device import Device
 from buoy.base.device.exceptions import DeviceNoDetectedException
+from buoy.base.device.threads.mqtt import MqttThread
+from buoy.base.device.threads.resender import DBToSendThread
 
 
 class TestDevice(unittest.TestCase):
@@ -43,6 +46,14 @@ class TestDevice(unittest.TestCase):
 
         self.assertRaises(DeviceNoDetectedException, device._listener_exceptions)
 
+    def test_createResendAndSendThreads_when_bothAreConfigured(self):
+        device = Device(device_name="test", db=None, cls_maintenance=None, mqtt={})
+
+        device._create_threads()
+
+        ok_(isinstance(device._thread_reader_from_db, DBToSendThread))
+        ok_(isinstance(device._thread_send, MqttThread))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,198 @@
+import os
+import time
+import unittest
+from queue import Queue
+from threading import Thread
+from unittest.mock import MagicMock, patch
+
+from nose.tools import eq_, ok_
+
+from buoy.base.data.item import Status
+from buoy.base.database import ConnectionPool
+from buoy.base.device.device import Device
+from buoy.base.device.exceptions import LostConnectionException
+from buoy.base.device.group import DeviceGroup
+from buoy.base.device.threads.mqtt import MqttConnection, MqttThread
+from buoy.base.device.threads.reader import DeviceReader
+from buoy.tests.item import get_item
+
+
+class LineReader(DeviceReader):
+    def parser(self, data):
+        return data
+
+
+def get_device(name, port, **kwargs):
+    return Device(device_name=name, db=kwargs.pop('db', None), serial={'port': port, 'timeout': 0},
+                  cls_reader=LineReader, cls_save=None, cls_send=None, cls_reader_from_db=None, cls_maintenance=None,
+                  **kwargs)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestDeviceGroup(unittest.TestCase):
+    def setUp(self):
+        self.ptys = [os.openpty() for _ in range(0, 2)]
+        self.devices = [get_device("dev%i" % (idx,), os.ttyname(slave)) for idx, (_, slave) in enumerate(self.ptys)]
+        self.group = DeviceGroup(self.devices, read_timeout=0.1)
+        self.group.start()
+
+    def tearDown(self):
+        self.group.stop()
+        for master, slave in self.ptys:
+            for fd in [master, slave]:
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def get_lines(self, device, num):
+        queue = device.queues['save_data']
+        return [queue.get(timeout=2).data for _ in range(0, num)]
+
+    def test_readAllPortsInOneThread_when_devicesWriteLines(self):
+        os.write(self.ptys[0][0], b"uno\ndos\n")
+        os.write(self.ptys[1][0], b"tres\n")
+
+        eq_(self.get_lines(self.devices[0], 2), ["uno", "dos"])
+        eq_(self.get_lines(self.devices[1], 1), ["tres"])
+        eq_(self.group.reader.size(), 2)
+        ok_(not any(hasattr(device, '_thread_reader') for device in self.devices))
+
+    def test_notifyOnlyFailedDevice_when_portIsClosed(self):
+        os.close(self.ptys[0][0])
+
+        ok_(wait_until(lambda: self.group.reader.size() == 1))
+        ok_(isinstance(self.devices[0].queues['notice'].get(timeout=1), LostConnectionException))
+        eq_(self.devices[1].queues['notice'].qsize(), 0)
+
+        os.write(self.ptys[1][0], b"tres\n")
+        eq_(self.get_lines(self.devices[1], 1), ["tres"])
+
+    def test_stopOnlyFailedDevice_when_groupIsRunning(self):
+        thread = Thread(target=self.group._listener_exceptions)
+        thread.start()
+
+        os.close(self.ptys[0][0])
+
+        ok_(wait_until(lambda: self.devices[0] not in self.group.running))
+        ok_(not self.devices[0]._dev_connection.is_open)
+        ok_(thread.is_alive())
+        os.write(self.ptys[1][0], b"tres\n")
+        eq_(self.get_lines(self.devices[1], 1), ["tres"])
+
+        self.group.active = False
+        thread.join(timeout=5)
+        ok_(not thread.is_alive())
+
+    def test_stopDeviceOnce_when_groupStopsAfterDeviceFailed(self):
+        self.group.stop_device(self.devices[0])
+
+        with patch.object(self.devices[0], '_stop_threads') as mock_stop_threads:
+            self.group.stop()
+
+        eq_(mock_stop_threads.call_count, 0)
+        eq_(self.group.running, [])
+
+    def test_sharePoolAndMqttConnection_when_groupStarts(self):
+        ptys = [os.openpty() for _ in range(0, 2)]
+        pools = [MagicMock() for _ in ptys]
+        mqtt_conf = {'broker_url': 'localhost'}
+        devices = [get_device("db%i" % (idx,), os.ttyname(slave), db=MagicMock(pool=pools[idx]), mqtt=mqtt_conf)
+                   for idx, (_, slave) in enumerate(ptys)]
+        group = DeviceGroup(devices, db={'db_config': {}}, mqtt_connection=MagicMock(), read_timeout=0.1)
+
+        group.start()
+        group.stop()
+        for fd in [fd for pty in ptys for fd in pty]:
+            os.close(fd)
+
+        ok_(isinstance(group.pool, ConnectionPool))
+        ok_(all(device.db.pool is group.pool for device in devices))
+        ok_(all(pool.closeall.called for pool in pools))
+        ok_(all(device.mqtt_conf['connection'] is group.mqtt_connection for device in devices))
+        eq_(mqtt_conf, {'broker_url': 'localhost'})
+
+    def test_stopGroup_when_runEnds(self):
+        group = DeviceGroup([], read_timeout=0.1)
+
+        group.run()
+
+        ok_(not group.is_active())
+        ok_(not group.reader.is_alive())
+
+
+class TestMqttConnection(unittest.TestCase):
+    def setUp(self):
+        self.connection = MqttConnection()
+        self.senders = [MqttThread(queue_send_data=Queue(), queue_data_sent=Queue(), queue_notice=Queue(),
+                                   connection=self.connection, max_inflight=10) for _ in range(0, 2)]
+
+    @patch.object(MqttConnection, 'connect')
+    def register_all(self, mock_connect):
+        for sender in self.senders:
+            sender.connect_to_mqtt()
+        return mock_connect
+
+    def test_connectOnce_when_severalSendersAreRegistered(self):
+        mock_connect = self.register_all()
+
+        eq_(mock_connect.call_count, 1)
+        eq_(self.senders[0].client, self.senders[1].client)
+        eq_(self.connection.client._max_inflight_messages, 20)
+
+    def test_connectSenders_when_connectionIsEstablished(self):
+        self.register_all()
+        self.connection.on_connect(self.connection.client, None, {"session present": 0}, 0)
+
+        ok_(all(sender.is_connected_to_mqtt() for sender in self.senders))
+
+    def test_connectSender_when_registeredAfterConnection(self):
+        self.register_all()
+        self.connection.on_connect(self.connection.client, None, {"session present": 0}, 0)
+        sender = MqttThread(queue_send_data=Queue(), queue_data_sent=Queue(), queue_notice=Queue(),
+                            connection=self.connection)
+
+        sender.connect_to_mqtt()
+
+        ok_(sender.is_connected_to_mqtt())
+
+    def test_deliverAckToOwnerSender_when_messageIsPublished(self):
+        self.register_all()
+        item = get_item()
+        mid = self.connection.mids.allocate()
+        self.senders[1].limbo.add(mid, item)
+
+        self.connection.on_publish(self.connection.client, None, mid)
+
+        eq_(self.senders[0].queue_data_sent.qsize(), 0)
+        eq_(self.senders[1].queue_data_sent.get_nowait().status, Status.SENT)
+        eq_(self.connection.mids.size(), 0)
+
+    def test_releaseMid_when_noSenderOwnsMessage(self):
+        self.register_all()
+        mid = self.connection.mids.allocate()
+
+        self.connection.on_publish(self.connection.client, None, mid)
+
+        eq_(self.connection.mids.size(), 0)
+
+    @patch.object(MqttConnection, 'connect')
+    def test_disconnect_when_lastSenderIsStopped(self, mock_connect):
+        for sender in self.senders:
+            sender.connect_to_mqtt()
+
+        with patch.object(self.connection.client, 'disconnect') as mock_disconnect:
+            self.senders[0].stop()
+            eq_(mock_disconnect.call_count, 0)
+            self.senders[1].stop()
+            eq_(mock_disconnect.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import time
+import unittest
+from queue import Queue, Empty
+
+from nose.tools import eq_, ok_
+from serial import Serial
+
+from buoy.base.device.threads.reader import DeviceReader
+
+
+class CountingReader(DeviceReader):
+    def __init__(self, **kwargs):
+        super(CountingReader, self).__init__(**kwargs)
+        self.activities = 0
+
+    def activity(self):
+        self.activities += 1
+        super(CountingReader, self).activity()
+
+    def parser(self, data):
+        return data
+
+
+class TestDeviceReaderSelect(unittest.TestCase):
+    def setUp(self):
+        self.master, self.slave = os.openpty()
+        self.serial = Serial(port=os.ttyname(self.slave), timeout=0)
+        self.queue_save_data = Queue()
+        self.thread = None
+
+    def tearDown(self):
+        if self.thread:
+            self.thread.stop()
+            self.thread.join(timeout=5)
+        self.serial.close()
+        os.close(self.master)
+        os.close(self.slave)
+
+    def start(self, **kwargs):
+        self.thread = CountingReader(device=self.serial, queue_save_data=self.queue_save_data,
+                                     queue_notice=Queue(), **kwargs)
+        self.thread.active = True
+        self.thread.start()
+
+    def test_readLineAtOnce_when_dataArrivesInSelectMode(self):
+        self.start(read_mode="select", read_timeout=1)
+        time.sleep(0.1)
+
+        start = time.monotonic()
+        os.write(self.master, b"hola\n")
+        item = self.queue_save_data.get(timeout=2)
+
+        eq_(item.data, "hola")
+        ok_(time.monotonic() - start < 1)
+
+    def test_wakeUpOnlyOnTimeout_when_lineIsIdleInSelectMode(self):
+        self.start(read_mode="select", read_timeout=0.5)
+
+        time.sleep(1.2)
+
+        ok_(self.thread.activities <= 4)
+        self.assertRaises(Empty, self.queue_save_data.get_nowait)
+
+    def test_stopThread_when_deviceIsClosedInSelectMode(self):
+        self.start(read_mode="select", read_timeout=1)
+        time.sleep(0.1)
+
+        os.close(self.master)
+        self.master = os.open(os.devnull, os.O_RDONLY)
+        self.thread.join(timeout=2)
+
+        ok_(not self.thread.is_alive())
+        eq_(self.thread.queue_notice.qsize(), 1)
+
+    def test_wakeUpEveryTimeoutWait_when_lineIsIdleInPollMode(self):
+        self.start(timeout_wait=0.05)
+
+        time.sleep(0.5)
+
+        ok_(self.thread.activities >= 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
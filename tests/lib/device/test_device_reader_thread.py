@@ -1,3 +1,4 @@
+import asyncio
 import unittest
 from queue import Queue, Full
 from unittest.mock import MagicMock
@@ -38,15 +39,6 @@ class TestItemReaderThread(unittest.TestCase):
         self.thread = DeviceReaderMock(queue_save_data=self.queue_save_data, queue_send_data=self.queue_send_data,
                                        queue_notice=self.queue_notice, device=device)
 
-    def test_returnTwoItems_when_passStringWith3CarriageReturnAndWhiteSpace(self):
-        text = """hola
-            
-        adios"""
-
-        lines = self.thread.split_by_lines(text)
-
-        eq_(len(lines), 2)
-
     def test_bufferContainsJoinTwoText_when_callTwoRead_Data(self):
         text = [b"Hola", b" como esta"]
 
@@ -83,6 +75,19 @@ class TestItemReaderThread(unittest.TestCase):
 
         eq_(self.thread.is_buffer_empty(), True)
 
+    def test_processOnlyCompleteLines_when_activityReadsData(self):
+        self.thread.device.read = MagicMock(side_effect=[b"ho", b"la\nadi"])
+        self.thread.process_data = MagicMock(wraps=self.thread.process_data)
+
+        self.thread.activity()
+        eq_(self.thread.process_data.call_count, 0)
+
+        self.thread.activity()
+        eq_(self.thread.process_data.call_count, 1)
+        eq_(self.thread.queue_save_data.qsize(), 1)
+        eq_(self.thread.buffer, "adi")
+        eq_(self.thread.queue_notice.qsize(), 0)
+
     @patch.object(DeviceReader, 'read_data', side_effect=SerialException())
     @patch.object(DeviceReader, 'error')
     def test_shouldStopThread_when_raiseExceptionInReadDataMethod(self, mock_read, mock_error):
@@ -128,6 +133,16 @@ class TestItemReaderThread(unittest.TestCase):
         eq_(self.queue_save_data.qsize(), 0)
         eq_(self.queue_send_data.qsize(), 0)
 
+    def test_noRaiseException_when_asyncioQueuesAreFull(self):
+        self.thread.queue_save_data = MagicMock(full=MagicMock(return_value=False),
+                                                put_nowait=MagicMock(side_effect=asyncio.QueueFull()))
+        self.thread.queue_send_data = MagicMock(full=MagicMock(return_value=False),
+                                                put_nowait=MagicMock(side_effect=asyncio.QueueFull()))
+
+        self.thread.put_in_queues(BaseItem())
+
+        eq_(self.thread.queue_send_data.put_nowait.call_count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,9 +1,13 @@
+import asyncio
+import json
 from queue import Queue
 from unittest.mock import MagicMock
 
 from nose.tools import ok_
 
+from buoy.base.data.codec import decode
 from buoy.base.data.item import Status
+from buoy.base.data.nmea0183 import WIMDA
 from buoy.base.database import DeviceDB
 from buoy.base.device.threads.mqtt import MqttThread, MQTT_ERR_SUCCESS
 from buoy.tests.base_device_tests import *
@@ -98,15 +102,96 @@ class TestMqttThread(unittest.TestCase):
         ok_(self.thread.is_active() is True)
         eq_(self.thread.limbo.size(), 0)
 
+    def test_markInflightItemsFailed_when_disconnectMqtt(self):
+        self.fill_limbo(size=2)
+        client = FakeMQTT()
+
+        self.thread.on_disconnect(client, None, 1)
+
+        eq_(self.thread.queue_data_sent.qsize(), 2)
+        ok_(all(self.thread.queue_data_sent.get_nowait().status == Status.FAILED for _ in range(0, 2)))
+
+    def test_requeueInflightItems_when_disconnectMqttAndRequeueIsEnabled(self):
+        self.thread.requeue_on_disconnect = True
+        self.thread.limbo.add(1, get_item())
+        self.thread.limbo.add(2, get_items(2))
+
+        self.thread.on_disconnect(FakeMQTT(), None, 1)
+
+        eq_(self.thread.queue_send_data.qsize(), 3)
+        eq_(self.thread.queue_data_sent.qsize(), 0)
+
+    def test_markItemsFailed_when_requeueAndSendQueueIsFull(self):
+        self.thread.requeue_on_disconnect = True
+        self.thread.queue_send_data = Queue(maxsize=2)
+        self.thread.limbo.add(1, get_item())
+        self.thread.limbo.add(2, get_items(2))
+
+        self.thread.on_disconnect(FakeMQTT(), None, 1)
+
+        eq_(self.thread.queue_send_data.qsize(), 2)
+        eq_(self.thread.queue_data_sent.qsize(), 1)
+        eq_(self.thread.queue_data_sent.get_nowait().status, Status.FAILED)
+
+    def test_markItemsFailed_when_requeueAndAsyncioSendQueueIsFull(self):
+        self.thread.requeue_on_disconnect = True
+        self.thread.queue_send_data = asyncio.Queue(maxsize=2)
+        self.thread.limbo.add(1, get_item())
+        self.thread.limbo.add(2, get_items(2))
+
+        self.thread.on_disconnect(FakeMQTT(), None, 1)
+
+        eq_(self.thread.queue_send_data.qsize(), 2)
+        eq_(self.thread.queue_data_sent.qsize(), 1)
+        eq_(self.thread.queue_data_sent.get_nowait().status, Status.FAILED)
+        eq_(self.thread.limbo.size(), 0)
+
+    def test_keepInLimbo_when_disconnectAndPahoHoldsQos1Message(self):
+        self.thread.qos = 1
+        self.thread.requeue_on_disconnect = True
+        self.mock_publish(held=[1])
+        self.thread.limbo.add(1, get_item())
+        self.thread.limbo.add(2, get_item())
+
+        self.thread.on_disconnect(self.thread.client, None, 1)
+
+        ok_(self.thread.limbo.exists(1))
+        eq_(self.thread.limbo.size(), 1)
+        eq_(self.thread.queue_send_data.qsize(), 1)
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=True)
+    @patch.object(MqttThread, 'send')
+    def test_dontSendItems_when_limboIsFull(self, mock_send, mock_is_connected_to_mqtt):
+        self.thread.limbo.max_size = 2
+        self.fill_limbo(size=2)
+        self.thread.queue_send_data.put_nowait(get_item())
+
+        self.thread.activity()
+
+        eq_(mock_send.call_count, 0)
+        eq_(self.thread.queue_send_data.qsize(), 1)
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=False)
+    def test_markItemsFailed_when_limboItemsExpire(self, mock_is_connected_to_mqtt):
+        self.thread.limbo.timeout = 0
+        self.fill_limbo(size=2)
+
+        self.thread.activity()
+
+        eq_(self.thread.limbo.size(), 0)
+        eq_(self.thread.queue_data_sent.qsize(), 2)
+        ok_(all(self.thread.queue_data_sent.get_nowait().status == Status.FAILED for _ in range(0, 2)))
+
     def test_itemInsideLimbo_when_sendItem(self):
         item_expected = get_item()
-        mid = item_expected.uuid
         client = FakeMQTT()
-        client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS, mid=mid))
+        client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
         self.thread.client = client
 
         self.thread.send(item_expected)
 
+        mid = client.publish.call_args[1]["mid"]
+        ok_(isinstance(mid, int) and 0 < mid <= 65535)
         eq_(self.thread.limbo.size(), 1)
         eq_(self.thread.limbo.get(mid), item_expected)
 
@@ -123,6 +208,162 @@ class TestMqttThread(unittest.TestCase):
         eq_(item_expected, item.data)
         ok_(item.status == Status.FAILED)
         eq_(self.thread.limbo.size(), 0)
+        eq_(self.thread.mids.size(), 0)
+
+    def test_releaseMid_when_itemSuccessPublished(self):
+        client = FakeMQTT()
+        client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
+        self.thread.client = client
+        self.thread.send(get_item())
+        mid = client.publish.call_args[1]["mid"]
+
+        self.thread.on_publish(None, None, mid)
+
+        eq_(self.thread.mids.size(), 0)
+        eq_(self.thread.mids.allocate(), mid)
+
+    def mock_publish(self, held=()):
+        self.thread.client = FakeMQTT()
+        self.thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
+        self.thread.client._out_messages = {mid: None for mid in held}
+
+    def test_releaseMids_when_disconnectRepeatedly(self):
+        self.mock_publish()
+
+        for _ in range(0, 5):
+            for item in get_items(5):
+                self.thread.send(item)
+            eq_(self.thread.mids.size(), 5)
+            self.thread.on_disconnect(self.thread.client, None, 1)
+            eq_(self.thread.mids.size(), 0)
+
+        eq_(self.thread.limbo.size(), 0)
+        eq_(self.thread.queue_data_sent.qsize(), 25)
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=False)
+    def test_releaseMids_when_limboItemsExpire(self, mock_is_connected_to_mqtt):
+        self.mock_publish()
+        self.thread.limbo.timeout = 0
+        for item in get_items(5):
+            self.thread.send(item)
+
+        self.thread.activity()
+
+        eq_(self.thread.limbo.size(), 0)
+        eq_(self.thread.mids.size(), 0)
+
+    def test_keepMidUntilAck_when_pahoStillHoldsQos1Message(self):
+        self.thread.qos = 1
+        self.mock_publish(held=[1])
+        self.thread.send(get_item())
+        self.thread.send(get_item())
+
+        self.thread.on_disconnect(self.thread.client, None, 1)
+        eq_(self.thread.mids.size(), 1)
+
+        self.thread.on_publish(None, None, 1)
+        eq_(self.thread.mids.size(), 0)
+
+    def test_publishBinaryPayload_when_configurePayloadFormat(self):
+        thread = MqttThread(db=FakeDeviceDB(), queue_send_data=Queue(), queue_data_sent=Queue(),
+                            queue_notice=Queue(), payload_format="struct")
+        item = WIMDA(air_temp="12.3")
+        client = FakeMQTT()
+        client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS, mid=item.uuid))
+        thread.client = client
+
+        thread.send(item)
+
+        payload = client.publish.call_args[0][1]
+        eq_(payload[0], 0x03)
+        eq_(decode(payload, WIMDA)["air_temp"], 12.3)
+
+    def get_batch_thread(self, batch_size=3):
+        thread = MqttThread(db=FakeDeviceDB(), queue_send_data=Queue(), queue_data_sent=Queue(),
+                            queue_notice=Queue(), batch_size=batch_size, max_latency=10)
+        thread.client = FakeMQTT()
+        thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
+        return thread
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=True)
+    def test_publishOneMessagePerBatch_when_batchSizeIsGreaterThanOne(self, mock_is_connected_to_mqtt):
+        thread = self.get_batch_thread(batch_size=3)
+        items = get_items(5)
+        for item in items:
+            thread.queue_send_data.put_nowait(item)
+
+        thread.activity()
+        thread.activity()
+
+        eq_(thread.client.publish.call_count, 2)
+        eq_(len(json.loads(thread.client.publish.call_args_list[0][0][1])), 3)
+        eq_(len(json.loads(thread.client.publish.call_args_list[1][0][1])), 2)
+        eq_(thread.limbo.size(), 2)
+        eq_(thread.limbo.get(thread.client.publish.call_args_list[0][1]["mid"]), items[:3])
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=True)
+    def test_markAllItemsSent_when_batchIsPublished(self, mock_is_connected_to_mqtt):
+        thread = self.get_batch_thread(batch_size=3)
+        items = get_items(3)
+        for item in items:
+            thread.queue_send_data.put_nowait(item)
+        thread.activity()
+
+        thread.on_publish(None, None, thread.client.publish.call_args[1]["mid"])
+
+        eq_(thread.limbo.size(), 0)
+        sent = [thread.queue_data_sent.get_nowait() for _ in items]
+        eq_([item.data for item in sent], items)
+        ok_(all(item.status == Status.SENT for item in sent))
+
+    def test_markAllItemsFailed_when_failedSentBatch(self):
+        thread = self.get_batch_thread()
+        thread.client.publish = MagicMock(side_effect=ValueError('Error sent item'))
+        items = get_items(3)
+
+        thread.send_many(items)
+
+        eq_(thread.limbo.size(), 0)
+        eq_(thread.queue_data_sent.qsize(), 3)
+        ok_(all(thread.queue_data_sent.get_nowait().status == Status.FAILED for _ in items))
+
+    def test_publishCompressedPayload_when_configureCompression(self):
+        thread = MqttThread(db=FakeDeviceDB(), queue_send_data=Queue(), queue_data_sent=Queue(),
+                            queue_notice=Queue(), compression="zlib", compression_min_size=0)
+        thread.client = FakeMQTT()
+        thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
+        items = [WIMDA(air_temp="12.3", wind_dir_true="270") for _ in range(0, 5)]
+
+        thread.send_many(items)
+
+        payload = thread.client.publish.call_args[0][1]
+        eq_(payload[0], 0x10)
+        eq_(decode(payload, WIMDA), [json.loads(item.to_json()) for item in items])
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=True)
+    def test_sendAllQueuedItems_when_activityWakesUp(self, mock_is_connected_to_mqtt):
+        self.thread.client = FakeMQTT()
+        self.thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
+        for item in get_items(5):
+            self.thread.queue_send_data.put_nowait(item)
+
+        self.thread.activity()
+
+        eq_(self.thread.client.publish.call_count, 5)
+        eq_(self.thread.queue_send_data.qsize(), 0)
+
+    @patch.object(MqttThread, 'is_connected_to_mqtt', return_value=True)
+    def test_stopSendingItems_when_limboGetsFull(self, mock_is_connected_to_mqtt):
+        self.thread.client = FakeMQTT()
+        self.thread.client.publish = MagicMock(return_value=FakeReponseMQTT(rc=MQTT_ERR_SUCCESS))
+        self.thread.limbo.max_size = 3
+        for item in get_items(5):
+            self.thread.queue_send_data.put_nowait(item)
+
+        self.thread.activity()
+
+        eq_(self.thread.client.publish.call_count, 3)
+        eq_(self.thread.queue_send_data.qsize(), 2)
 
 
 if __name__ == '__main__':
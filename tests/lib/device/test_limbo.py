@@ -1,4 +1,6 @@
+import time
 import unittest
+from threading import Timer
 
 from nose.tools import eq_, ok_
 
@@ -39,3 +41,57 @@ class TestLimbo(unittest.TestCase):
         eq_(limbo.size(), 1)
         item = limbo.get(1)
         ok_(item is None)
+
+    def test_isFull_when_addedMaxSizeItems(self):
+        limbo = Limbo(max_size=2)
+
+        items = get_items(2)
+        limbo.add(0, items[0])
+        ok_(not limbo.is_full())
+        limbo.add(1, items[1])
+        ok_(limbo.is_full())
+
+    def test_returnExpiredItems_when_deadlineHasPassed(self):
+        limbo = Limbo(timeout=10)
+        items = get_items(3)
+        for idx, item in enumerate(items):
+            limbo.add(idx, item)
+        limbo.deadlines[2] += 100
+
+        expired = limbo.expire(now=time.monotonic() + 20)
+
+        eq_(expired, items[:2])
+        eq_(limbo.size(), 1)
+        ok_(limbo.exists(2))
+
+    def test_returnNothing_when_limboHasNotTimeout(self):
+        limbo = Limbo()
+        limbo.add(1, get_item())
+
+        eq_(limbo.expire(now=time.monotonic() + 3600), [])
+        eq_(limbo.size(), 1)
+
+    def test_returnAllItemsAndEmptyLimbo_when_popAll(self):
+        limbo = Limbo(timeout=10)
+        items = get_items(3)
+        for idx, item in enumerate(items):
+            limbo.add(idx, item)
+
+        eq_(limbo.pop_all(), items)
+        eq_(limbo.size(), 0)
+        eq_(limbo.expire(now=time.monotonic() + 20), [])
+
+    def test_returnWhenItemIsPopped_when_waitNotFull(self):
+        limbo = Limbo(max_size=1)
+        limbo.add(1, get_item())
+        Timer(0.05, limbo.pop, args=(1,)).start()
+
+        start = time.monotonic()
+        ok_(limbo.wait_not_full(5))
+        ok_(time.monotonic() - start < 5)
+
+    def test_returnFalse_when_waitNotFullTimesOut(self):
+        limbo = Limbo(max_size=1)
+        limbo.add(1, get_item())
+
+        ok_(not limbo.wait_not_full(0.01))
@@ -0,0 +1,78 @@
+import unittest
+
+from nose.tools import eq_, ok_
+
+from buoy.base.device.threads.reader import LineFramer
+
+
+class TestLineFramer(unittest.TestCase):
+    def setUp(self):
+        self.framer = LineFramer(splitter=b'\n', max_size=16)
+
+    def test_returnCompleteLines_when_dataHasSplitters(self):
+        self.framer.feed(b"hola\r\n  \nadios\nby")
+
+        eq_(self.framer.lines(), ["hola", "adios"])
+        eq_(str(self.framer), "by")
+
+    def test_joinLine_when_lineArrivesInSeveralReads(self):
+        for chunk in [b"ho", b"la", b"\nad"]:
+            self.framer.feed(chunk)
+
+        eq_(self.framer.lines(), ["hola"])
+        eq_(str(self.framer), "ad")
+
+    def test_decodeCharacter_when_multibyteCharacterIsSplitBetweenReads(self):
+        data = "año\n".encode()
+        self.framer.feed(data[:2])
+        ok_(not self.framer.has_line())
+        self.framer.feed(data[2:])
+
+        eq_(self.framer.lines(), ["año"])
+
+    def test_scanOnlyNewBytes_when_noSplitterArrives(self):
+        self.framer.feed(b"abc")
+        ok_(not self.framer.has_line())
+        self.framer.feed(b"de")
+        ok_(not self.framer.has_line())
+
+        eq_(self.framer.scanned, 5)
+
+    def test_findSplitter_when_multibyteSplitterIsSplitBetweenReads(self):
+        framer = LineFramer(splitter=b'\r\n')
+        framer.feed(b"hola\r")
+        ok_(not framer.has_line())
+        framer.feed(b"\nadios")
+
+        eq_(framer.lines(), ["hola"])
+
+    def test_discardFragment_when_exceedsMaxSizeWithoutSplitter(self):
+        self.framer.feed(b"x" * 20)
+
+        eq_(len(self.framer), 0)
+
+        self.framer.feed(b"hola\n")
+        eq_(self.framer.lines(), ["hola"])
+
+    def test_discardTail_when_exceedsMaxSizeAfterLastSplitter(self):
+        self.framer.feed(b"hola\n" + b"x" * 20)
+
+        eq_(self.framer.lines(), ["hola"])
+        eq_(len(self.framer), 0)
+
+    def test_returnEmptyList_when_thereAreOnlyEmptyLines(self):
+        self.framer.feed(b"  \n\n")
+
+        eq_(self.framer.lines(), [])
+
+    def test_removeLinesFromBuffer_when_linesAreRead(self):
+        self.framer.feed(b"uno\ndos\ntr")
+
+        eq_(self.framer.lines(), ["uno", "dos"])
+        ok_(not self.framer.has_line())
+        eq_(self.framer.lines(), None)
+        eq_(str(self.framer), "tr")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+from queue import Queue
+from unittest.mock import MagicMock
+
+from nose.tools import eq_
+from psycopg2 import DatabaseError
+
+from buoy.base.device.threads.maintenance import MaintenanceThread
+
+
+class TestMaintenanceThread(unittest.TestCase):
+
+    def test_createPartitionsAndApplyRetention_when_callActivity(self):
+        db = MagicMock()
+        thread = MaintenanceThread(db=db, queue_notice=Queue())
+
+        thread.activity()
+
+        eq_(db.create_partitions.call_count, 1)
+        eq_(db.apply_retention.call_count, 1)
+
+    def test_noStopThread_when_databaseRaiseException(self):
+        db = MagicMock()
+        db.create_partitions = MagicMock(side_effect=DatabaseError())
+        thread = MaintenanceThread(db=db, queue_notice=Queue())
+        thread.active = True
+
+        thread.activity()
+
+        eq_(thread.is_active(), True)
+        eq_(thread.queue_notice.qsize(), 0)
+
+    def test_stopWithoutWaitingTimeout_when_threadIsStopped(self):
+        thread = MaintenanceThread(db=MagicMock(), queue_notice=Queue(), timeout_wait=3600)
+        thread.start()
+
+        thread.stop()
+        thread.join(timeout=5)
+
+        eq_(thread.is_alive(), False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from nose.tools import eq_, ok_
+
+from buoy.base.device.threads.mqtt import MidAllocator, MqttClient, MQTT_ERR_NO_CONN
+
+
+class TestMidAllocator(unittest.TestCase):
+
+    def test_returnConsecutiveMids_when_allocate(self):
+        mids = MidAllocator()
+
+        eq_([mids.allocate() for _ in range(0, 3)], [1, 2, 3])
+        eq_(mids.size(), 3)
+
+    def test_reuseReleasedMid_when_allocateAfterRelease(self):
+        mids = MidAllocator()
+        for _ in range(0, 3):
+            mids.allocate()
+
+        mids.release(2)
+
+        eq_(mids.allocate(), 2)
+        eq_(mids.allocate(), 4)
+
+    def test_raiseError_when_allMidsAreInUse(self):
+        mids = MidAllocator()
+        allocated = set(mids.allocate() for _ in range(0, MidAllocator.MAX_MID))
+
+        eq_(len(allocated), MidAllocator.MAX_MID)
+        eq_(max(allocated), 65535)
+        with self.assertRaises(ValueError):
+            mids.allocate()
+
+    def test_ignoreMid_when_releaseMidNotInUse(self):
+        mids = MidAllocator()
+        mid = mids.allocate()
+
+        mids.release(mid)
+        mids.release(mid)
+
+        eq_(mids.allocate(), mid)
+        eq_(mids.allocate(), 2)
+
+
+class TestMqttClient(unittest.TestCase):
+
+    def test_publishWithReservedMid_when_passMid(self):
+        client = MqttClient()
+        mid = client.mids.allocate()
+
+        info = client.publish("buoy", b"data", qos=1, mid=mid)
+
+        eq_(info.mid, mid)
+        eq_(info.rc, MQTT_ERR_NO_CONN)
+        ok_(mid in client._out_messages)
+
+    def test_publishWithAllocatedMid_when_notPassMid(self):
+        client = MqttClient()
+        client.mids.allocate()
+
+        info = client.publish("buoy", b"data", qos=1)
+
+        eq_(info.mid, 2)
+        eq_(client.mids.size(), 2)
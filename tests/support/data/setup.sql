@@ -7,5 +7,6 @@ CREATE TABLE device (
     date TIMESTAMP WITH TIME ZONE NOT NULL,
     value double precision,
     sent BOOLEAN default false,
-    num_attempts SMALLINT default 0
+    num_attempts SMALLINT default 0,
+    leased_until TIMESTAMP WITH TIME ZONE
 );
\ No newline at end of file